@@ -1,43 +1,114 @@
-from flask import Flask, request, send_file, jsonify
-from flask_cors import CORS
-from redact import redact
-from img_redactv3 import (
-    get_sens,
-    get_sens_cust,
-    get_redacted_image,
-    get_redacted_image_cust,
-    process_annot,
-    perform_ocr,
+from flask import (
+    Flask,
+    Response,
+    abort,
+    g,
+    jsonify,
+    request,
+    send_file,
+    stream_with_context,
 )
-
-from img_redactv4 import (
-    get_sens as get_sens_v2,
-    get_sens_cust as get_sens_cust_v2,
-    get_redacted_image as get_redacted_image_v2,
-    get_redacted_image_cust as get_redacted_image_cust_v2,
-    process_annot as process_annot_v2,
-    sign_image,
-    # perform_ocr as perform_ocr_v2,
+from flask_cors import CORS
+from models import model_stats, preload
+from artifact_cache import artifact_cache
+from llm_cache import detection_cache
+from detector_backends import get_backend
+from jobs import JOB_HANDLERS, job_store, start_supervisor, stop_supervisor
+import metrics
+from workspace import (
+    WorkspaceNotFound,
+    atomic_path,
+    collect_garbage,
+    create_workspace,
+    open_workspace,
 )
-from img_redact import redactImg
-from redactv2 import (
-    get_sensitive,
-    redactv2,
-    annotate_pdf,
-    get_sensitive_custom,
-    custom_redactv2,
-    add_txn,
-    get_cat,
+from memio import (
+    UnsupportedImageFormat,
+    file_fits_in_memory,
+    image_extension,
+    read_upload,
+    send_bytes,
+    upload_name,
 )
-import os
-import shutil
+import json
+import time
+
+# The redaction modules, and the OCR, YOLO and LLM libraries behind them, are
+# imported by the routes that use them, so a process only loads the engines
+# of the routes it actually serves.
 
 app = Flask(__name__)
 CORS(app)
 
 
+def upload_workspace(doc, done=False):
+    """Save an upload into a fresh workspace held until the request ends."""
+    workspace = create_workspace(doc)
+    g.setdefault("workspaces", []).append((workspace, done))
+    return workspace
+
+
+def job_workspace(doc, done=False):
+    """Workspace of an earlier upload, from the ``doc`` token it returned."""
+    workspace = open_workspace(doc)
+    g.setdefault("workspaces", []).append((workspace, done))
+    return workspace
+
+
+@app.teardown_request
+def release_workspaces(exc):
+    for workspace, done in g.pop("workspaces", []):
+        workspace.release(done=done)
+
+
+@app.before_request
+def start_metrics():
+    rule = request.url_rule
+    g.metrics_route = rule.rule if rule is not None else "unmatched"
+    g.metrics_token = metrics.set_route(g.metrics_route)
+    g.metrics_started = time.perf_counter()
+    metrics.inc("veilx_bytes_total", request.content_length or 0, direction="in")
+
+
+@app.after_request
+def count_response_bytes(response):
+    metrics.inc("veilx_bytes_total", response.content_length or 0, direction="out")
+    return response
+
+
+@app.teardown_request
+def finish_metrics(exc):
+    if "metrics_token" not in g:
+        return
+    metrics.observe_request(g.metrics_route, time.perf_counter() - g.metrics_started)
+    metrics.reset_route(g.pop("metrics_token"))
+    metrics.flush()
+
+
+def save_profile_arg(source):
+    """Optional ``save_profile`` field of a form or JSON body."""
+    from redactv2 import SAVE_PROFILES
+
+    profile = source.get("save_profile")
+    if profile is not None and profile not in SAVE_PROFILES:
+        abort(400, description=f"Unknown save profile: {profile}")
+    return profile
+
+
+@app.errorhandler(WorkspaceNotFound)
+def workspace_not_found(e):
+    return jsonify({"error": f"Unknown document: {e}"}), 404
+
+
+@app.errorhandler(UnsupportedImageFormat)
+def unsupported_image_format(e):
+    return jsonify({"error": str(e)}), 400
+
+
 @app.route("/ocrtest", methods=["POST"])
 def ocrtest():
+    from img_redactv3 import perform_ocr
+
     if "file" not in request.files:
         return "No file part", 400
 
@@ -46,9 +117,8 @@ def ocrtest():
     if doc.filename == "":
         return "No selected file", 400
 
-    in_path = f"temp/{doc.filename}"
-
-    doc.save(in_path)
+    workspace = upload_workspace(doc, done=True)
+    in_path = workspace.input_path
 
     text = perform_ocr(in_path)
 
@@ -57,6 +127,8 @@ def ocrtest():
 
 @app.route("/signimg", methods=["POST"])
 def signimg():
+    from img_redactv4 import sign_image
+
     if "file" not in request.files:
         return "No file part", 400
 
@@ -66,15 +138,19 @@ def signimg():
     if doc.filename == "":
         return "No selected file", 400
 
-    in_path = f"temp/{doc.filename}"
-    out_path = f"temp/signed_{doc.filename}"
+    data = read_upload(doc)
+    if data is not None:
+        return send_bytes(sign_image(data, None, txn=txn), f"signed_{upload_name(doc)}")
 
-    doc.save(in_path)
+    workspace = upload_workspace(doc, done=True)
+    in_path = workspace.input_path
+    out_path = workspace.file("signed_")
 
-    sign_image(in_path, out_path, txn=txn)
+    with atomic_path(out_path) as tmp:
+        sign_image(in_path, tmp, txn=txn)
 
     resp = send_file(
-        out_path, as_attachment=True, download_name=f"signed_{doc.filename}"
+        out_path, as_attachment=True, download_name=f"signed_{workspace.filename}"
     )
 
     return resp
@@ -82,6 +158,8 @@ def signimg():
 
 @app.route("/addtxn", methods=["POST"])
 def addtxn():
+    from redactv2 import add_txn
+
     if "file" not in request.files:
         return "No file part", 400
 
@@ -91,16 +169,22 @@ def addtxn():
     if doc.filename == "":
         return "No selected file", 400
 
-    in_path = f"temp/{doc.filename}"
-    out_path = f"temp/hash_{doc.filename}"
+    try:
+        data = read_upload(doc)
+        if data is not None:
+            return send_bytes(add_txn(data, None, txn), f"hashed_{upload_name(doc)}")
 
-    doc.save(in_path)
+        workspace = upload_workspace(doc, done=True)
+        in_path = workspace.input_path
+        out_path = workspace.file("hash_")
 
-    try:
-        add_txn(in_path, out_path, txn)
+        with atomic_path(out_path) as tmp:
+            add_txn(in_path, tmp, txn)
 
         resp = send_file(
-            out_path, as_attachment=True, download_name=f"hashed_{doc.filename}"
+            out_path,
+            as_attachment=True,
+            download_name=f"hashed_{workspace.filename}",
         )
 
         return resp
@@ -113,12 +197,14 @@ def addtxn():
 
 @app.route("/clear", methods=["GET"])
 def clear():
-    clear_temp_folder()
-    return "Temp folder cleared"
+    removed = collect_garbage()
+    return f"Removed {removed} expired workspaces"
 
 
 @app.route("/getcat", methods=["POST"])
 def getcat():
+    from redactv2 import get_cat
+
     if "file" not in request.files:
         return "No file part", 400
 
@@ -127,12 +213,11 @@ def getcat():
     if doc.filename == "":
         return "No selected file", 400
 
-    in_path = f"temp/{doc.filename}"
-
-    doc.save(in_path)
-
     try:
-        category = get_cat(in_path)
+        data = read_upload(doc)
+        if data is None:
+            data = upload_workspace(doc, done=True).input_path
+        category = get_cat(data)
         return jsonify({"category": category})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -140,6 +225,8 @@ def getcat():
 
 @app.route("/redactv2", methods=["POST"])
 def rv2():
+    from redactv2 import redactv2
+
     data = request.json
     sensitive = data["sensitive"]
     doc = data["doc"]
@@ -147,24 +234,36 @@ def rv2():
     level = int(data["level"])
     mode = data["mode"]
 
-    in_path = f"temp/{doc}"
-    out_path = f"temp/redacted_{doc}"
+    workspace = job_workspace(doc, done=True)
+    in_path = workspace.input_path
+    out_path = workspace.file("redacted_")
     sens = []
     for sen in sensitive:
         tup = (sen["text"], sen["start"], sen["end"], sen["type"])
         sens.append(tup)
 
-    redactv2(in_path, sens, out_path, level, mode)
+    if file_fits_in_memory(in_path):
+        return send_bytes(
+            redactv2(in_path, sens, None, level, mode, save_profile_arg(data)),
+            f"redacted_{workspace.filename}",
+        )
 
-    resp = send_file(out_path, as_attachment=True, download_name=f"redacted_{doc}")
+    with atomic_path(out_path) as tmp:
+        redactv2(in_path, sens, tmp, level, mode, save_profile_arg(data))
 
-    clear_temp_folder()
+    resp = send_file(
+        out_path,
+        as_attachment=True,
+        download_name=f"redacted_{workspace.filename}",
+    )
 
     return resp
 
 
 @app.route("/customsens", methods=["POST"])
 def customsens():
+    from redactv2 import get_sensitive_custom
+
     if "file" not in request.files:
         return "No file part", 400
 
@@ -175,9 +274,8 @@ def customsens():
     if doc.filename == "":
         return "No selected file", 400
 
-    in_path = f"temp/{doc.filename}"
-
-    doc.save(in_path)
+    workspace = upload_workspace(doc)
+    in_path = workspace.input_path
 
     sensitive = get_sensitive_custom(in_path, prompt)
     resp = []
@@ -191,7 +289,7 @@ def customsens():
 
     return jsonify(
         {
-            "doc": doc.filename,
+            "doc": workspace.doc,
             "sensitive": resp,
         }
     )
@@ -199,6 +297,8 @@ def customsens():
 
 @app.route("/customrv2", methods=["POST"])
 def customrv2():
+    from redactv2 import custom_redactv2
+
     data = request.json
     sensitive = data["sensitive"]
     doc = data["doc"]
@@ -206,16 +306,42 @@ def customrv2():
     image = True if int(data["image"]) == 1 else False
     # image = False
 
-    in_path = f"temp/{doc}"
-    out_path = f"temp/redacted_{doc}"
+    workspace = job_workspace(doc)
+    in_path = workspace.input_path
+    out_path = workspace.file("redacted_")
     sens = []
     for sen in sensitive:
         tup = (sen["text"], sen["start"], sen["end"], sen["type"])
         sens.append(tup)
 
-    custom_redactv2(in_path, sens, out_path, image, mode="black")
+    if file_fits_in_memory(in_path):
+        return send_bytes(
+            custom_redactv2(
+                in_path,
+                sens,
+                None,
+                image,
+                mode="black",
+                save_profile=save_profile_arg(data),
+            ),
+            f"redacted_{workspace.filename}",
+        )
+
+    with atomic_path(out_path) as tmp:
+        custom_redactv2(
+            in_path,
+            sens,
+            tmp,
+            image,
+            mode="black",
+            save_profile=save_profile_arg(data),
+        )
 
-    resp = send_file(out_path, as_attachment=True, download_name=f"redacted_{doc}")
+    resp = send_file(
+        out_path,
+        as_attachment=True,
+        download_name=f"redacted_{workspace.filename}",
+    )
 
     # clear_temp_folder()
 
@@ -224,22 +350,30 @@ def customrv2():
 
 @app.route("/redactimgcust", methods=["POST"])
 def redactimgcust():
+    from img_redactv3 import get_redacted_image_cust
+
     data = request.json
     sensitive = data["sensitive"]
     doc = data["doc"]
 
     image = True if int(data["image"]) == 1 else False
 
-    in_path = f"temp/{doc}"
-    out_path = f"temp/redacted_{doc}"
+    workspace = job_workspace(doc)
+    in_path = workspace.input_path
+    out_path = workspace.file("redacted_")
     sens = []
     for sen in sensitive:
         tup = (sen["text"], sen["start"], sen["end"], sen["type"])
         sens.append(tup)
 
-    get_redacted_image_cust(in_path, sens, out_path, image)
+    with atomic_path(out_path) as tmp:
+        get_redacted_image_cust(in_path, sens, tmp, image)
 
-    resp = send_file(out_path, as_attachment=True, download_name=f"redacted_{doc}")
+    resp = send_file(
+        out_path,
+        as_attachment=True,
+        download_name=f"redacted_{workspace.filename}",
+    )
 
     # clear_temp_folder()
 
@@ -248,6 +382,8 @@ def redactimgcust():
 
 @app.route("/redactimgcustv2", methods=["POST"])
 def redactimgcustv2():
+    from img_redactv4 import get_redacted_image_cust as get_redacted_image_cust_v2
+
     data = request.json
     sensitive = data["sensitive"]
     doc = data["doc"]
@@ -256,22 +392,42 @@ def redactimgcustv2():
 
     image = True if int(data["image"]) == 1 else False
 
-    in_path = f"temp/{doc}"
-    out_path = f"temp/redacted_{doc}"
+    workspace = job_workspace(doc)
+    image_format = image_extension(workspace.filename)
+    in_path = workspace.input_path
+    out_path = workspace.file("redacted_")
     # sens = []
     # for sen in sensitive:
     #     tup = (sen["text"], sen["start"], sen["end"], sen["type"])
     #     sens.append(tup)
 
-    get_redacted_image_cust_v2(
-        image_path=in_path,
-        sensitive_data=sensitive,
-        output_path=out_path,
-        image=image,
-        ocr_data=ocr,
-    )
+    if file_fits_in_memory(in_path):
+        return send_bytes(
+            get_redacted_image_cust_v2(
+                image_path=in_path,
+                sensitive_data=sensitive,
+                output_path=None,
+                image=image,
+                ocr_data=ocr,
+                image_format=image_format,
+            ),
+            f"redacted_{workspace.filename}",
+        )
+
+    with atomic_path(out_path) as tmp:
+        get_redacted_image_cust_v2(
+            image_path=in_path,
+            sensitive_data=sensitive,
+            output_path=tmp,
+            image=image,
+            ocr_data=ocr,
+        )
 
-    resp = send_file(out_path, as_attachment=True, download_name=f"redacted_{doc}")
+    resp = send_file(
+        out_path,
+        as_attachment=True,
+        download_name=f"redacted_{workspace.filename}",
+    )
 
     # clear_temp_folder()
 
@@ -280,25 +436,33 @@ def redactimgcustv2():
 
 @app.route("/redactimgv3", methods=["POST"])
 def redactimgv3():
+    from img_redactv3 import get_redacted_image
+
     data = request.json
     sensitive = data["sensitive"]
     doc = data["doc"]
     level = int(data["level"])
     mode = data["mode"]
 
-    in_path = f"temp/{doc}"
-    out_path = f"temp/redacted_{doc}"
+    workspace = job_workspace(doc)
+    in_path = workspace.input_path
+    out_path = workspace.file("redacted_")
+
+    with atomic_path(out_path) as tmp:
+        get_redacted_image(
+            image_path=in_path,
+            sensitive_data=sensitive,
+            output_path=tmp,
+            redaction_level=level,
+            mode=mode,
+        )
 
-    get_redacted_image(
-        image_path=in_path,
-        sensitive_data=sensitive,
-        output_path=out_path,
-        redaction_level=level,
-        mode=mode,
+    resp = send_file(
+        out_path,
+        as_attachment=True,
+        download_name=f"redacted_{workspace.filename}",
     )
 
-    resp = send_file(out_path, as_attachment=True, download_name=f"redacted_{doc}")
-
     # clear_temp_folder()
 
     return resp
@@ -306,6 +470,8 @@ def redactimgv3():
 
 @app.route("/redactimgv4", methods=["POST"])
 def redactimgv4():
+    from img_redactv4 import get_redacted_image as get_redacted_image_v2
+
     data = request.json
     sensitive = data["sensitive"]
     doc = data["doc"]
@@ -314,19 +480,40 @@ def redactimgv4():
     ocr = data["ocr"]
     print(ocr)
 
-    in_path = f"temp/{doc}"
-    out_path = f"temp/redacted_{doc}"
+    workspace = job_workspace(doc)
+    image_format = image_extension(workspace.filename)
+    in_path = workspace.input_path
+    out_path = workspace.file("redacted_")
+
+    if file_fits_in_memory(in_path):
+        return send_bytes(
+            get_redacted_image_v2(
+                image_path=in_path,
+                sensitive_data=sensitive,
+                output_path=None,
+                redaction_level=level,
+                mode=mode,
+                ocr_data=ocr,
+                image_format=image_format,
+            ),
+            f"redacted_{workspace.filename}",
+        )
 
-    get_redacted_image_v2(
-        image_path=in_path,
-        sensitive_data=sensitive,
-        output_path=out_path,
-        redaction_level=level,
-        mode=mode,
-        ocr_data=ocr,
-    )
+    with atomic_path(out_path) as tmp:
+        get_redacted_image_v2(
+            image_path=in_path,
+            sensitive_data=sensitive,
+            output_path=tmp,
+            redaction_level=level,
+            mode=mode,
+            ocr_data=ocr,
+        )
 
-    resp = send_file(out_path, as_attachment=True, download_name=f"redacted_{doc}")
+    resp = send_file(
+        out_path,
+        as_attachment=True,
+        download_name=f"redacted_{workspace.filename}",
+    )
 
     # clear_temp_folder()
 
@@ -335,6 +522,8 @@ def redactimgv4():
 
 @app.route("/sensitive", methods=["POST"])
 def sens():
+    from redactv2 import get_sensitive, annotate_pdf
+
     if "file" not in request.files:
         return "No file part", 400
 
@@ -344,10 +533,9 @@ def sens():
     if doc.filename == "":
         return "No selected file", 400
 
-    in_path = f"temp/{doc.filename}"
-    annotated_path = f"temp/annotated_{doc.filename}"
-
-    doc.save(in_path)
+    workspace = upload_workspace(doc)
+    in_path = workspace.input_path
+    annotated_path = workspace.file("annotated_")
 
     sensitive = get_sensitive(in_path, level)
     resp = []
@@ -359,19 +547,22 @@ def sens():
         li["type"] = sens[3]
         resp.append(li)
 
-    annotate_pdf(in_path, sensitive, annotated_path)
+    with atomic_path(annotated_path) as tmp:
+        annotate_pdf(in_path, sensitive, tmp, save_profile_arg(request.form))
 
     return jsonify(
         {
-            "doc": doc.filename,
+            "doc": workspace.doc,
             "sensitive": resp,
-            "annotated_pdf": f"/download_annotated/{doc.filename}",
+            "annotated_pdf": f"/download_annotated/{workspace.doc}",
         }
     )
 
 
 @app.route("/imgsens", methods=["POST"])
 def imgsens():
+    from img_redactv3 import get_sens, process_annot
+
     if "file" not in request.files:
         return "No file part", 400
 
@@ -381,14 +572,14 @@ def imgsens():
     if doc.filename == "":
         return "No selected file", 400
 
-    in_path = f"temp/{doc.filename}"
-    annot_path = f"temp/annotated_{doc.filename}"
-
-    doc.save(in_path)
+    workspace = upload_workspace(doc)
+    in_path = workspace.input_path
+    annot_path = workspace.file("annotated_")
 
     sensitive = get_sens(in_path, level)
 
-    process_annot(in_path, sensitive, annot_path)
+    with atomic_path(annot_path) as tmp:
+        process_annot(in_path, sensitive, tmp)
 
     resp = []
     for sens in sensitive:
@@ -401,15 +592,17 @@ def imgsens():
 
     return jsonify(
         {
-            "doc": doc.filename,
+            "doc": workspace.doc,
             "sensitive": resp,
-            "annotated_img": f"/download_annotated/{doc.filename}",
+            "annotated_img": f"/download_annotated/{workspace.doc}",
         }
     )
 
 
 @app.route("/imgsensv2", methods=["POST"])
 def imgsensv2():
+    from img_redactv4 import get_sens as get_sens_v2, process_annot as process_annot_v2
+
     if "file" not in request.files:
         return "No file part", 400
 
@@ -419,15 +612,15 @@ def imgsensv2():
     if doc.filename == "":
         return "No selected file", 400
 
-    in_path = f"temp/{doc.filename}"
-    annot_path = f"temp/annotated_{doc.filename}"
-
-    doc.save(in_path)
+    workspace = upload_workspace(doc)
+    in_path = workspace.input_path
+    annot_path = workspace.file("annotated_")
 
     sensitive, ocr = get_sens_v2(in_path, level)
     print(ocr)
 
-    process_annot_v2(in_path, sensitive, annot_path)
+    with atomic_path(annot_path) as tmp:
+        process_annot_v2(in_path, sensitive, tmp, ocr_data=ocr)
 
     resp = []
     for sens in sensitive:
@@ -440,16 +633,22 @@ def imgsensv2():
 
     return jsonify(
         {
-            "doc": doc.filename,
+            "doc": workspace.doc,
             "sensitive": resp,
             "ocr": ocr,
-            "annotated_img": f"/download_annotated/{doc.filename}",
+            "ocr_passes": ocr.get("passes") if ocr else 0,
+            "annotated_img": f"/download_annotated/{workspace.doc}",
         }
     )
 
 
 @app.route("/imgsenscustv2", methods=["POST"])
 def imgsenscustv2():
+    from img_redactv4 import (
+        get_sens_cust as get_sens_cust_v2,
+        process_annot as process_annot_v2,
+    )
+
     if "file" not in request.files:
         return "No file part", 400
 
@@ -460,10 +659,9 @@ def imgsenscustv2():
     if doc.filename == "":
         return "No selected file", 400
 
-    in_path = f"temp/{doc.filename}"
-    annotated_path = f"temp/annotated_{doc.filename}"
-
-    doc.save(in_path)
+    workspace = upload_workspace(doc)
+    in_path = workspace.input_path
+    annotated_path = workspace.file("annotated_")
 
     sensitive, ocr = get_sens_cust_v2(in_path, prompt)
     resp = []
@@ -475,20 +673,24 @@ def imgsenscustv2():
         li["type"] = sens[3]
         resp.append(li)
 
-    process_annot_v2(in_path, sensitive, annotated_path)
+    with atomic_path(annotated_path) as tmp:
+        process_annot_v2(in_path, sensitive, tmp, ocr_data=ocr)
 
     return jsonify(
         {
-            "doc": doc.filename,
+            "doc": workspace.doc,
             "sensitive": resp,
             "ocr": ocr,
-            "annotated_pdf": f"/download_annotated/{doc.filename}",
+            "ocr_passes": ocr.get("passes") if ocr else 0,
+            "annotated_pdf": f"/download_annotated/{workspace.doc}",
         }
     )
 
 
 @app.route("/imgsenscust", methods=["POST"])
 def imgsenscust():
+    from img_redactv3 import get_sens_cust, process_annot
+
     if "file" not in request.files:
         return "No file part", 400
 
@@ -499,10 +701,9 @@ def imgsenscust():
     if doc.filename == "":
         return "No selected file", 400
 
-    in_path = f"temp/{doc.filename}"
-    annotated_path = f"temp/annotated_{doc.filename}"
-
-    doc.save(in_path)
+    workspace = upload_workspace(doc)
+    in_path = workspace.input_path
+    annotated_path = workspace.file("annotated_")
 
     sensitive = get_sens_cust(in_path, prompt)
     resp = []
@@ -514,41 +715,33 @@ def imgsenscust():
         li["type"] = sens[3]
         resp.append(li)
 
-    process_annot(in_path, sensitive, annotated_path)
+    with atomic_path(annotated_path) as tmp:
+        process_annot(in_path, sensitive, tmp)
 
     return jsonify(
         {
-            "doc": doc.filename,
+            "doc": workspace.doc,
             "sensitive": resp,
-            "annotated_pdf": f"/download_annotated/{doc.filename}",
+            "annotated_pdf": f"/download_annotated/{workspace.doc}",
         }
     )
 
 
-@app.route("/download_annotated/<filename>", methods=["GET"])
-def download_annotated(filename):
-    annotated_path = f"temp/annotated_{filename}"
+@app.route("/download_annotated/<path:doc>", methods=["GET"])
+def download_annotated(doc):
+    workspace = job_workspace(doc)
+    annotated_path = workspace.file("annotated_")
     return send_file(
-        annotated_path, as_attachment=True, download_name=f"annotated_{filename}"
+        annotated_path,
+        as_attachment=True,
+        download_name=f"annotated_{workspace.filename}",
     )
 
 
-def clear_temp_folder():
-    """Remove all files in the temp directory."""
-    folder = "temp"
-    for filename in os.listdir(folder):
-        file_path = os.path.join(folder, filename)
-        try:
-            if os.path.isfile(file_path) or os.path.islink(file_path):
-                os.unlink(file_path)
-            elif os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-        except Exception as e:
-            print(f"Failed to delete {file_path}. Reason: {e}")
-
-
 @app.route("/redaction", methods=["POST"])
 def redaction():
+    from redact import redact
+
     if "file" not in request.files:
         return "No file part", 400
 
@@ -557,24 +750,28 @@ def redaction():
     if doc.filename == "":
         return "No selected file", 400
 
-    in_path = f"temp/{doc.filename}"
-    out_path = f"temp/redacted_{doc.filename}"
+    data = read_upload(doc)
+    if data is not None:
+        return send_bytes(redact(data, None), f"redacted_{upload_name(doc)}")
 
-    doc.save(in_path)
+    workspace = upload_workspace(doc, done=True)
+    in_path = workspace.input_path
+    out_path = workspace.file("redacted_")
 
-    redact(in_path, out_path)
+    with atomic_path(out_path) as tmp:
+        redact(in_path, tmp)
 
     resp = send_file(
-        out_path, as_attachment=True, download_name=f"redacted_{doc.filename}"
+        out_path, as_attachment=True, download_name=f"redacted_{workspace.filename}"
     )
 
-    clear_temp_folder()
-
     return resp
 
 
 @app.route("/redactimg", methods=["POST"])
 def redactimg():
+    from img_redact import redactImg
+
     if "file" not in request.files:
         return "No file part", 400
 
@@ -583,30 +780,213 @@ def redactimg():
     if doc.filename == "":
         return "No selected file", 400
 
-    in_path = f"temp/{doc.filename}"
-    out_path = f"temp/redacted_{doc.filename}"
+    image_format = image_extension(doc.filename)
+    data = read_upload(doc)
+    if data is not None:
+        redacted = redactImg(data, None, image_format)
+        if redacted is None:
+            return jsonify({"error": "Cannot read image"}), 400
+        return send_bytes(redacted, f"redacted_{upload_name(doc)}")
 
-    doc.save(in_path)
+    workspace = upload_workspace(doc, done=True)
+    in_path = workspace.input_path
+    out_path = workspace.file("redacted_")
 
-    redactImg(in_path, out_path)
+    with atomic_path(out_path) as tmp:
+        redactImg(in_path, tmp)
 
     resp = send_file(
-        out_path, as_attachment=True, download_name=f"redacted_{doc.filename}"
+        out_path, as_attachment=True, download_name=f"redacted_{workspace.filename}"
     )
 
-    clear_temp_folder()
-
     return resp
 
 
+@app.route("/models", methods=["GET"])
+def models_info():
+    return jsonify(model_stats())
+
+
+@app.route("/cachestats", methods=["GET"])
+def cachestats():
+    return jsonify(
+        {"artifacts": artifact_cache.stats(), "llm": detection_cache.stats()}
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    # Finished jobs are counted by veilx_jobs_total as the workers end them;
+    # their rows only stay in the table until JOB_RESULT_TTL.
+    stats = job_store.queue_stats()
+    gauges = [
+        ("veilx_jobs", {"status": status}, stats.get(status, 0))
+        for status in ("queued", "running")
+    ]
+    return Response(
+        metrics.render(gauges), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def ndjson_line(result):
+    line = (json.dumps(result) + "\n").encode()
+    # A streamed response has no content length for count_response_bytes.
+    metrics.inc("veilx_bytes_total", len(line), direction="out")
+    return line
+
+
+def ndjson_stream(results, errors=()):
+    def generate():
+        for result in errors:
+            yield ndjson_line(result)
+        for workspace, result, error in results:
+            if error:
+                result = {"doc": workspace.doc, "error": error}
+            yield ndjson_line(result)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/batch/sensitive", methods=["POST"])
+def batch_sensitive():
+    """Stream /sensitive or /imgsensv2 results for many uploads as NDJSON.
+
+    The LLM calls of different documents overlap, but OCR is not batched:
+    each image takes its turn on PaddleOCR under batch.inference_lock. A zip
+    archive or member that cannot be read gets its own error line first.
+    """
+    from batch import detect_document, run_batch, store_uploads
+
+    files = request.files.getlist("file") + request.files.getlist("files")
+    if not files:
+        return "No file part", 400
+    level = int(request.form["level"])
+    save_profile = save_profile_arg(request.form)
+
+    try:
+        workspaces, errors = store_uploads(files, upload_workspace)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not workspaces and not errors:
+        return "No selected file", 400
+
+    return ndjson_stream(
+        run_batch(
+            lambda workspace: detect_document(workspace, level, save_profile),
+            workspaces,
+        ),
+        errors,
+    )
+
+
+@app.route("/batch/redact", methods=["POST"])
+def batch_redact():
+    from batch import redact_batch
+
+    documents = request.json["documents"]
+    items = [(job_workspace(entry["doc"]), entry) for entry in documents]
+    return ndjson_stream(redact_batch(items))
+
+
+@app.route("/download_redacted/<path:doc>", methods=["GET"])
+def download_redacted(doc):
+    workspace = job_workspace(doc, done=True)
+    return send_file(
+        workspace.file("redacted_"),
+        as_attachment=True,
+        download_name=f"redacted_{workspace.filename}",
+    )
+
+
+@app.route("/jobs/<kind>", methods=["POST"])
+def submit_job(kind):
+    if kind not in JOB_HANDLERS:
+        return jsonify({"error": f"Unknown job kind: {kind}"}), 404
+
+    if kind in ("sensitive", "imgsensv2"):
+        if "file" not in request.files:
+            return "No file part", 400
+        doc = request.files["file"]
+        if doc.filename == "":
+            return "No selected file", 400
+        params = request.form.to_dict()
+        params["doc"] = upload_workspace(doc).doc
+    else:
+        params = dict(request.json)
+        job_workspace(params["doc"])
+
+    try:
+        priority = int(params.pop("priority", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "priority must be an integer"}), 400
+    save_profile_arg(params)
+    job_id = job_store.submit(kind, params, priority)
+    return (
+        jsonify(
+            {
+                "job": job_id,
+                "status_url": f"/jobs/{job_id}",
+                "result_url": f"/jobs/{job_id}/result",
+            }
+        ),
+        202,
+    )
+
+
+@app.route("/jobs", methods=["GET"])
+def jobs_info():
+    return jsonify(job_store.queue_stats())
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    job.pop("params")
+    job.pop("result")
+    job["result_url"] = f"/jobs/{job_id}/result"
+    return jsonify(job)
+
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job["status"] == "failed":
+        return jsonify({"error": job["error"]}), 500
+    if job["status"] != "done":
+        return jsonify({"status": job["status"], "stage": job["stage"]}), 202
+
+    result = job["result"]
+    if "file" not in result:
+        return jsonify(result)
+    workspace = job_workspace(result["doc"], done=True)
+    return send_file(
+        result["file"],
+        as_attachment=True,
+        download_name=f"redacted_{workspace.filename}",
+    )
+
+
 @app.route("/test", methods=["GET"])
 def test():
     return "Test successful"
 
 
-if not os.path.exists("temp"):
-    os.makedirs("temp")
-clear_temp_folder()
+# Not when a forkserver or spawn process (the job supervisor, the pool of
+# redact_pdf_parallel) imports this module as __mp_main__.
+if __name__ != "__mp_main__":
+    # Fail here on a bad DETECTOR_* setting, not on the first request.
+    get_backend()
+    collect_garbage()
+    preload()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0")
+    # serve.py starts the job workers itself.
+    supervisor = start_supervisor()
+    try:
+        app.run(host="0.0.0.0")
+    finally:
+        stop_supervisor(supervisor)
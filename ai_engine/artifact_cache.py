@@ -0,0 +1,223 @@
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+ARTIFACT_CACHE_MAX_BYTES = int(
+    os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(256 * 1024 * 1024))
+)
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "")
+ARTIFACT_CACHE_DISK_MAX_BYTES = int(
+    os.getenv("ARTIFACT_CACHE_DISK_MAX_BYTES", str(2 * 1024 * 1024 * 1024))
+)
+
+
+class ArtifactCache:
+    """Size-bounded LRU of pickled results with an optional on-disk tier."""
+
+    def __init__(self, max_bytes, disk_dir=None, disk_max_bytes=0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    def get(self, key):
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, pickle.loads(blob)
+
+        blob = self._read_disk(key)
+        with self._lock:
+            if blob is None:
+                self.misses += 1
+                return False, None
+            self.disk_hits += 1
+            self._store(key, blob)
+        return True, pickle.loads(blob)
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._store(key, blob)
+        self._write_disk(key, blob)
+
+    def _store(self, key, blob):
+        if len(blob) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = blob
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.pkl")
+
+    def _disk_files(self):
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            os.utime(path)
+            return blob
+        except OSError:
+            return None
+
+    def _write_disk(self, key, blob):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Failed to write artifact cache entry {key}: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += len(blob)
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        files = sorted(self._disk_files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 0.9
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_dir": self.disk_dir,
+                "disk_bytes": self._disk_bytes if self.disk_dir else 0,
+            }
+
+
+artifact_cache = ArtifactCache(
+    ARTIFACT_CACHE_MAX_BYTES, ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_DISK_MAX_BYTES
+)
+
+
+def image_digest(image):
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{image.shape}|{image.dtype}".encode())
+    h.update(image if image.flags["C_CONTIGUOUS"] else image.copy(order="C"))
+    return h.hexdigest()
+
+
+def _describe(value):
+    """A string that differs whenever ``value`` would change the result."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_describe(item) for item in value) + "]"
+    if isinstance(value, dict):
+        items = sorted((repr(key), _describe(item)) for key, item in value.items())
+        return "{" + ",".join(f"{key}:{item}" for key, item in items) + "}"
+    if hasattr(value, "shape") and hasattr(value, "dtype"):
+        return image_digest(value)
+    # Model objects are keyed by their weights rather than their identity.
+    if getattr(value, "ckpt_path", None):
+        return str(value.ckpt_path)
+    raise TypeError(f"Cannot key the artifact cache on a {type(value).__name__}")
+
+
+def artifact_key(engine, version, image, arguments):
+    """Cache key for an image and the other (name, value) arguments of a call."""
+    params = ",".join(f"{name}={_describe(value)}" for name, value in arguments)
+    return hashlib.sha256(
+        f"{engine}|{version}|{params}|{image_digest(image)}".encode()
+    ).hexdigest()
+
+
+def cached_artifact(engine, version, on_hit=None):
+    """Cache a function of an image by image hash, engine, version and arguments.
+
+    The first positional argument must be the image as a numpy array; the
+    others must be values _describe() can key on, or the call raises
+    TypeError. A cached result is passed through on_hit(value), if given,
+    before it is returned.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = list(bound.arguments.items())
+            key = artifact_key(engine, version, arguments[0][1], arguments[1:])
+
+            found, value = artifact_cache.get(key)
+            if found:
+                logging.debug(f"Artifact cache hit for {engine}")
+                return on_hit(value) if on_hit else value
+
+            value = func(*args, **kwargs)
+            if value is not None:
+                artifact_cache.put(key, value)
+            return value
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,247 @@
+"""Detection and redaction of many documents in one request.
+
+Uploads (a multipart list, zip archives, or both) are stored in their own
+workspaces up front and then processed by a small thread pool, so the LLM
+calls of different documents overlap while they share this process's warm
+models. Results are yielded in completion order for the routes to stream.
+Images that need the YOLO pass are collected and detected in batches.
+"""
+import contextvars
+import logging
+import os
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import cv2
+from werkzeug.datastructures import FileStorage
+
+from img_redactv4 import (
+    YOLO_BATCH_SIZE,
+    detect_images_batch,
+    draw_redaction_boxes,
+    find_sensitive_data as find_image_sensitive_data,
+    perform_ocr,
+    process_annot as process_annot_v2,
+    redact_text_and_marks,
+)
+from jobs import entity_dicts
+from models import get_model
+from redactv2 import annotate_pdf, get_sensitive, redactv2
+from workspace import atomic_path
+
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", "500"))
+BATCH_MAX_MEMBER_BYTES = int(
+    os.getenv("BATCH_MAX_MEMBER_BYTES", str(50 * 1024 * 1024))
+)
+
+# The PaddleOCR and YOLO predictors are not thread-safe, so documents take
+# turns on them while everything else, the LLM calls above all, overlaps.
+inference_lock = threading.Lock()
+
+# What zipfile raises for a truncated, corrupt, encrypted or unsupported member.
+UNREADABLE_MEMBER = (
+    zipfile.BadZipFile,
+    zlib.error,
+    EOFError,
+    NotImplementedError,
+    RuntimeError,
+)
+
+
+def is_pdf(filename):
+    return filename.lower().endswith(".pdf")
+
+
+def store_uploads(files, store):
+    """Store each document with store(upload), unpacking any zip archives.
+
+    Returns (workspaces, errors). A zip archive or member that cannot be
+    read becomes a {"file", "error"} entry in errors, so the rest of the
+    batch still runs; going over the batch limits raises ValueError.
+    """
+    workspaces, errors = [], []
+    for upload in files:
+        if not upload.filename:
+            continue
+        if not upload.filename.lower().endswith(".zip"):
+            check_batch_size(len(workspaces) + 1)
+            workspaces.append(store(upload))
+            continue
+
+        try:
+            archive = zipfile.ZipFile(upload.stream)
+        except zipfile.BadZipFile as e:
+            errors.append({"file": upload.filename, "error": str(e)})
+            continue
+        with archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith("."):
+                    continue
+                if info.file_size > BATCH_MAX_MEMBER_BYTES:
+                    raise ValueError(f"{info.filename} is too large")
+                check_batch_size(len(workspaces) + 1)
+                try:
+                    with archive.open(info) as member:
+                        upload_member = FileStorage(stream=member, filename=name)
+                        workspaces.append(store(upload_member))
+                except UNREADABLE_MEMBER as e:
+                    errors.append(
+                        {
+                            "file": f"{upload.filename}/{info.filename}",
+                            "error": str(e) or e.__class__.__name__,
+                        }
+                    )
+    return workspaces, errors
+
+
+def check_batch_size(count):
+    if count > BATCH_MAX_DOCUMENTS:
+        raise ValueError(f"More than {BATCH_MAX_DOCUMENTS} documents")
+
+
+def detect_document(workspace, level, save_profile=None):
+    """What /sensitive or /imgsensv2 would return for this upload."""
+    if is_pdf(workspace.filename):
+        sensitive = get_sensitive(workspace.input_path, level)
+        with atomic_path(workspace.file("annotated_")) as tmp:
+            annotate_pdf(workspace.input_path, sensitive, tmp, save_profile)
+        return {
+            "doc": workspace.doc,
+            "sensitive": entity_dicts(sensitive),
+            "annotated_pdf": f"/download_annotated/{workspace.doc}",
+        }
+
+    image = cv2.imread(workspace.input_path)
+    if image is None:
+        raise ValueError(f"Cannot read image {workspace.filename}")
+    with inference_lock:
+        ocr = perform_ocr(image)
+    if ocr is None:
+        raise RuntimeError(f"OCR failed for {workspace.filename}")
+    sensitive = find_image_sensitive_data(" ".join(ocr["text"]), level)
+    with atomic_path(workspace.file("annotated_")) as tmp:
+        process_annot_v2(workspace.input_path, sensitive, tmp, ocr_data=ocr)
+    return {
+        "doc": workspace.doc,
+        "sensitive": entity_dicts(sensitive),
+        "ocr": ocr,
+        "ocr_passes": ocr.get("passes"),
+        "annotated_img": f"/download_annotated/{workspace.doc}",
+    }
+
+
+def redacted_response(workspace):
+    return {"doc": workspace.doc, "redacted": f"/download_redacted/{workspace.doc}"}
+
+
+def write_redacted_image(workspace, image):
+    with atomic_path(workspace.file("redacted_")) as tmp:
+        cv2.imwrite(tmp, image)
+    return redacted_response(workspace)
+
+
+def prepare_entry(item):
+    """Redact one document as /redactv2 or /redactimgv4 would, except YOLO.
+
+    Returns (response, None) when the document is finished, or
+    (None, image) when the partly redacted image still needs the YOLO pass.
+    """
+    workspace, entry = item
+    level = int(entry["level"])
+    mode = entry["mode"]
+    if is_pdf(workspace.filename):
+        sens = [
+            (sen["text"], sen["start"], sen["end"], sen["type"])
+            for sen in entry["sensitive"]
+        ]
+        with atomic_path(workspace.file("redacted_")) as tmp:
+            redactv2(
+                workspace.input_path,
+                sens,
+                tmp,
+                level,
+                mode,
+                entry.get("save_profile"),
+            )
+        return redacted_response(workspace), None
+
+    image = cv2.imread(workspace.input_path)
+    if image is None:
+        raise ValueError(f"Cannot read image {workspace.filename}")
+    ocr = entry.get("ocr")
+    if ocr is None:
+        with inference_lock:
+            ocr = perform_ocr(image)
+    redacted = redact_text_and_marks(
+        image, ocr, entry["sensitive"], mode, marks=level > 1
+    )
+    if level > 1:
+        return None, redacted
+    return write_redacted_image(workspace, redacted), None
+
+
+def finish_images(pending, model="yolov8n.pt"):
+    """Run YOLO once over pending (workspace, entry, image) and write the results."""
+    try:
+        with inference_lock:
+            regions = detect_images_batch(
+                [image for _, _, image in pending], get_model(model)
+            )
+    except Exception as e:
+        logging.exception("Batched image detection failed")
+        for workspace, _, _ in pending:
+            yield workspace, None, str(e) or e.__class__.__name__
+        return
+
+    for (workspace, entry, image), boxes in zip(pending, regions):
+        try:
+            image = draw_redaction_boxes(image, boxes, entry["mode"])
+            yield workspace, write_redacted_image(workspace, image), None
+        except Exception as e:
+            logging.exception("Batch document failed")
+            yield workspace, None, str(e) or e.__class__.__name__
+
+
+def redact_batch(items, concurrency=BATCH_CONCURRENCY, batch_size=YOLO_BATCH_SIZE):
+    """Yield (workspace, response, error) for (workspace, entry) items.
+
+    PDFs and level-1 images stream out as soon as they are done; images that
+    need YOLO are held until batch_size of them are ready, or the rest of the
+    batch has finished.
+    """
+    pending = []
+    for (workspace, entry), result, error in run_batch(
+        prepare_entry, items, concurrency
+    ):
+        if error or result[0] is not None:
+            yield workspace, result and result[0], error
+            continue
+        pending.append((workspace, entry, result[1]))
+        if len(pending) >= batch_size:
+            yield from finish_images(pending)
+            pending = []
+    if pending:
+        yield from finish_images(pending)
+
+
+def run_batch(func, items, concurrency=BATCH_CONCURRENCY):
+    """Yield (item, result, error) for func(item), in completion order."""
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        # Each call runs in a copy of this context, so its metrics are
+        # attributed to the route that started the batch.
+        futures = {
+            pool.submit(contextvars.copy_context().run, func, item): item
+            for item in items
+        }
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                yield item, future.result(), None
+            except Exception as e:
+                logging.exception("Batch document failed")
+                yield item, None, str(e) or e.__class__.__name__
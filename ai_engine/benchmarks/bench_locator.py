@@ -0,0 +1,109 @@
+"""Compare the per-entity ``text.find`` loop with the Aho-Corasick locator.
+
+Run from ai_engine/:  python -m benchmarks.bench_locator
+"""
+import argparse
+import json
+import logging
+import random
+import string
+import time
+
+from entity_locator import EntityLocator, find_each, locate_entities
+
+
+def find_loop(text, entities):
+    sensitive_data = []
+    for entity in entities:
+        item_text = entity["text"]
+        start = 0
+        while True:
+            start = text.find(item_text, start)
+            if start == -1:
+                break
+            end = start + len(item_text)
+            sensitive_data.append((item_text, start, end, entity["type"]))
+            start = end
+    return sensitive_data
+
+
+def make_case(text_chars, entity_count, seed=0):
+    rng = random.Random(seed)
+    entities = []
+    for i in range(entity_count):
+        token = "".join(rng.choices(string.ascii_uppercase + string.digits, k=10))
+        entities.append({"text": f"{token}", "type": "Potential Identifier"})
+    words = []
+    size = 0
+    while size < text_chars:
+        if rng.random() < 0.02:
+            word = rng.choice(entities)["text"]
+        else:
+            word = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words), entities
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--text-chars", type=int, nargs="+", default=[100_000, 1_000_000]
+    )
+    parser.add_argument(
+        "--entities", type=int, nargs="+", default=[10, 100, 500, 2000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    rows = []
+    for text_chars in args.text_chars:
+        for entity_count in args.entities:
+            text, entities = make_case(text_chars, entity_count)
+            patterns = list(dict.fromkeys(entity["text"] for entity in entities))
+            find_time, expected = best_of(
+                lambda: find_each(text, patterns), args.repeat
+            )
+            automaton_time, actual = best_of(
+                lambda: EntityLocator(patterns).find_non_overlapping(text),
+                args.repeat,
+            )
+            assert actual == expected
+            locate_time, located = best_of(
+                lambda: locate_entities(text, entities), args.repeat
+            )
+            assert located == find_loop(text, entities)
+            rows.append(
+                {
+                    "text_chars": text_chars,
+                    "entities": entity_count,
+                    "matches": len(located),
+                    "find_loop_s": round(find_time, 4),
+                    "automaton_s": round(automaton_time, 4),
+                    "locate_entities_s": round(locate_time, 4),
+                }
+            )
+            print(
+                f"{text_chars:>9} chars {entity_count:>5} entities: "
+                f"find loop {find_time:8.4f}s  automaton {automaton_time:8.4f}s  "
+                f"locate_entities {locate_time:8.4f}s"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Latency and peak memory of the image redaction masks against image size.
+
+"full" is the previous implementation: a full-size mask per pass, a blur of
+the whole image and np.where to combine them. "roi" is redact_regions, which
+only touches the boxes. Each run makes the four passes get_redacted_image
+makes at level 3 (text, QR codes, signatures, YOLO images) over the same
+boxes, scaled with the image. Peak memory is what tracemalloc sees numpy
+and OpenCV allocate during the passes; "identical" checks that both give
+the same pixels (pixelate is new, so it has no "full" run).
+
+Run from ai_engine/:  python -m benchmarks.bench_masks --megapixels 1 6 12 24
+"""
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from img_redactv4 import BLUR_KERNEL, REDACTION_MODES, redact_regions
+
+
+def full_image_redaction(image, boxes, mode):
+    mask = np.zeros(image.shape[:2], dtype=np.uint8)
+    for x1, y1, x2, y2 in boxes:
+        cv2.rectangle(mask, (x1, y1), (x2, y2), 255, -1)
+    if mode == "black":
+        image[mask > 0] = [0, 0, 0]
+    elif mode == "white":
+        image[mask > 0] = [255, 255, 255]
+    else:
+        blurred = cv2.GaussianBlur(image, (BLUR_KERNEL, BLUR_KERNEL), 0)
+        image = np.where(mask[:, :, None] > 0, blurred, image)
+    return image
+
+
+def make_scan(megapixels, seed=0):
+    """A 4:3 scan with text lines, a photo, a signature and a QR code."""
+    rng = np.random.default_rng(seed)
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    image = rng.integers(200, 256, (height, width, 3), dtype=np.uint8)
+
+    def box(x, y, w, h):
+        x1, y1 = int(x * width), int(y * height)
+        return (x1, y1, x1 + int(w * width), y1 + int(h * height))
+
+    text = [box(0.3, 0.2 + i * 0.06, 0.4, 0.03) for i in range(10)]
+    passes = [
+        text,
+        [box(0.78, 0.65, 0.18, 0.24)],
+        [box(0.05, 0.75, 0.2, 0.08)],
+        [box(0.05, 0.2, 0.2, 0.4), box(0.6, 0.05, 0.1, 0.1)],
+    ]
+    return image, passes
+
+
+def run(image, passes, mode, method, repeat):
+    seconds = []
+    peak = 0
+    result = None
+    for _ in range(repeat):
+        copy = image.copy()
+        tracemalloc.start()
+        started = time.perf_counter()
+        for boxes in passes:
+            if method == "roi":
+                copy = redact_regions(copy, boxes, mode)
+            else:
+                copy = full_image_redaction(copy, boxes, mode)
+        seconds.append(time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        result = copy
+    return {
+        "ms": round(statistics.median(seconds) * 1000, 2),
+        "peak_mb": round(peak / (1024 * 1024), 1),
+    }, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[1, 6, 12, 24])
+    parser.add_argument("--modes", nargs="+", default=list(REDACTION_MODES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    runs = []
+    for megapixels in args.megapixels:
+        image, passes = make_scan(megapixels)
+        for mode in args.modes:
+            roi, roi_result = run(image, passes, mode, "roi", args.repeat)
+            entry = {
+                "megapixels": megapixels,
+                "shape": list(image.shape),
+                "mode": mode,
+                "roi": roi,
+            }
+            if mode != "pixelate":
+                full, full_result = run(image, passes, mode, "full", args.repeat)
+                entry["full"] = full
+                entry["speedup"] = round(full["ms"] / max(roi["ms"], 1e-3), 1)
+                entry["identical"] = bool(np.array_equal(full_result, roi_result))
+            runs.append(entry)
+            print(json.dumps(entry))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(runs, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Scaling of page-parallel redaction with the number of worker processes.
+
+Run from ai_engine/:  python -m benchmarks.bench_parallel_redact --pages 400
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import fitz
+
+from benchmarks.bench_pdf_matcher import make_document
+from redactv2 import redact_document, redact_pdf_parallel
+
+
+def run(input_pdf, output_pdf, sensitive_data, workers, level, mode):
+    started = time.perf_counter()
+    if workers == 1:
+        redact_document(
+            input_pdf, sensitive_data, output_pdf, level, mode, level > 1, workers=1
+        )
+    else:
+        redact_pdf_parallel(
+            input_pdf, sensitive_data, output_pdf, level, mode, level > 1, workers
+        )
+    elapsed = time.perf_counter() - started
+    with fitz.open(output_pdf) as doc:
+        pages = doc.page_count
+    return elapsed, pages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--entities", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--level", type=int, default=2)
+    parser.add_argument("--mode", default="black")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    doc, sensitive_data = make_document(args.pages, args.entities)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        input_pdf = os.path.join(tmp, "input.pdf")
+        doc.save(input_pdf)
+        doc.close()
+        baseline = None
+        for workers in args.workers:
+            output_pdf = os.path.join(tmp, f"output_{workers}.pdf")
+            elapsed, pages = run(
+                input_pdf, output_pdf, sensitive_data, workers, args.level, args.mode
+            )
+            baseline = baseline or elapsed
+            results.append(
+                {
+                    "workers": workers,
+                    "seconds": round(elapsed, 3),
+                    "pages_per_s": round(pages / elapsed, 1),
+                    "speedup": round(baseline / elapsed, 2),
+                    "output_pages": pages,
+                }
+            )
+
+    report = {
+        "pages": args.pages,
+        "entities": args.entities,
+        "cpus": os.cpu_count(),
+        "runs": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
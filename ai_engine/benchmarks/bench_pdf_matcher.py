@@ -0,0 +1,91 @@
+"""Compare per-entity ``page.search_for`` with the single-pass word index.
+
+Run from ai_engine/:  python -m benchmarks.bench_pdf_matcher --pages 100 --entities 500
+"""
+import argparse
+import json
+import random
+import string
+import time
+
+import fitz
+
+from pdf_matcher import EntityMatcher
+
+
+def make_document(pages, entity_count, seed=0):
+    rng = random.Random(seed)
+    entities = [
+        "".join(rng.choices(string.ascii_uppercase + string.digits, k=10))
+        for _ in range(entity_count)
+    ]
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        lines = []
+        for _ in range(45):
+            words = []
+            for _ in range(10):
+                if rng.random() < 0.05:
+                    words.append(rng.choice(entities))
+                else:
+                    words.append(
+                        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 8)))
+                    )
+            lines.append(" ".join(words))
+        page.insert_text((36, 40), "\n".join(lines), fontsize=9)
+    sensitive_data = [(text, 0, len(text), "Potential Identifier") for text in entities]
+    return doc, sensitive_data
+
+
+def search_for_baseline(doc, sensitive_data):
+    found = 0
+    for page in doc:
+        for data, start, end, data_type in sensitive_data:
+            found += len(page.search_for(data, quads=True))
+    return found
+
+
+def word_index_matcher(doc, sensitive_data):
+    found = 0
+    matcher = EntityMatcher(sensitive_data)
+    for page in doc:
+        for data, data_type, quads in matcher.page_matches(page):
+            found += len(quads)
+    return found
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--entities", type=int, default=500)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    doc, sensitive_data = make_document(args.pages, args.entities)
+    baseline_time, baseline_found = timed(search_for_baseline, doc, sensitive_data)
+    matcher_time, matcher_found = timed(word_index_matcher, doc, sensitive_data)
+
+    result = {
+        "pages": args.pages,
+        "entities": args.entities,
+        "search_for_s": round(baseline_time, 3),
+        "search_for_quads": baseline_found,
+        "word_index_s": round(matcher_time, 3),
+        "word_index_quads": matcher_found,
+        "speedup": round(baseline_time / max(matcher_time, 1e-9), 1),
+    }
+    print(json.dumps(result, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
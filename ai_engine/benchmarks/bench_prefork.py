@@ -0,0 +1,220 @@
+"""Memory and throughput of serve.py against independent app.py processes.
+
+"independent" starts --workers copies of the Flask server, one port each,
+every one loading its own models (the current way to use more cores).
+"prefork" starts serve.py with the same number of workers sharing the
+models loaded by the master. Both are warmed up and then sent --requests
+requests, round-robin over their ports, from --concurrency threads.
+Memory is summed over each server's process tree: RSS counts shared pages
+once per process, PSS splits them between the processes sharing them.
+
+Run from ai_engine/:  python -m benchmarks.bench_prefork --workers 4 --requests 200
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import requests
+
+from benchmarks.bench_yolo_batch import make_images
+
+INDEPENDENT = (
+    "import sys\n"
+    "from app import app\n"
+    "app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)\n"
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def process_tree(pid):
+    pids = [pid]
+    for child in children(pid):
+        pids.extend(process_tree(child))
+    return pids
+
+
+def tree_memory(pids):
+    """(RSS, PSS) in MB summed over pids, from /proc/<pid>/smaps_rollup."""
+    rss = pss = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key == "Rss":
+                        rss += int(value.split()[0])
+                    elif key == "Pss":
+                        pss += int(value.split()[0])
+        except OSError:
+            continue
+    return round(rss / 1024, 1), round(pss / 1024, 1)
+
+
+def start_independent(workers, env):
+    ports = [free_port() for _ in range(workers)]
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", INDEPENDENT, str(port)],
+            env=env,
+            start_new_session=True,
+        )
+        for port in ports
+    ]
+    return processes, ports
+
+
+def start_prefork(workers, env, models):
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "serve.py",
+            "--workers",
+            str(workers),
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--preload-models",
+            models,
+        ],
+        env=env,
+        start_new_session=True,
+    )
+    return [process], [port]
+
+
+def wait_ready(ports, timeout):
+    deadline = time.time() + timeout
+    for port in ports:
+        while True:
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/test", timeout=2).ok:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline:
+                raise TimeoutError(f"Server on port {port} did not start")
+            time.sleep(0.5)
+
+
+def load(ports, route, upload, form, count, concurrency):
+    def call(i):
+        port = ports[i % len(ports)]
+        started = time.perf_counter()
+        response = requests.post(
+            f"http://127.0.0.1:{port}{route}",
+            files={"file": upload},
+            data=form,
+            timeout=300,
+        )
+        return time.perf_counter() - started, response.ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(count)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(count / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "errors": sum(1 for _, ok in results if not ok),
+    }
+
+
+def run_setup(name, args, upload, form):
+    env = dict(
+        os.environ,
+        JOB_WORKERS=str(args.job_workers),
+        PRELOAD_MODELS=args.models,
+    )
+    if name == "prefork":
+        processes, ports = start_prefork(args.workers, env, args.models)
+    else:
+        processes, ports = start_independent(args.workers, env)
+    try:
+        wait_ready(ports, args.startup_timeout)
+        load(ports, args.route, upload, form, len(ports) * 2, args.concurrency)
+        pids = [pid for p in processes for pid in process_tree(p.pid)]
+        rss_idle, pss_idle = tree_memory(pids)
+        result = load(ports, args.route, upload, form, args.requests, args.concurrency)
+        pids = [pid for p in processes for pid in process_tree(p.pid)]
+        rss, pss = tree_memory(pids)
+    finally:
+        for process in processes:
+            os.killpg(process.pid, signal.SIGTERM)
+        for process in processes:
+            process.wait()
+    result.update(
+        {
+            "setup": name,
+            "processes": len(pids),
+            "idle_rss_mb": rss_idle,
+            "idle_pss_mb": pss_idle,
+            "rss_mb": rss,
+            "pss_mb": pss,
+        }
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--job-workers", type=int, default=0)
+    parser.add_argument("--models", default="yolov8n.pt,paddleocr")
+    parser.add_argument("--route", default="/signimg")
+    parser.add_argument(
+        "--form", nargs="*", default=["txn=bench"], help="key=value form fields"
+    )
+    parser.add_argument("--file", help="upload this file instead of a synthetic scan")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            upload = (os.path.basename(args.file), f.read())
+    else:
+        upload = ("bench.png", cv2.imencode(".png", make_images(1)[0])[1].tobytes())
+    form = dict(field.split("=", 1) for field in args.form)
+
+    runs = [run_setup(name, args, upload, form) for name in ("independent", "prefork")]
+    report = {
+        "workers": args.workers,
+        "models": args.models,
+        "route": args.route,
+        "requests": args.requests,
+        "runs": runs,
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Save time and output size of each PDF save profile.
+
+Every PDF of the corpus is highlighted (as /sensitive does) and redacted (as
+/redactv2 does), then saved to memory with each profile.
+
+Run from ai_engine/:  python -m benchmarks.bench_save_profiles --corpus ~/pdfs
+Without --corpus a synthetic document is used.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import fitz
+
+from benchmarks.bench_pdf_matcher import make_document
+from redactv2 import (
+    SAVE_PROFILES,
+    annotate_sensitive_data_in_pdf,
+    redact_pdf_pages,
+    save_options,
+)
+
+
+def load_corpus(corpus, pages, entities):
+    if not corpus:
+        doc, sensitive_data = make_document(pages, entities)
+        yield "synthetic", doc.tobytes(), sensitive_data
+        return
+    for path in sorted(glob.glob(os.path.join(corpus, "**", "*.pdf"), recursive=True)):
+        with fitz.open(path) as doc:
+            words = {word[4] for page in doc for word in page.get_text("words")}
+        # Redact every longer alphanumeric word, a stand-in for detector output.
+        sensitive_data = [
+            (word, 0, len(word), "Potential Identifier")
+            for word in sorted(words)
+            if len(word) >= 8 and any(ch.isdigit() for ch in word)
+        ]
+        with open(path, "rb") as f:
+            yield os.path.basename(path), f.read(), sensitive_data
+
+
+def annotate(doc, sensitive_data):
+    annotate_sensitive_data_in_pdf(doc, sensitive_data)
+
+
+def redact(doc, sensitive_data):
+    redact_pdf_pages(doc, sensitive_data, 2, "black", images=True)
+
+
+def timed_save(data, prepare, sensitive_data, options):
+    doc = fitz.open(stream=data, filetype="pdf")
+    prepare(doc, sensitive_data)
+    started = time.perf_counter()
+    output = doc.tobytes(**options)
+    elapsed = time.perf_counter() - started
+    doc.close()
+    return elapsed, len(output)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="directory of PDFs, searched recursively")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--entities", type=int, default=200)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    tasks = {"annotate": annotate, "redact": redact}
+    totals = {
+        (task, profile): {"seconds": 0.0, "bytes": 0}
+        for task in tasks
+        for profile in SAVE_PROFILES
+    }
+    input_bytes = 0
+    documents = 0
+    for name, data, sensitive_data in load_corpus(
+        args.corpus, args.pages, args.entities
+    ):
+        documents += 1
+        input_bytes += len(data)
+        for task, prepare in tasks.items():
+            for profile in SAVE_PROFILES:
+                options = save_options(profile)
+                if task == "redact":
+                    options["garbage"] = max(options["garbage"], 1)
+                elapsed, size = timed_save(data, prepare, sensitive_data, options)
+                totals[task, profile]["seconds"] += elapsed
+                totals[task, profile]["bytes"] += size
+
+    report = {
+        "documents": documents,
+        "input_bytes": input_bytes,
+        "runs": [
+            {
+                "task": task,
+                "profile": profile,
+                "save_seconds": round(total["seconds"], 3),
+                "output_bytes": total["bytes"],
+                "size_ratio": round(total["bytes"] / max(input_bytes, 1), 3),
+            }
+            for (task, profile), total in totals.items()
+        ],
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
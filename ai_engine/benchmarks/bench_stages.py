@@ -0,0 +1,289 @@
+"""Per-stage timings of the PDF and image pipelines, offline.
+
+Runs each stage on the synthetic corpus from benchmarks/corpus.py with the
+LLM providers pointed at benchmarks/stub_llm.py, so numbers do not depend
+on the network or on API quotas, and the LLM and artifact caches disabled
+so every repeat does the full work. Stages:
+
+  extract           extract_pages_from_pdf
+  detect_pdf        find_sensitive_data_chunked (with recall on the known PII)
+  search            EntityMatcher.page_matches over every page
+  apply_redactions  redact_pdf_pages
+  save_pdf          save_redacted_pdf to bytes
+  ocr               perform_ocr
+  detect_image      img_redactv4.find_sensitive_data
+  mask              redact_sensitive_data + draw_redaction_boxes
+  save_image        PNG encode
+
+The stub answers with pii_rules.scan_pii, the detector levels 1-2 run
+locally, so with the stub their recall scores the rules against
+themselves. It is reported as "stub_recall" then, and as "recall" only for
+real providers (--no-stub) or a replay of them.
+
+--record and --replay go through detector_backends.py: a run recorded
+against the real providers (--no-stub --record run.jsonl) can be replayed
+offline, with the original or a fixed latency.
+
+The report records the arguments, seed, library versions and git commit
+alongside the numbers, so two runs can be compared.
+
+Run from ai_engine/:  python -m benchmarks.bench_stages --pages 20 --json stages.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+from benchmarks import stub_llm
+
+PDF_STAGES = ("extract", "detect_pdf", "search", "apply_redactions", "save_pdf")
+IMAGE_STAGES = ("ocr", "detect_image", "mask", "save_image")
+
+
+def summarize(seconds):
+    ordered = sorted(seconds)
+    return {
+        "count": len(ordered),
+        "total_s": round(sum(ordered), 4),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 2),
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        # Nearest rank.
+        "p95_ms": round(ordered[math.ceil(0.95 * len(ordered)) - 1] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def timed(timings, stage, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    timings.setdefault(stage, []).append(time.perf_counter() - started)
+    return result
+
+
+def recall(expected, found):
+    found = {text for text, *_ in found}
+    wanted = {item["text"] for item in expected if item["text"]}
+    if not wanted:
+        return None
+    return len(wanted & found) / len(wanted)
+
+
+def run_pdf(args, stages, timings, recalls):
+    import fitz
+
+    from benchmarks.corpus import make_pdf
+    from pdf_matcher import EntityMatcher
+    from redactv2 import (
+        extract_pages_from_pdf,
+        find_sensitive_data_chunked,
+        redact_pdf_pages,
+        save_redacted_pdf,
+    )
+
+    for i in range(args.pdfs):
+        data, pii = make_pdf(args.pages, seed=args.seed + i)
+        for _ in range(args.repeat):
+            text, page_offsets, doc = timed(
+                timings, "extract", extract_pages_from_pdf, data
+            )
+            if "detect_pdf" in stages:
+                sensitive_data = timed(
+                    timings,
+                    "detect_pdf",
+                    find_sensitive_data_chunked,
+                    text,
+                    args.level,
+                    page_offsets,
+                )
+                recalls.setdefault("detect_pdf", []).append(recall(pii, sensitive_data))
+            else:
+                sensitive_data = [
+                    (item["text"], 0, len(item["text"]), item["type"]) for item in pii
+                ]
+
+            if "search" in stages:
+                matcher = EntityMatcher(sensitive_data)
+
+                def search():
+                    return sum(len(matcher.page_matches(page)) for page in doc)
+
+                timed(timings, "search", search)
+            if "apply_redactions" in stages or "save_pdf" in stages:
+                timed(
+                    timings,
+                    "apply_redactions",
+                    redact_pdf_pages,
+                    doc,
+                    sensitive_data,
+                    args.level,
+                    "black",
+                    args.level >= 2,
+                    page_offsets,
+                )
+            if "save_pdf" in stages:
+                timed(timings, "save_pdf", save_redacted_pdf, doc, None)
+            elif not doc.is_closed:
+                doc.close()
+    return fitz.VersionBind
+
+
+def run_images(args, stages, timings, recalls):
+    import cv2
+
+    from artifact_cache import artifact_cache
+    from benchmarks.corpus import make_id_card
+    from img_redactv4 import (
+        draw_redaction_boxes,
+        find_sensitive_data,
+        perform_ocr,
+        redact_sensitive_data,
+    )
+
+    for i in range(args.images):
+        card, pii = make_id_card(seed=args.seed + i)
+        boxes = [tuple(item["box"]) for item in pii if "box" in item]
+        for _ in range(args.repeat):
+            image = card.copy()
+            if "ocr" in stages:
+                artifact_cache.clear()
+                ocr_data = timed(timings, "ocr", perform_ocr, image)
+                text = " ".join(ocr_data["text"]) if ocr_data else ""
+            else:
+                ocr_data = None
+                text = "\n".join(item["text"] for item in pii if item["text"])
+
+            if "detect_image" in stages:
+                sensitive_data = timed(
+                    timings, "detect_image", find_sensitive_data, text, args.level
+                )
+                recalls.setdefault("detect_image", []).append(
+                    recall(pii, sensitive_data)
+                )
+            else:
+                sensitive_data = [
+                    {"type": item["type"], "text": item["text"]}
+                    for item in pii
+                    if item["text"]
+                ]
+            if sensitive_data and not isinstance(sensitive_data[0], dict):
+                sensitive_data = [
+                    {"type": data_type, "text": value}
+                    for value, _, _, data_type in sensitive_data
+                ]
+
+            if "mask" in stages:
+
+                def mask():
+                    masked = image
+                    if ocr_data:
+                        masked = redact_sensitive_data(
+                            masked, ocr_data, sensitive_data, args.mode
+                        )
+                    return draw_redaction_boxes(masked, boxes, args.mode)
+
+                image = timed(timings, "mask", mask)
+            if "save_image" in stages:
+                timed(timings, "save_image", cv2.imencode, ".png", image)
+    return cv2.__version__
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", default=",".join(PDF_STAGES + IMAGE_STAGES))
+    parser.add_argument("--pdfs", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--level", type=int, default=3)
+    parser.add_argument("--mode", default="black")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0, help="stub LLM ms")
+    parser.add_argument("--jitter", type=float, default=0, help="stub LLM ms")
+    parser.add_argument(
+        "--no-stub", action="store_true", help="use the providers configured in env"
+    )
+    parser.add_argument("--record", help="record the LLM responses to this file")
+    parser.add_argument("--replay", help="answer the LLM calls from this recording")
+    parser.add_argument(
+        "--replay-latency", default="", help='ms per replayed call, or "recorded"'
+    )
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(PDF_STAGES + IMAGE_STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    # The providers and caches read these at import, so they are set before
+    # any of the project's modules are imported.
+    server = None
+    if args.replay:
+        os.environ.update(
+            DETECTOR_BACKEND="replay",
+            DETECTOR_RECORDING_PATH=args.replay,
+            DETECTOR_REPLAY_LATENCY=args.replay_latency,
+        )
+    elif args.record:
+        os.environ.update(
+            DETECTOR_BACKEND="record", DETECTOR_RECORDING_PATH=args.record
+        )
+    if not args.no_stub and not args.replay:
+        server = stub_llm.serve(
+            latency_ms=args.latency, jitter_ms=args.jitter, seed=args.seed
+        )
+        os.environ.update(stub_llm.provider_env(server))
+    os.environ.update(LLM_CACHE_PATH="", LLM_CACHE_TTL="-1", ARTIFACT_CACHE_DIR="")
+    from detector_backends import get_backend
+
+    # A missing recording or bad --replay-latency stops the run here.
+    get_backend()
+
+    timings = {}
+    recalls = {}
+    versions = {"python": platform.python_version()}
+    if set(stages) & set(PDF_STAGES):
+        versions["pymupdf"] = run_pdf(args, stages, timings, recalls)
+    if set(stages) & set(IMAGE_STAGES):
+        versions["opencv"] = run_images(args, stages, timings, recalls)
+
+    results = {stage: summarize(timings[stage]) for stage in stages if stage in timings}
+    recall_key = "recall" if args.no_stub or args.replay else "stub_recall"
+    for stage, values in recalls.items():
+        values = [value for value in values if value is not None]
+        if values:
+            results[stage][recall_key] = round(statistics.mean(values), 4)
+
+    report = {
+        "config": vars(args),
+        "commit": git_commit(),
+        "platform": platform.platform(),
+        "versions": versions,
+        "llm_requests": stub_llm.request_counts(server) if server else None,
+        "stages": results,
+    }
+    if server:
+        server.shutdown()
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Cold-start import time and RSS of app.py, per route family.
+
+Every measurement runs in a fresh interpreter: it imports app (as a server
+process does), then the modules behind one family of routes (as the first
+request to one of them does). Models are not loaded.
+
+Run from ai_engine/:  python -m benchmarks.bench_startup --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROUTE_FAMILIES = {
+    "app": [],
+    # /sensitive, /redactv2, /customsens, /customrv2, /addtxn, /getcat
+    "pdf": ["redactv2"],
+    # /redaction
+    "pdf_v1": ["redact"],
+    # /imgsensv2, /imgsenscustv2, /redactimgv4, /redactimgcustv2, /signimg
+    "image": ["img_redactv4"],
+    # /imgsens, /imgsenscust, /redactimgv3, /redactimgcust, /ocrtest
+    "image_v3": ["img_redactv3"],
+    # /redactimg
+    "image_v1": ["img_redact"],
+    # /batch/sensitive, /batch/redact
+    "batch": ["batch"],
+}
+
+CHILD = """
+import importlib, json, sys, time
+started = time.perf_counter()
+import app
+app_seconds = time.perf_counter() - started
+from models import rss_bytes
+app_rss = rss_bytes()
+app_modules = len(sys.modules)
+started = time.perf_counter()
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+print(json.dumps({
+    "app_seconds": app_seconds,
+    "app_rss": app_rss,
+    "app_modules": app_modules,
+    "route_seconds": time.perf_counter() - started,
+    "rss": rss_bytes(),
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def median(runs, key):
+    return statistics.median(run[key] for run in runs)
+
+
+def measure(modules, workdir):
+    env = dict(
+        os.environ,
+        JOB_WORKERS="0",
+        PRELOAD_MODELS="",
+        WORKSPACE_ROOT=os.path.join(workdir, "temp"),
+        JOBS_DB_PATH=os.path.join(workdir, "jobs.sqlite3"),
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, *modules],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument(
+        "--families", nargs="+", default=list(ROUTE_FAMILIES), choices=ROUTE_FAMILIES
+    )
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for family in args.families:
+            runs = [measure(ROUTE_FAMILIES[family], workdir) for _ in range(args.runs)]
+            results.append(
+                {
+                    "family": family,
+                    "modules": ROUTE_FAMILIES[family],
+                    "app_import_s": round(median(runs, "app_seconds"), 3),
+                    "app_rss_mb": round(median(runs, "app_rss") / (1024 * 1024), 1),
+                    "app_loaded_modules": int(median(runs, "app_modules")),
+                    "first_request_import_s": round(median(runs, "route_seconds"), 3),
+                    "total_import_s": round(
+                        median(runs, "app_seconds") + median(runs, "route_seconds"), 3
+                    ),
+                    "rss_mb": round(median(runs, "rss") / (1024 * 1024), 1),
+                    "loaded_modules": int(median(runs, "modules")),
+                }
+            )
+
+    report = {"runs": args.runs, "python": sys.version.split()[0], "families": results}
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Check that streaming redaction stays within its memory budget.
+
+Builds a synthetic 2000-page document, redacts it in a fresh child process
+and fails (exit status 1) if the child's peak RSS grew by more than the
+budget over its RSS when the job started.
+
+Run from ai_engine/:  python -m benchmarks.bench_streaming_redact --budget-mb 256
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.bench_pdf_matcher import make_document
+
+
+def run_job(args):
+    from redactv2 import redact_pdf_streaming
+
+    with open(args.entities_file) as f:
+        sensitive_data = [tuple(item) for item in json.load(f)]
+    report = redact_pdf_streaming(
+        args.job,
+        sensitive_data,
+        args.output,
+        args.level,
+        "black",
+        args.level > 1,
+        memory_budget_mb=args.budget_mb,
+        window_pages=args.window_pages,
+    )
+    # ru_maxrss is in KiB on Linux and covers the whole child lifetime.
+    report["ru_maxrss_mb"] = round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+    )
+    print(json.dumps(report))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--entities", type=int, default=300)
+    parser.add_argument("--budget-mb", type=int, default=256)
+    parser.add_argument("--window-pages", type=int, default=50)
+    parser.add_argument("--level", type=int, default=2)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--job", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    parser.add_argument("--entities-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.job:
+        run_job(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_pdf = os.path.join(tmp, "input.pdf")
+        output_pdf = os.path.join(tmp, "output.pdf")
+        entities_file = os.path.join(tmp, "entities.json")
+        doc, sensitive_data = make_document(args.pages, args.entities)
+        doc.save(input_pdf, garbage=1, deflate=True)
+        doc.close()
+        with open(entities_file, "w") as f:
+            json.dump(sensitive_data, f)
+
+        child = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.bench_streaming_redact",
+                "--job",
+                input_pdf,
+                "--output",
+                output_pdf,
+                "--entities-file",
+                entities_file,
+                "--budget-mb",
+                str(args.budget_mb),
+                "--window-pages",
+                str(args.window_pages),
+                "--level",
+                str(args.level),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        report = json.loads(child.stdout.strip().splitlines()[-1])
+
+    growth = report["ru_maxrss_mb"] - report["baseline_rss_mb"]
+    report["ru_maxrss_growth_mb"] = round(growth, 1)
+    report["within_budget"] = growth <= args.budget_mb
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if not report["within_budget"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
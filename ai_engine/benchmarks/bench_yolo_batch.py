@@ -0,0 +1,70 @@
+"""YOLO throughput of detect_images_batch by batch size.
+
+Run from ai_engine/:  python -m benchmarks.bench_yolo_batch --images 32 --sizes 1 2 4 8 16
+"""
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from artifact_cache import artifact_cache
+from img_redactv4 import detect_images_batch
+from models import get_model
+
+
+def make_images(count, seed=0):
+    """ID-card sized scans with a few filled shapes standing in for photos."""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        height, width = rng.integers(600, 1000), rng.integers(900, 1400)
+        image = np.full((height, width, 3), 235, dtype=np.uint8)
+        for _ in range(4):
+            x, y = int(rng.integers(0, width - 200)), int(rng.integers(0, height - 200))
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            cv2.rectangle(image, (x, y), (x + 160, y + 190), color, -1)
+            cv2.circle(image, (x + 80, y + 70), 45, (200, 170, 150), -1)
+        images.append(image)
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    model = get_model(args.model)
+    images = make_images(args.images)
+    # Warm-up so the first batch size is not charged for lazy initialisation.
+    artifact_cache.clear()
+    detect_images_batch(images[:1], model, batch_size=1)
+
+    runs = []
+    for size in args.sizes:
+        artifact_cache.clear()
+        started = time.perf_counter()
+        regions = detect_images_batch(images, model, batch_size=size)
+        elapsed = time.perf_counter() - started
+        runs.append(
+            {
+                "batch_size": size,
+                "seconds": round(elapsed, 3),
+                "images_per_s": round(len(images) / elapsed, 2),
+                "regions": sum(len(r) for r in regions),
+            }
+        )
+
+    report = {"images": args.images, "model": args.model, "runs": runs}
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
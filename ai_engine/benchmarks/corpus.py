@@ -0,0 +1,190 @@
+"""Synthetic documents with known PII.
+
+make_pdf() builds a multi-page statement-like PDF and make_id_card() an
+ID-card-like scan. Both return the PII they contain as
+{"type", "text"} dicts (plus "page" for PDFs and "box" for the photo and
+QR code of a card), so detection can be scored against them. Everything is
+derived from the seed.
+
+Run from ai_engine/:  python -m benchmarks.corpus --out corpus --pdfs 20 --images 20
+"""
+import argparse
+import json
+import os
+import random
+import string
+
+import cv2
+import fitz
+import numpy as np
+
+from pii_rules import VEHICLE_STATE_CODES, luhn_valid, verhoeff_valid
+
+FIRST_NAMES = ["Aarav", "Priya", "Rohan", "Ananya", "Vikram", "Meera", "Arjun", "Kavya"]
+LAST_NAMES = ["Sharma", "Iyer", "Patel", "Reddy", "Nair", "Gupta", "Das", "Menon"]
+FILLER = (
+    "the account summary below lists every transaction posted during the period "
+    "and any charges applied to it please review the details carefully and "
+    "contact the branch within thirty days if anything looks incorrect"
+).split()
+
+
+def _with_check_digit(rng, prefix, length, valid):
+    while True:
+        body = prefix + "".join(rng.choices(string.digits, k=length - len(prefix) - 1))
+        for digit in string.digits:
+            if valid(body + digit):
+                return body + digit
+
+
+def make_identity(rng):
+    """One person's worth of valid-looking identifiers."""
+    aadhaar = _with_check_digit(rng, rng.choice("23456789"), 12, verhoeff_valid)
+    card = _with_check_digit(rng, "4", 16, luhn_valid)
+    letters = string.ascii_uppercase
+    return {
+        "Name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "Aadhaar Number": f"{aadhaar[:4]} {aadhaar[4:8]} {aadhaar[8:]}",
+        "PAN Number": "".join(rng.choices(letters, k=3))
+        + "P"
+        + rng.choice(letters)
+        + "".join(rng.choices(string.digits, k=4))
+        + rng.choice(letters),
+        "IFSC Code": "".join(rng.choices(letters, k=4))
+        + "0"
+        + "".join(rng.choices(string.digits, k=6)),
+        "Card Number": " ".join(card[i : i + 4] for i in range(0, 16, 4)),
+        "Phone Number": f"+91 {rng.choice('6789')}{rng.randint(1000, 9999)} "
+        f"{rng.randint(10000, 99999)}",
+        "Email Address": f"user{rng.randint(100, 999)}@example.in",
+        "Passport Number": rng.choice("JKLMNPRSTVWZ")
+        + str(rng.randint(1, 9))
+        + "".join(rng.choices(string.digits, k=5))
+        + str(rng.randint(1, 9)),
+        "Vehicle Registration Number": f"{rng.choice(sorted(VEHICLE_STATE_CODES))} "
+        f"{rng.randint(1, 99):02d} {''.join(rng.choices(letters, k=2))} "
+        f"{rng.randint(1000, 9999)}",
+    }
+
+
+LABELS = {
+    "Name": "Account holder",
+    "Aadhaar Number": "Aadhaar",
+    "PAN Number": "PAN",
+    "IFSC Code": "IFSC",
+    "Card Number": "Card no",
+    "Phone Number": "Mobile",
+    "Email Address": "Email",
+    "Passport Number": "Passport No",
+    "Vehicle Registration Number": "Vehicle",
+}
+
+
+def _filler_line(rng):
+    return " ".join(rng.choice(FILLER) for _ in range(rng.randint(8, 12)))
+
+
+def make_pdf(pages, seed=0, pii_per_page=4):
+    """Return (pdf bytes, pii) for a document of ``pages`` pages."""
+    rng = random.Random(seed)
+    identity = make_identity(rng)
+    doc = fitz.open()
+    pii = []
+    for page_num in range(pages):
+        page = doc.new_page()
+        lines = [_filler_line(rng) for _ in range(40)]
+        for data_type in rng.sample(sorted(identity), pii_per_page):
+            line = rng.randrange(len(lines))
+            lines[line] = f"{LABELS[data_type]}: {identity[data_type]}"
+            pii.append(
+                {"type": data_type, "text": identity[data_type], "page": page_num}
+            )
+        page.insert_text((36, 48), "\n".join(lines), fontsize=9)
+    data = doc.tobytes(garbage=1, deflate=True)
+    doc.close()
+    return data, pii
+
+
+def make_id_card(seed=0, width=1012, height=638):
+    """Return (BGR image, pii) for an ID-card-like scan."""
+    rng = random.Random(seed)
+    identity = make_identity(rng)
+    image = np.full((height, width, 3), 245, dtype=np.uint8)
+    cv2.rectangle(image, (0, 0), (width, 90), (40, 90, 170), -1)
+    cv2.putText(
+        image,
+        "GOVERNMENT OF INDIA",
+        (200, 60),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        1.4,
+        (255, 255, 255),
+        3,
+    )
+
+    photo = (40, 130, 220, 270)
+    x, y, w, h = photo
+    cv2.rectangle(image, (x, y), (x + w, y + h), (190, 170, 150), -1)
+    cv2.circle(image, (x + w // 2, y + 100), 60, (150, 120, 100), -1)
+    cv2.ellipse(image, (x + w // 2, y + h), (95, 90), 0, 180, 360, (120, 90, 80), -1)
+    pii = [{"type": "Photo", "text": "", "box": list(photo)}]
+
+    fields = ["Name", "Aadhaar Number", "PAN Number", "Phone Number"]
+    for i, data_type in enumerate(fields):
+        text = f"{LABELS[data_type]}: {identity[data_type]}"
+        cv2.putText(
+            image,
+            text,
+            (300, 170 + i * 70),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            1.0,
+            (20, 20, 20),
+            2,
+        )
+        pii.append({"type": data_type, "text": identity[data_type]})
+
+    # A signature-like scribble under the photo.
+    points = np.array(
+        [[x + 10 + i * 12, 440 + int(15 * np.sin(i * 0.9))] for i in range(17)],
+        dtype=np.int32,
+    )
+    cv2.polylines(image, [points], False, (60, 40, 30), 3)
+
+    encoder = getattr(cv2, "QRCodeEncoder", None)
+    if encoder is not None:
+        qr = encoder.create().encode(identity["Aadhaar Number"].replace(" ", ""))
+        qr = cv2.resize(qr, (180, 180), interpolation=cv2.INTER_NEAREST)
+        qx, qy = width - 220, height - 220
+        image[qy : qy + 180, qx : qx + 180] = cv2.cvtColor(qr, cv2.COLOR_GRAY2BGR)
+        pii.append({"type": "QR Code", "text": "", "box": [qx, qy, 180, 180]})
+    return image, pii
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--pdfs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    manifest = {"seed": args.seed, "documents": []}
+    for i in range(args.pdfs):
+        data, pii = make_pdf(args.pages, seed=args.seed + i)
+        name = f"statement_{i:03d}.pdf"
+        with open(os.path.join(args.out, name), "wb") as f:
+            f.write(data)
+        manifest["documents"].append({"file": name, "pii": pii})
+    for i in range(args.images):
+        image, pii = make_id_card(seed=args.seed + i)
+        name = f"id_card_{i:03d}.png"
+        cv2.imwrite(os.path.join(args.out, name), image)
+        manifest["documents"].append({"file": name, "pii": pii})
+    with open(os.path.join(args.out, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote {len(manifest['documents'])} documents to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Local stand-in for the Jabir, Groq and Gemini endpoints.
+
+Answers the request shapes providers.py sends:
+
+- Jabir:  POST /generate  {"messages": [...]}  ->  {"result": {"content": ...}}
+- Groq:   POST /openai/v1/chat/completions (OpenAI chat format)
+- Gemini: POST /v1beta/models/<model>:generateContent (REST transport)
+
+after a configurable delay, with the entities pii_rules finds in the text
+after "Text to analyze:" (and capitalised name pairs when the prompt asks
+for names), or a fixed category for the document-type prompt. The answer
+depends only on the prompt, so runs are reproducible.
+
+Run from ai_engine/:  python -m benchmarks.stub_llm --port 8765 --latency 800
+and start the app with the variables it prints; or call serve() in-process.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pii_rules import scan_pii
+
+NAME_PATTERN = re.compile(r"\b[A-Z][a-z]+ [A-Z][a-z]+\b")
+
+
+def stub_answer(prompt):
+    if "identify the type of document" in prompt:
+        return json.dumps({"category": "Identification Document"})
+    text = prompt.rsplit("Text to analyze:", 1)[-1]
+    found, uncertain = scan_pii(text)
+    entities = [
+        {"type": data_type, "text": value}
+        for value, _, _, data_type in found + uncertain
+    ]
+    if "names" in prompt.lower():
+        entities.extend(
+            {"type": "Name", "text": match.group()}
+            for match in NAME_PATTERN.finditer(text)
+        )
+    return json.dumps(entities)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Set by serve().
+    latency = 0.0
+    jitter = 0.0
+    fail_rate = 0.0
+    rng = random.Random(0)
+    counts = {}
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._reply(400, {"error": "invalid JSON"})
+
+        path = self.path.split("?", 1)[0]
+        if path.endswith("/chat/completions"):
+            provider = "groq"
+            prompt = body["messages"][-1]["content"]
+        elif path.endswith(":generateContent"):
+            provider = "gemini"
+            prompt = "".join(
+                part.get("text", "")
+                for content in body.get("contents", [])
+                for part in content.get("parts", [])
+            )
+        elif "messages" in body:
+            provider = "jabir"
+            prompt = body["messages"][-1]["content"]
+        else:
+            return self._reply(404, {"error": f"unknown endpoint {path}"})
+
+        with self.lock:
+            self.counts[provider] = self.counts.get(provider, 0) + 1
+            delay = max(0.0, self.latency + self.rng.uniform(-1, 1) * self.jitter)
+            fail = self.rng.random() < self.fail_rate
+        time.sleep(delay)
+        if fail:
+            return self._reply(503, {"error": "stub failure"})
+
+        answer = stub_answer(prompt)
+        if provider == "jabir":
+            return self._reply(200, {"result": {"content": answer}})
+        if provider == "groq":
+            return self._reply(
+                200,
+                {
+                    "id": "stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": answer},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 0,
+                        "completion_tokens": 0,
+                        "total_tokens": 0,
+                    },
+                },
+            )
+        return self._reply(
+            200,
+            {
+                "candidates": [
+                    {
+                        "content": {"role": "model", "parts": [{"text": answer}]},
+                        "finishReason": "STOP",
+                        "index": 0,
+                    }
+                ]
+            },
+        )
+
+
+def serve(port=0, latency_ms=0, jitter_ms=0, fail_rate=0.0, seed=0):
+    """Start the stub on a daemon thread and return the server."""
+    handler = type(
+        "ConfiguredStubHandler",
+        (StubHandler,),
+        {
+            "latency": latency_ms / 1000,
+            "jitter": jitter_ms / 1000,
+            "fail_rate": fail_rate,
+            "rng": random.Random(seed),
+            "counts": {},
+            "lock": threading.Lock(),
+        },
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def provider_env(server):
+    """Environment that points providers.py at the stub."""
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    return {
+        "JABIR_URL": f"{url}/generate",
+        "GROQ_BASE_URL": url,
+        "GEMINI_API_ENDPOINT": url,
+        "GROQ_API_KEY": "stub",
+        "GOOGLE_API_KEY": "stub",
+        "API_KEY": "stub",
+    }
+
+
+def request_counts(server):
+    return dict(server.RequestHandlerClass.counts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds")
+    parser.add_argument("--jitter", type=float, default=0, help="milliseconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.jitter, args.fail_rate, args.seed)
+    for key, value in provider_env(server).items():
+        print(f"export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Where the Jabir, Groq and Gemini calls in providers.py actually go.
+
+DETECTOR_BACKEND selects one of:
+
+- live:    call the provider (the default).
+- record:  call the provider and append every prompt -> response pair,
+           failures included, to DETECTOR_RECORDING_PATH.
+- replay:  answer from DETECTOR_RECORDING_PATH without touching the
+           network. A prompt that was never recorded is answered like a
+           failed call, so the usual fallbacks run.
+
+Replayed answers are returned after DETECTOR_REPLAY_LATENCY: empty for no
+delay, "recorded" for the time the original call took, or a number of
+milliseconds. With the detection cache disabled (LLM_CACHE_TTL=-1) a
+replayed run makes the same provider calls, in the same order, as the run
+that was recorded. The backend is built when the app starts, so a missing
+recording or a bad latency stops it there rather than failing requests.
+
+Recordings hold the prompts' hashes, not the prompts, but the responses
+are the PII that was detected; keep them with the same care as the
+documents.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from llm_cache import normalize_text
+
+
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "live")
+DETECTOR_RECORDING_PATH = os.getenv(
+    "DETECTOR_RECORDING_PATH", "cache/detector_recording.jsonl"
+)
+DETECTOR_REPLAY_LATENCY = os.getenv("DETECTOR_REPLAY_LATENCY", "")
+
+
+def prompt_key(provider, prompt):
+    return hashlib.sha256(f"{provider}|{normalize_text(prompt)}".encode()).hexdigest()
+
+
+class LiveBackend:
+    def generate(self, provider, prompt, call):
+        """Return call(), the response of ``provider`` to ``prompt`` or None."""
+        return call()
+
+
+class RecordingBackend(LiveBackend):
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def generate(self, provider, prompt, call):
+        started = time.perf_counter()
+        response = call()
+        record = {
+            "key": prompt_key(provider, prompt),
+            "provider": provider,
+            "response": response,
+            "seconds": round(time.perf_counter() - started, 4),
+        }
+        line = json.dumps(record) + "\n"
+        # One write per line in append mode, so workers sharing the file do
+        # not interleave records.
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+        return response
+
+
+class ReplayBackend(LiveBackend):
+    def __init__(self, path, latency=""):
+        if latency not in ("", "recorded"):
+            try:
+                milliseconds = float(latency)
+            except ValueError:
+                milliseconds = -1
+            if milliseconds < 0:
+                raise ValueError(
+                    f"DETECTOR_REPLAY_LATENCY must be empty, \"recorded\" or a "
+                    f"number of milliseconds, not {latency!r}"
+                )
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"No detector recording to replay at {path}")
+        self.path = path
+        self.latency = latency
+        self.records = {}
+        self.hits = 0
+        self.misses = 0
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                # The first answer recorded for a prompt is the one replayed.
+                self.records.setdefault(record["key"], record)
+        logging.info(f"Replaying {len(self.records)} detector responses from {path}")
+
+    def delay(self, record):
+        if not self.latency:
+            return 0.0
+        if self.latency == "recorded":
+            return record["seconds"]
+        return float(self.latency) / 1000
+
+    def generate(self, provider, prompt, call):
+        record = self.records.get(prompt_key(provider, prompt))
+        if record is None:
+            self.misses += 1
+            logging.warning(f"No recorded {provider} response for this prompt")
+            return None
+        self.hits += 1
+        time.sleep(self.delay(record))
+        return record["response"]
+
+
+BACKENDS = {
+    "live": LiveBackend,
+    "record": RecordingBackend,
+    "replay": ReplayBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def make_backend(
+    name=DETECTOR_BACKEND,
+    path=DETECTOR_RECORDING_PATH,
+    latency=DETECTOR_REPLAY_LATENCY,
+):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown detector backend: {name}")
+    if name == "live":
+        return LiveBackend()
+    if name == "record":
+        return RecordingBackend(path)
+    return ReplayBackend(path, latency)
+
+
+def get_backend():
+    """The backend for this process, built from the DETECTOR_* settings on
+    first use; call it at start-up to check them."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = make_backend()
+        return _backend
+
+
+def set_backend(backend):
+    """Use ``backend`` for every later provider call in this process."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,129 @@
+import logging
+from collections import deque
+
+
+COMMON_WORDS = {"the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for"}
+
+# Below this many distinct patterns a C-level str.find per pattern beats the
+# pure Python automaton; see benchmarks/bench_locator.py.
+AUTOMATON_MIN_PATTERNS = 256
+
+
+class EntityLocator:
+    """Aho-Corasick automaton over a fixed set of patterns.
+
+    Built once per request, it reports every occurrence of every pattern in a
+    single pass over the text instead of one ``str.find`` scan per pattern.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = next_state
+            self._out[state] = self._out[state] + (index,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fallback = self._goto[fail].get(ch, 0)
+                self._fail[next_state] = fallback if fallback != next_state else 0
+                self._out[next_state] = self._out[next_state] + self._out[
+                    self._fail[next_state]
+                ]
+
+    def find_all(self, text):
+        """Yield (pattern_index, start, end) for every, possibly overlapping, match."""
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        lengths = [len(pattern) for pattern in self.patterns]
+        state = 0
+        for i, ch in enumerate(text):
+            transitions = goto[state]
+            while state and ch not in transitions:
+                state = fail[state]
+                transitions = goto[state]
+            state = transitions.get(ch, 0)
+            if out[state]:
+                for index in out[state]:
+                    yield index, i + 1 - lengths[index], i + 1
+
+    def find_non_overlapping(self, text):
+        """Occurrences per pattern, matching a ``text.find(p, end)`` loop."""
+        matches = [[] for _ in self.patterns]
+        last_end = [0] * len(self.patterns)
+        for index, start, end in self.find_all(text):
+            if start >= last_end[index]:
+                matches[index].append((start, end))
+                last_end[index] = end
+        return matches
+
+
+def find_each(text, patterns):
+    """Same result as EntityLocator(patterns).find_non_overlapping(text)."""
+    matches = []
+    for pattern in patterns:
+        occurrences = []
+        start = 0
+        while True:
+            start = text.find(pattern, start)
+            if start == -1:
+                break
+            occurrences.append((start, start + len(pattern)))
+            start += len(pattern)
+        matches.append(occurrences)
+    return matches
+
+
+def locate_entities(text, entities):
+    """Return (text, start, end, type) for every occurrence of every entity.
+
+    Entities are LLM results of the form {"text": ..., "type": ...}; single
+    characters and common words are skipped. Tuples come out in entity order,
+    then in text order, exactly as the per-entity ``text.find`` loop did.
+    """
+    kept = []
+    for entity in entities:
+        item_text = entity["text"]
+        if len(item_text) <= 1:
+            logging.warning(f"Skipping single character: {item_text}")
+            continue
+        if item_text.lower() in COMMON_WORDS:
+            logging.warning(f"Skipping common word: {item_text}")
+            continue
+        kept.append((item_text, entity["type"]))
+
+    if not kept:
+        return []
+
+    pattern_index = {}
+    for item_text, _ in kept:
+        pattern_index.setdefault(item_text, len(pattern_index))
+    if len(pattern_index) >= AUTOMATON_MIN_PATTERNS:
+        matches = EntityLocator(pattern_index).find_non_overlapping(text)
+    else:
+        matches = find_each(text, pattern_index)
+
+    sensitive_data = []
+    for item_text, item_type in kept:
+        for start, end in matches[pattern_index[item_text]]:
+            sensitive_data.append((item_text, start, end, item_type))
+    return sensitive_data
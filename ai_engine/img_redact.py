@@ -1,20 +1,18 @@
 import cv2
 import numpy as np
-import pytesseract
 import json
-import requests
 import logging
 from PIL import Image
-from ultralytics import YOLO
 from dotenv import load_dotenv
 import ast
-import google.generativeai as genai
 import re
 import os
+from memio import encode_image
+from models import get_model
+from providers import gemini_generate, jabir_generate
 
 load_dotenv()
 
-pytesseract.pytesseract.tesseract_cmd = r"/usr/bin/tesseract"
 logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
 )
@@ -22,10 +20,16 @@ logging.basicConfig(
 API_KEY = os.getenv("API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-genai.configure(api_key=GOOGLE_API_KEY)
+
+def _tesseract():
+    import pytesseract
+
+    pytesseract.pytesseract.tesseract_cmd = r"/usr/bin/tesseract"
+    return pytesseract
 
 
 def perform_ocr(image):
+    pytesseract = _tesseract()
     pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
     ocr_data = pytesseract.image_to_data(
         pil_image, output_type=pytesseract.Output.DICT, lang="eng"
@@ -53,31 +57,7 @@ def extract_json(response_text):
 
 
 def get_gemini_response(prompt):
-    try:
-        model = genai.GenerativeModel("gemini-pro")
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_NONE",
-            },
-        ]
-        response = model.generate_content(prompt, safety_settings=safety_settings)
-        return response.text
-    except Exception as e:
-        logging.error(f"Error in Gemini API call: {str(e)}")
-        return None
+    return gemini_generate(prompt)
 
 
 def find_sensitive_data(text):
@@ -113,25 +93,13 @@ def find_sensitive_data(text):
         f"Text to analyze:\n{text}"
     )
 
-    data = {"messages": [{"role": "user", "content": prompt}]}
-
-    headers = {"Content-Type": "application/json", "apiKey": API_KEY}
-
-    response = requests.post(
-        "https://api.jabirproject.org/generate", json=data, headers=headers
-    )
-    if response.status_code == 200:
-        entities_json = response.json().get("result", {}).get("content", "")
+    entities = None
+    entities_json = jabir_generate(prompt)
+    if entities_json is not None:
         try:
             entities = json.loads(entities_json)
         except json.JSONDecodeError:
             logging.error("Error: Unable to parse JSON response from Jabir API")
-            entities = None
-    else:
-        logging.error(
-            f"Error in Jabir API call: {response.status_code} - {response.text}"
-        )
-        entities = None
 
     if entities is None:
         logging.info("Falling back to Gemini Pro API")
@@ -309,13 +277,16 @@ def redact_images(image, image_regions):
     return redacted
 
 
-def redactImg(input_image, output_image):
-    image = cv2.imread(input_image)
+def redactImg(input_image, output_image, image_format=None):
+    if isinstance(input_image, (bytes, bytearray, memoryview)):
+        image = cv2.imdecode(np.frombuffer(input_image, np.uint8), cv2.IMREAD_COLOR)
+    else:
+        image = cv2.imread(input_image)
     if image is None:
-        logging.error(f"Failed to load image: {input_image}")
+        logging.error("Failed to load image")
         return
 
-    model = YOLO("yolov5su.pt")
+    model = get_model("yolov5su.pt")
 
     ocr_data = perform_ocr(image)
     full_text = " ".join(ocr_data["text"])
@@ -331,6 +302,8 @@ def redactImg(input_image, output_image):
 
     final_redacted_image = redact_images(redacted_text_image, all_regions)
 
+    if output_image is None:
+        return encode_image(final_redacted_image, image_format)
     cv2.imwrite(output_image, final_redacted_image)
     logging.info(f"Redacted image saved as {output_image}")
 
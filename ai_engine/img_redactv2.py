@@ -1,13 +1,12 @@
 import cv2
 import numpy as np
-import easyocr
 import json
-import requests
 import logging
 from PIL import Image
-from ultralytics import YOLO
 from dotenv import load_dotenv
 import os
+from models import get_model
+from providers import jabir_generate
 
 load_dotenv()
 
@@ -19,7 +18,7 @@ API_KEY = os.getenv("API_KEY")
 
 
 def perform_ocr(image):
-    reader = easyocr.Reader(["en"])
+    reader = get_model("easyocr")
     results = reader.readtext(image, detail=1)
 
     ocr_data = {"text": [], "left": [], "top": [], "width": [], "height": []}
@@ -70,22 +69,13 @@ def find_sensitive_data(text):
         f"Text to analyze:\n{text}"
     )
 
-    data = {"messages": [{"role": "user", "content": prompt}]}
-
-    headers = {"Content-Type": "application/json", "apiKey": API_KEY}
-
-    response = requests.post(
-        "https://api.jabirproject.org/generate", json=data, headers=headers
-    )
-    if response.status_code == 200:
-        entities_json = response.json().get("result", {}).get("content", "")
-        try:
-            entities = json.loads(entities_json)
-        except json.JSONDecodeError:
-            logging.error("Error: Unable to parse JSON response")
-            return []
-    else:
-        logging.error(f"Error: {response.status_code} - {response.text}")
+    entities_json = jabir_generate(prompt)
+    if entities_json is None:
+        return []
+    try:
+        entities = json.loads(entities_json)
+    except json.JSONDecodeError:
+        logging.error("Error: Unable to parse JSON response")
         return []
     return entities
 
@@ -217,7 +207,7 @@ def main(image_path, output_path, model):
 
 
 if __name__ == "__main__":
-    model = YOLO("yolov8n.pt")
+    model = get_model("yolov8n.pt")
     input_path = "input.jpg"
     output_path = "output2.jpg"
     main(input_path, output_path, model)
@@ -1,24 +1,19 @@
 import cv2
 import numpy as np
-import easyocr
 import json
-import requests
 import logging
 from PIL import Image, ImageDraw, ImageFont
-from ultralytics import YOLO
 import os
-import google.generativeai as genai
 import ast
 from dotenv import load_dotenv
 import re
-import pytesseract
 import pyzbar.pyzbar as pyzbar
+from models import get_model
+from providers import gemini_generate, jabir_generate
 
 
 load_dotenv()
 
-pytesseract.pytesseract.tesseract_cmd = r"/usr/bin/tesseract"
-
 API_KEY = os.getenv("API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
@@ -26,8 +21,6 @@ logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-genai.configure(api_key=GOOGLE_API_KEY)
-
 
 def extract_json(response_text):
     try:
@@ -58,34 +51,18 @@ def extract_json(response_text):
 
 
 def get_gemini_response(prompt):
-    try:
-        model = genai.GenerativeModel("gemini-pro")
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_NONE",
-            },
-        ]
-        response = model.generate_content(prompt, safety_settings=safety_settings)
-        return response.text
-    except Exception as e:
-        logging.error(f"Error in Gemini API call: {str(e)}")
-        return None
+    return gemini_generate(prompt)
+
+
+def _tesseract():
+    import pytesseract
+
+    pytesseract.pytesseract.tesseract_cmd = r"/usr/bin/tesseract"
+    return pytesseract
 
 
 def perform_ocr(image):
+    pytesseract = _tesseract()
     pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
     ocr_data = pytesseract.image_to_data(
         pil_image, output_type=pytesseract.Output.DICT, lang="eng"
@@ -192,29 +169,14 @@ def find_sensitive_data(text, level):
             f"Text to analyze:\n{text}"
         )
 
-    data = {"messages": [{"role": "user", "content": prompt}]}
-
-    headers = {"Content-Type": "application/json", "apiKey": API_KEY}
-    try:
-        response = requests.post(
-            "https://api.jabirproject.org/generate", json=data, headers=headers
-        )
-        if response.status_code == 200:
-            entities_json = response.json().get("result", {}).get("content", "")
-            print(entities_json)
-            try:
-                entities = json.loads(entities_json)
-            except json.JSONDecodeError:
-                logging.error("Error: Unable to parse JSON response from Jabir API")
-                entities = None
-        else:
-            logging.error(
-                f"Error in Jabir API call: {response.status_code} - {response.text}"
-            )
-            entities = None
-    except Exception as e:
-        logging.error(f"Error in Jabir API call: {e}")
-        entities = None
+    entities = None
+    entities_json = jabir_generate(prompt)
+    if entities_json is not None:
+        print(entities_json)
+        try:
+            entities = json.loads(entities_json)
+        except json.JSONDecodeError:
+            logging.error("Error: Unable to parse JSON response from Jabir API")
 
     if entities is None:
         logging.info("Falling back to Gemini Pro API")
@@ -526,7 +488,7 @@ def get_redacted_image(
     mode="black",
     sensitive_data=None,
 ):
-    model = YOLO("yolov8n.pt")
+    model = get_model(model)
     image = cv2.imread(image_path)
     ocr_data = perform_ocr(image)
     redacted_image = redact_sensitive_data(image.copy(), ocr_data, sensitive_data, mode)
@@ -552,7 +514,7 @@ def get_redacted_image_cust(
     mode="black",
     sensitive_data=None,
 ):
-    model = YOLO(model)
+    model = get_model(model)
     image = cv2.imread(image_path)
     ocr_data = perform_ocr(image)
     redacted_image = redact_sensitive_data(image.copy(), ocr_data, sensitive_data, mode)
@@ -624,7 +586,7 @@ def main(image_path, output_path, model, redaction_level=1, mode="black"):
 
 
 if __name__ == "__main__":
-    model = YOLO("yolov8n.pt")
+    model = get_model("yolov8n.pt")
     input_path = "input.jpg"
     output_path = "output_redacted.jpg"
     main(input_path, output_path, model, redaction_level=2, mode="blur")
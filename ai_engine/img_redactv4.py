@@ -1,34 +1,42 @@
 import cv2
 import numpy as np
+import io
 import json
-import requests
 import logging
 from PIL import Image, ImageDraw, ImageFont
-from ultralytics import YOLO
 import os
-import google.generativeai as genai
 import ast
 from dotenv import load_dotenv
 import re
 import pyzbar.pyzbar as pyzbar
-from paddleocr import PaddleOCR
 import hashlib
 import random
+from models import get_model
+from providers import gemini_generate, jabir_generate
+from artifact_cache import artifact_cache, artifact_key, cached_artifact
+from entity_locator import locate_entities
+from memio import encode_image
+from metrics import inc, stage
+from pii_rules import RULES_FAST_PATH, candidate_context, scan_pii
 
 
 load_dotenv()
 
-ocr = PaddleOCR(use_angle_cls=False, lang="en")
-
 API_KEY = os.getenv("API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+OCR_MAX_PASSES = int(os.getenv("OCR_MAX_PASSES", "3"))
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "0.9"))
+YOLO_BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "8"))
+# Side, in pixels, of the blocks "pixelate" averages a region into.
+PIXELATE_BLOCK = int(os.getenv("PIXELATE_BLOCK", "12"))
+BLUR_KERNEL = 21
+FILL_COLORS = {"black": (0, 0, 0), "white": (255, 255, 255)}
+REDACTION_MODES = ("black", "white", "blur", "pixelate")
 
 logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-genai.configure(api_key=GOOGLE_API_KEY)
-
 
 def extract_json(response_text):
     try:
@@ -59,86 +67,150 @@ def extract_json(response_text):
 
 
 def get_gemini_response(prompt):
-    try:
-        model = genai.GenerativeModel("gemini-pro")
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_NONE",
-            },
-        ]
-        response = model.generate_content(prompt, safety_settings=safety_settings)
-        return response.text
-    except Exception as e:
-        logging.error(f"Error in Gemini API call: {str(e)}")
-        return None
+    return gemini_generate(prompt)
 
 
-def perform_ocr(image, attempts=3, max_retries=10):
-    def ocr_attempt(img):
-        rgb_image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        ocr_results = ocr.ocr(rgb_image)
-        ocr_data = {"left": [], "top": [], "width": [], "height": [], "text": []}
-        total_text = ""
-        for page in ocr_results:
-            for block in page:
-                text = block[1][0]
-                ocr_data["text"].append(text)
-                total_text += text
-                bbox = block[0]
-                x1, y1 = bbox[0]
-                x2, y2 = bbox[2]
-                width, height = abs(x2 - x1), abs(y2 - y1)
-                ocr_data["left"].append(int(x1))
-                ocr_data["top"].append(int(y1))
-                ocr_data["width"].append(int(width))
-                ocr_data["height"].append(int(height))
-        return ocr_data, len(total_text)
-
-    best_result = None
-    max_text_length = 0
-    successful_attempts = 0
-    total_attempts = 0
+@stage("perform_ocr")
+# A cached result made no OCR passes for this request.
+@cached_artifact("paddleocr", "1", on_hit=lambda ocr_data: dict(ocr_data, passes=0))
+def perform_ocr(
+    image,
+    attempts=OCR_MAX_PASSES,
+    max_retries=10,
+    min_confidence=OCR_MIN_CONFIDENCE,
+):
+    ocr = get_model("paddleocr")
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    image_height, image_width = rgb_image.shape[:2]
+
+    def detect_and_recognize():
+        blocks = []
+        for page in ocr.ocr(rgb_image):
+            for block in page or []:
+                blocks.append([block[0], block[1][0], float(block[1][1])])
+        return blocks
+
+    def recognize_region(bbox, scale):
+        xs = [point[0] for point in bbox]
+        ys = [point[1] for point in bbox]
+        padding = 4
+        x1 = max(0, int(min(xs)) - padding)
+        y1 = max(0, int(min(ys)) - padding)
+        x2 = min(image_width, int(max(xs)) + padding)
+        y2 = min(image_height, int(max(ys)) + padding)
+        if x2 <= x1 or y2 <= y1:
+            return None
+        crop = cv2.resize(
+            rgb_image[y1:y2, x1:x2],
+            None,
+            fx=scale,
+            fy=scale,
+            interpolation=cv2.INTER_CUBIC,
+        )
+        result = ocr.ocr(crop, det=False, cls=False)
+        if not result or not result[0]:
+            return None
+        text, conf = result[0][0]
+        return text, float(conf)
 
-    while successful_attempts < attempts and total_attempts < max_retries:
+    blocks = None
+    total_attempts = 0
+    while blocks is None and total_attempts < max_retries:
         try:
-            result, text_length = ocr_attempt(image)
-            successful_attempts += 1
             total_attempts += 1
-
-            if text_length > max_text_length:
-                best_result = result
-                max_text_length = text_length
+            blocks = detect_and_recognize()
         except RuntimeError as e:
             print(f"RuntimeError occurred: {e}. Retrying...")
-            total_attempts += 1
 
-        if successful_attempts < attempts and total_attempts >= max_retries:
-            print(
-                f"Warning: Only completed {successful_attempts} successful attempts out of {attempts} desired."
-            )
-
-    if best_result:
-        print(" ".join(best_result["text"]))
-    else:
+    if blocks is None:
         print("No successful OCR attempts were made.")
+        return None
+
+    # Only boxes the recognizer was unsure about get another look, on an
+    # upscaled crop, until they clear the threshold or the budget runs out.
+    passes = 1
+    while passes < attempts:
+        low_confidence = [block for block in blocks if block[2] < min_confidence]
+        if not low_confidence:
+            break
+        passes += 1
+        for block in low_confidence:
+            try:
+                result = recognize_region(block[0], scale=passes)
+            except RuntimeError as e:
+                print(f"RuntimeError occurred: {e}. Keeping first pass result.")
+                continue
+            if result and result[0] and result[1] > block[2]:
+                block[1], block[2] = result
+
+    ocr_data = {
+        "left": [],
+        "top": [],
+        "width": [],
+        "height": [],
+        "text": [],
+        "conf": [],
+        "passes": passes,
+    }
+    for bbox, text, conf in blocks:
+        x1, y1 = bbox[0]
+        x2, y2 = bbox[2]
+        width, height = abs(x2 - x1), abs(y2 - y1)
+        ocr_data["text"].append(text)
+        ocr_data["conf"].append(round(conf, 4))
+        ocr_data["left"].append(int(x1))
+        ocr_data["top"].append(int(y1))
+        ocr_data["width"].append(int(width))
+        ocr_data["height"].append(int(height))
 
-    return best_result
+    inc("veilx_ocr_boxes_total", len(blocks))
+    logging.info(f"OCR finished after {passes} pass(es), {len(blocks)} boxes")
+    print(" ".join(ocr_data["text"]))
 
+    return ocr_data
 
+
+@stage("find_sensitive_data")
 def find_sensitive_data(text, level):
+    if level in (1, 2) and RULES_FAST_PATH:
+        # See redactv2.find_sensitive_data_rules.
+        found, uncertain = scan_pii(text)
+        entities = []
+        if uncertain:
+            entities = detect_entities(candidate_context(text, uncertain), level)
+            if entities is None:
+                logging.warning(
+                    f"No LLM answer about {len(uncertain)} candidates; redacting them"
+                )
+                found = found + uncertain
+        sensitive_data = found + locate_entities(text, entities or [])
+    else:
+        sensitive_data = locate_entities(text, detect_entities(text, level) or [])
+
+    url_pattern = re.compile(
+        r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
+    )
+    identifier_pattern = re.compile(
+        r"\b(?:(?:\d{6,})|(?=.*\d)(?=.*[A-Z])[A-Z\d]{8,})\b"
+    )
+
+    for match in url_pattern.finditer(text):
+        sensitive_data.append((match.group(), match.start(), match.end(), "URL"))
+
+    for match in identifier_pattern.finditer(text):
+        sensitive_data.append(
+            (match.group(), match.start(), match.end(), "Potential Identifier")
+        )
+
+    inc("veilx_entities_total", len(sensitive_data))
+    for data in sensitive_data:
+        logging.debug(f"Identified sensitive data: {data}")
+
+    return sensitive_data
+
+
+@stage("detect_entities")
+def detect_entities(text, level):
     # print("Level: ", level, level==1, type(level), int(level)==1)
     if level == 1 or level == 2:
         prompt = (
@@ -237,29 +309,14 @@ def find_sensitive_data(text, level):
             f"Text to analyze:\n{text}"
         )
 
-    data = {"messages": [{"role": "user", "content": prompt}]}
-
-    headers = {"Content-Type": "application/json", "apiKey": API_KEY}
-    try:
-        response = requests.post(
-            "https://api.jabirproject.org/generate", json=data, headers=headers
-        )
-        if response.status_code == 200:
-            entities_json = response.json().get("result", {}).get("content", "")
-            print(entities_json)
-            try:
-                entities = json.loads(entities_json)
-            except json.JSONDecodeError:
-                logging.error("Error: Unable to parse JSON response from Jabir API")
-                entities = None
-        else:
-            logging.error(
-                f"Error in Jabir API call: {response.status_code} - {response.text}"
-            )
-            entities = None
-    except Exception as e:
-        logging.error(f"Error in Jabir API call: {e}")
-        entities = None
+    entities = None
+    entities_json = jabir_generate(prompt)
+    if entities_json is not None:
+        print(entities_json)
+        try:
+            entities = json.loads(entities_json)
+        except json.JSONDecodeError:
+            logging.error("Error: Unable to parse JSON response from Jabir API")
 
     if entities is None:
         logging.info("Falling back to Gemini Pro API")
@@ -269,136 +326,152 @@ def find_sensitive_data(text, level):
                 entities = extract_json(gemini_response)
             except Exception:
                 logging.error("Error: Unable to parse JSON response from Gemini API")
-                entities = []
+                entities = None
         else:
             logging.error("Both Jabir and Gemini API calls failed")
-            entities = []
 
-    sensitive_data = []
     print("Entities: ", entities)
-    for entity in entities:
-        item_text = entity["text"]
-        if len(item_text) <= 1:
-            logging.warning(f"Skipping single character: {item_text}")
-            continue
-        if item_text.lower() in [
-            "the",
-            "a",
-            "an",
-            "and",
-            "or",
-            "but",
-            "in",
-            "on",
-            "at",
-            "to",
-            "for",
-        ]:
-            logging.warning(f"Skipping common word: {item_text}")
-            continue
-        start = 0
-        while True:
-            start = text.find(item_text, start)
-            if start == -1:
-                break
-            end = start + len(item_text)
-            sensitive_data.append((item_text, start, end, entity["type"]))
-            start = end
+    return entities
 
-    url_pattern = re.compile(
-        r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
-    )
-    identifier_pattern = re.compile(
-        r"\b(?:(?:\d{6,})|(?=.*\d)(?=.*[A-Z])[A-Z\d]{8,})\b"
-    )
 
-    for match in url_pattern.finditer(text):
-        sensitive_data.append((match.group(), match.start(), match.end(), "URL"))
+def redact_regions(image, boxes, mode="black"):
+    """Redact the (x1, y1, x2, y2) boxes, corners included, of image in place.
 
-    for match in identifier_pattern.finditer(text):
-        sensitive_data.append(
-            (match.group(), match.start(), match.end(), "Potential Identifier")
-        )
-
-    for data in sensitive_data:
-        logging.debug(f"Identified sensitive data: {data}")
-
-    return sensitive_data
+    Only the boxes are touched: blur filters each box plus the margin the
+    kernel reads around it, which gives the same pixels as blurring the
+    whole image, and pixelate averages blocks inside the box. Every box is
+    blurred from the original pixels, even where boxes overlap.
+    """
+    if mode not in REDACTION_MODES:
+        raise ValueError("Invalid mode. Choose 'black', 'white', 'blur', or 'pixelate'.")
+    height, width = image.shape[:2]
+    clipped = []
+    for x1, y1, x2, y2 in boxes:
+        x1, y1 = max(0, int(x1)), max(0, int(y1))
+        x2, y2 = min(width, int(x2) + 1), min(height, int(y2) + 1)
+        if x2 > x1 and y2 > y1:
+            clipped.append((x1, y1, x2, y2))
+
+    if mode in FILL_COLORS:
+        for x1, y1, x2, y2 in clipped:
+            image[y1:y2, x1:x2] = FILL_COLORS[mode]
+    elif mode == "blur":
+        margin = BLUR_KERNEL // 2
+        patches = []
+        for x1, y1, x2, y2 in clipped:
+            mx1, my1 = max(0, x1 - margin), max(0, y1 - margin)
+            mx2, my2 = min(width, x2 + margin), min(height, y2 + margin)
+            blurred = cv2.GaussianBlur(
+                image[my1:my2, mx1:mx2], (BLUR_KERNEL, BLUR_KERNEL), 0
+            )
+            patches.append(
+                (x1, y1, x2, y2, blurred[y1 - my1 : y2 - my1, x1 - mx1 : x2 - mx1])
+            )
+        for x1, y1, x2, y2, patch in patches:
+            image[y1:y2, x1:x2] = patch
+    else:
+        for x1, y1, x2, y2 in clipped:
+            region = image[y1:y2, x1:x2]
+            blocks = (
+                max(1, (x2 - x1) // PIXELATE_BLOCK),
+                max(1, (y2 - y1) // PIXELATE_BLOCK),
+            )
+            small = cv2.resize(region, blocks, interpolation=cv2.INTER_AREA)
+            region[:] = cv2.resize(
+                small, (x2 - x1, y2 - y1), interpolation=cv2.INTER_NEAREST
+            )
+    return image
 
 
+@stage("redact_sensitive_data")
 def redact_sensitive_data(image, ocr_data, sensitive_data, mode="black"):
     height, width = image.shape[:2]
-    mask = np.zeros((height, width), dtype=np.uint8)
 
-    sensitive_patterns = {
-        entity["text"].lower(): re.compile(
-            r"\b" + re.escape(entity["text"].lower()) + r"\b"
-        )
+    sensitive_patterns = [
+        re.compile(r"\b" + re.escape(entity["text"].lower()) + r"\b")
         for entity in sensitive_data
-    }
+    ]
 
+    boxes = []
+    padding = 2
     for i in range(len(ocr_data["text"])):
         ocr_text = ocr_data["text"][i].lower()
-        for entity_text, pattern in sensitive_patterns.items():
-            if pattern.search(ocr_text):
-                x_min = ocr_data["left"][i]
-                y_min = ocr_data["top"][i]
-                x_max = x_min + ocr_data["width"][i]
-                y_max = y_min + ocr_data["height"][i]
-
-                padding = 2
-                x_min = max(0, x_min - padding)
-                y_min = max(0, y_min - padding)
-                x_max = min(width, x_max + padding)
-                y_max = min(height, y_max + padding)
-
-                cv2.rectangle(
-                    mask, (int(x_min), int(y_min)), (int(x_max), int(y_max)), 255, -1
+        if any(pattern.search(ocr_text) for pattern in sensitive_patterns):
+            x_min = ocr_data["left"][i]
+            y_min = ocr_data["top"][i]
+            x_max = x_min + ocr_data["width"][i]
+            y_max = y_min + ocr_data["height"][i]
+            boxes.append(
+                (
+                    max(0, x_min - padding),
+                    max(0, y_min - padding),
+                    min(width, x_max + padding),
+                    min(height, y_max + padding),
                 )
+            )
 
-    if mode == "black":
-        image[mask > 0] = [0, 0, 0]
-    elif mode == "white":
-        image[mask > 0] = [255, 255, 255]
-    elif mode == "blur":
-        blurred = cv2.GaussianBlur(image, (21, 21), 0)
-        image = np.where(mask[:, :, None] > 0, blurred, image)
-    else:
-        raise ValueError("Invalid mode. Choose 'black', 'white', or 'blur'.")
-
-    return image
-
-
-def detect_images(image, model):
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    pil_image = Image.fromarray(image_rgb)
+    return redact_regions(image, boxes, mode)
 
-    results = model(pil_image)
 
+def result_regions(result, image):
     image_height, image_width = image.shape[:2]
     max_area = (image_width * image_height) / 4
 
     image_regions = []
-    for result in results:
-        boxes = result.boxes.xyxy.cpu().numpy()
-        classes = result.boxes.cls.cpu().numpy()
-        confs = result.boxes.conf.cpu().numpy()
-
-        for box, cls, conf in zip(boxes, classes, confs):
-            if conf > 0.1:
-                x1, y1, x2, y2 = box
-                box_width = x2 - x1
-                box_height = y2 - y1
-                box_area = box_width * box_height
-
-                if box_area <= max_area:
-                    image_regions.append(
-                        (int(x1), int(y1), int(box_width), int(box_height))
-                    )
+    boxes = result.boxes.xyxy.cpu().numpy()
+    classes = result.boxes.cls.cpu().numpy()
+    confs = result.boxes.conf.cpu().numpy()
+
+    for box, cls, conf in zip(boxes, classes, confs):
+        if conf > 0.1:
+            x1, y1, x2, y2 = box
+            box_width = x2 - x1
+            box_height = y2 - y1
+            box_area = box_width * box_height
+
+            if box_area <= max_area:
+                image_regions.append(
+                    (int(x1), int(y1), int(box_width), int(box_height))
+                )
 
     return image_regions
 
 
+@stage("detect_images_batch")
+def detect_images_batch(images, model, batch_size=YOLO_BATCH_SIZE):
+    """Regions of every image, running YOLO on up to batch_size images at once.
+
+    Ultralytics letterboxes a list of BGR arrays into a single input tensor
+    and scales the boxes of each result back to its own image. Results are
+    cached per image under the same key as detect_images.
+    """
+    keys = [artifact_key("yolo", "1", image, [("model", model)]) for image in images]
+    regions = [None] * len(images)
+    misses = []
+    for i, key in enumerate(keys):
+        found, value = artifact_cache.get(key)
+        if found:
+            regions[i] = value
+        else:
+            misses.append(i)
+
+    for start in range(0, len(misses), batch_size):
+        chunk = misses[start : start + batch_size]
+        results = model([images[i] for i in chunk], verbose=False)
+        for i, result in zip(chunk, results):
+            regions[i] = result_regions(result, images[i])
+            artifact_cache.put(keys[i], regions[i])
+
+    return regions
+
+
+@stage("detect_images")
+def detect_images(image, model):
+    return detect_images_batch([image], model)[0]
+
+
+@stage("detect_qr_codes")
+@cached_artifact("pyzbar", "1")
 def detect_qr_codes(image):
     if len(image.shape) == 3:
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -419,6 +492,8 @@ def detect_qr_codes(image):
     return qr_regions
 
 
+@stage("detect_signatures")
+@cached_artifact("signature-contours", "1")
 def detect_signatures(image):
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     blurred = cv2.GaussianBlur(gray, (5, 5), 0)
@@ -437,25 +512,13 @@ def detect_signatures(image):
     return signature_regions
 
 
+@stage("draw_redaction_boxes")
 def draw_redaction_boxes(image, regions, mode="black"):
-    mask = np.zeros(image.shape[:2], dtype=np.uint8)
-
-    for x, y, w, h in regions:
-        cv2.rectangle(mask, (x, y), (x + w, y + h), 255, -1)
-
-    if mode == "black":
-        image[mask > 0] = [0, 0, 0]
-    elif mode == "white":
-        image[mask > 0] = [255, 255, 255]
-    elif mode == "blur":
-        blurred = cv2.GaussianBlur(image, (21, 21), 0)
-        image = np.where(mask[:, :, None] > 0, blurred, image)
-    else:
-        raise ValueError("Invalid mode. Choose 'black', 'white', or 'blur'.")
-
-    return image
+    boxes = [(x, y, x + w, y + h) for x, y, w, h in regions]
+    return redact_regions(image, boxes, mode)
 
 
+@stage("find_sensitive_data_cust")
 def find_sensitive_data_cust(text, prompt):
     prompt = (
         "You are an advanced, highly adaptable text analysis tool. "
@@ -497,44 +560,35 @@ def find_sensitive_data_cust(text, prompt):
         logging.error(f"Error in Gemini API call: {e}")
         return []
 
-    sensitive_data = []
-    for entity in entities:
-        item_text = entity["text"]
-        if len(item_text) <= 1:
-            logging.warning(f"Skipping single character: {item_text}")
-            continue
-        if item_text.lower() in [
-            "the",
-            "a",
-            "an",
-            "and",
-            "or",
-            "but",
-            "in",
-            "on",
-            "at",
-            "to",
-            "for",
-        ]:
-            logging.warning(f"Skipping common word: {item_text}")
-            continue
-        start = 0
-        while True:
-            start = text.find(item_text, start)
-            if start == -1:
-                break
-            end = start + len(item_text)
-            sensitive_data.append((item_text, start, end, entity["type"]))
-            start = end
+    sensitive_data = locate_entities(text, entities)
 
+    inc("veilx_entities_total", len(sensitive_data))
     for data in sensitive_data:
         logging.debug(f"Identified sensitive data: {data}")
 
     return sensitive_data
 
 
+@stage("load_image")
+def load_image(source):
+    """BGR image from a path or from the encoded file's bytes."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(source, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(source)
+
+
+@stage("write_image")
+def write_image(image, output_path, image_format=None):
+    """cv2.imwrite, or the encoded bytes in image_format, an extension such as
+    ".jpg", when output_path is None."""
+    if output_path is not None:
+        cv2.imwrite(output_path, image)
+        return None
+    return encode_image(image, image_format)
+
+
 def get_sens(image_path, redaction_level=1):
-    image = cv2.imread(image_path)
+    image = load_image(image_path)
     ocr_data = perform_ocr(image)
     text_content = " ".join(ocr_data["text"])
     sensitive_data = find_sensitive_data(text_content, redaction_level)
@@ -542,13 +596,26 @@ def get_sens(image_path, redaction_level=1):
 
 
 def get_sens_cust(image_path, prompt):
-    image = cv2.imread(image_path)
+    image = load_image(image_path)
     ocr_data = perform_ocr(image)
     text_content = " ".join(ocr_data["text"])
     sensitive_data = find_sensitive_data_cust(text_content, prompt)
     return sensitive_data, ocr_data
 
 
+def redact_text_and_marks(image, ocr_data, sensitive_data, mode, marks):
+    """Everything get_redacted_image does before YOLO: the sensitive text and,
+    with ``marks``, QR codes and signatures."""
+    redacted_image = redact_sensitive_data(image.copy(), ocr_data, sensitive_data, mode)
+    if marks:
+        qr_regions = detect_qr_codes(redacted_image)
+        redacted_image = draw_redaction_boxes(redacted_image, qr_regions, mode)
+
+        signature_regions = detect_signatures(redacted_image)
+        redacted_image = draw_redaction_boxes(redacted_image, signature_regions, mode)
+    return redacted_image
+
+
 def get_redacted_image(
     image_path,
     output_path,
@@ -557,27 +624,29 @@ def get_redacted_image(
     mode="black",
     sensitive_data=None,
     ocr_data=None,
+    image_format=None,
 ):
-    model = YOLO("yolov8n.pt")
-    image = cv2.imread(image_path)
+    model = get_model(model)
+    image = load_image(image_path)
     if ocr_data is None:
         ocr_data = perform_ocr(image)
-    redacted_image = redact_sensitive_data(image.copy(), ocr_data, sensitive_data, mode)
+    redacted_image = redact_text_and_marks(
+        image, ocr_data, sensitive_data, mode, marks=redaction_level > 1
+    )
     if redaction_level > 1:
-        qr_regions = detect_qr_codes(redacted_image)
-        redacted_image = draw_redaction_boxes(redacted_image, qr_regions, mode)
-
-        signature_regions = detect_signatures(redacted_image)
-        redacted_image = draw_redaction_boxes(redacted_image, signature_regions, mode)
-
         image_regions = detect_images(redacted_image, model)
         redacted_image = draw_redaction_boxes(redacted_image, image_regions, mode)
 
-    cv2.imwrite(output_path, redacted_image)
-    logging.info(f"Redacted image saved as {output_path}")
+    data = write_image(redacted_image, output_path, image_format)
+    logging.info(f"Redacted image saved as {output_path or image_format}")
+    return data
 
 
+@stage("sign_image")
 def sign_image(input_path, output_path, txn=None):
+    """Stamp the transaction hash; returns the bytes when output_path is None."""
+    if isinstance(input_path, (bytes, bytearray, memoryview)):
+        input_path = io.BytesIO(input_path)
     with Image.open(input_path) as img:
         draw = ImageDraw.Draw(img)
 
@@ -609,6 +678,10 @@ def sign_image(input_path, output_path, txn=None):
             y = margin
             draw.text((x, y), transaction_hash, font=font, fill=(0, 0, 0))
 
+        if output_path is None:
+            buffer = io.BytesIO()
+            img.save(buffer, format=img.format or "PNG")
+            return buffer.getvalue()
         img.save(output_path)
 
     print(f"Added transaction hash to image. Saved as {output_path}")
@@ -622,31 +695,31 @@ def get_redacted_image_cust(
     mode="black",
     sensitive_data=None,
     ocr_data=None,
+    image_format=None,
 ):
-    model = YOLO("yolov8n.pt")
-    img = cv2.imread(image_path)
+    model = get_model(model)
+    img = load_image(image_path)
     if ocr_data is None:
         ocr_data = perform_ocr(img)
-    redacted_image = redact_sensitive_data(img.copy(), ocr_data, sensitive_data, mode)
+    redacted_image = redact_text_and_marks(
+        img, ocr_data, sensitive_data, mode, marks=image
+    )
     if image:
-        qr_regions = detect_qr_codes(redacted_image)
-        redacted_image = draw_redaction_boxes(redacted_image, qr_regions, mode)
-
-        signature_regions = detect_signatures(redacted_image)
-        redacted_image = draw_redaction_boxes(redacted_image, signature_regions, mode)
-
         image_regions = detect_images(redacted_image, model)
         redacted_image = draw_redaction_boxes(redacted_image, image_regions, mode)
 
-    cv2.imwrite(output_path, redacted_image)
-    logging.info(f"Redacted image saved as {output_path}")
+    data = write_image(redacted_image, output_path, image_format)
+    logging.info(f"Redacted image saved as {output_path or image_format}")
+    return data
 
 
-def annotate(image, sensitive_data):
+@stage("annotate")
+def annotate(image, sensitive_data, ocr_data=None):
     draw = ImageDraw.Draw(image, "RGBA")
     font = ImageFont.load_default()
 
-    ocr_data = perform_ocr(np.array(image))
+    if ocr_data is None:
+        ocr_data = perform_ocr(np.array(image))
 
     for i, word in enumerate(ocr_data["text"]):
         for entity in sensitive_data:
@@ -666,9 +739,9 @@ def save_image(image, path):
     image.save(path)
 
 
-def process_annot(input_path, sensitive_data, output_path):
+def process_annot(input_path, sensitive_data, output_path, ocr_data=None):
     with Image.open(input_path) as img:
-        annotate(img, sensitive_data)
+        annotate(img, sensitive_data, ocr_data)
         save_image(img, output_path)
     logging.info(f"Annotated image saved as {output_path}")
 
@@ -696,7 +769,7 @@ def main(image_path, output_path, model, redaction_level=1, mode="black"):
 
 
 if __name__ == "__main__":
-    model = YOLO("yolov8n.pt")
+    model = get_model("yolov8n.pt")
     input_path = "input.jpg"
     output_path = "output_redacted.jpg"
     main(input_path, output_path, model, redaction_level=2, mode="blur")
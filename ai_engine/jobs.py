@@ -0,0 +1,465 @@
+"""Background job queue for the slow routes.
+
+Jobs live in a SQLite table shared by the web processes and a pool of
+worker processes run by a supervisor process of their own (see supervise()).
+Workers claim the highest-priority queued job, record each stage as it
+starts, and store the route's JSON response (or the path of the output
+file) as the result.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+
+import metrics
+from models import preload
+from workspace import atomic_path, keep_while, open_workspace
+
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "cache/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.2"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_PRELOAD_MODELS = os.getenv("JOB_PRELOAD_MODELS", "yolov8n.pt,paddleocr")
+# A worker exits after this many jobs and is replaced by a fresh fork, which
+# returns whatever memory the jobs fragmented or leaked. 0 never recycles.
+JOB_MAX_JOBS = int(os.getenv("JOB_MAX_JOBS", "0"))
+# A job whose worker died this many times is failed instead of requeued, so
+# a document that crashes the worker cannot take the workers down forever.
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+
+def entity_dicts(sensitive):
+    return [
+        {"text": text, "start": start, "end": end, "type": data_type}
+        for text, start, end, data_type in sensitive
+    ]
+
+
+def run_sensitive(params, progress):
+    from redactv2 import annotate_pdf, get_sensitive
+
+    workspace = open_workspace(params["doc"])
+    try:
+        progress("detect")
+        sensitive = get_sensitive(workspace.input_path, int(params["level"]))
+        progress("annotate")
+        with atomic_path(workspace.file("annotated_")) as tmp:
+            annotate_pdf(
+                workspace.input_path, sensitive, tmp, params.get("save_profile")
+            )
+    finally:
+        workspace.release()
+    return {
+        "doc": workspace.doc,
+        "sensitive": entity_dicts(sensitive),
+        "annotated_pdf": f"/download_annotated/{workspace.doc}",
+    }
+
+
+def run_imgsensv2(params, progress):
+    from img_redactv4 import get_sens as get_sens_v2, process_annot as process_annot_v2
+
+    workspace = open_workspace(params["doc"])
+    try:
+        progress("detect")
+        sensitive, ocr = get_sens_v2(workspace.input_path, int(params["level"]))
+        progress("annotate")
+        with atomic_path(workspace.file("annotated_")) as tmp:
+            process_annot_v2(workspace.input_path, sensitive, tmp, ocr_data=ocr)
+    finally:
+        workspace.release()
+    return {
+        "doc": workspace.doc,
+        "sensitive": entity_dicts(sensitive),
+        "ocr": ocr,
+        "ocr_passes": ocr.get("passes") if ocr else 0,
+        "annotated_img": f"/download_annotated/{workspace.doc}",
+    }
+
+
+def run_redactv2(params, progress):
+    from redactv2 import redactv2
+
+    workspace = open_workspace(params["doc"])
+    try:
+        sens = [
+            (sen["text"], sen["start"], sen["end"], sen["type"])
+            for sen in params["sensitive"]
+        ]
+        progress("redact")
+        out_path = workspace.file("redacted_")
+        with atomic_path(out_path) as tmp:
+            redactv2(
+                workspace.input_path,
+                sens,
+                tmp,
+                int(params["level"]),
+                params["mode"],
+                params.get("save_profile"),
+            )
+    finally:
+        workspace.release()
+    return {"doc": workspace.doc, "file": out_path}
+
+
+def run_redactimgv4(params, progress):
+    from img_redactv4 import get_redacted_image as get_redacted_image_v2
+
+    workspace = open_workspace(params["doc"])
+    try:
+        progress("redact")
+        out_path = workspace.file("redacted_")
+        with atomic_path(out_path) as tmp:
+            get_redacted_image_v2(
+                image_path=workspace.input_path,
+                sensitive_data=params["sensitive"],
+                output_path=tmp,
+                redaction_level=int(params["level"]),
+                mode=params["mode"],
+                ocr_data=params["ocr"],
+            )
+    finally:
+        workspace.release()
+    return {"doc": workspace.doc, "file": out_path}
+
+
+JOB_HANDLERS = {
+    "sensitive": run_sensitive,
+    "imgsensv2": run_imgsensv2,
+    "redactv2": run_redactv2,
+    "redactimgv4": run_redactimgv4,
+}
+
+
+class JobStore:
+    """Jobs table in SQLite; safe to use from any thread or forked process."""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._pid != os.getpid():
+            # SQLite connections must not be shared across fork().
+            self._db = None
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False, isolation_level=None
+            )
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, "
+                "priority INTEGER NOT NULL, status TEXT NOT NULL, stage TEXT, "
+                "stages TEXT NOT NULL, result TEXT, error TEXT, worker INTEGER, "
+                "created REAL NOT NULL, started REAL, finished REAL, "
+                "attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = [row["name"] for row in db.execute("PRAGMA table_info(jobs)")]
+            if "attempts" not in columns:
+                try:
+                    db.execute(
+                        "ALTER TABLE jobs ADD COLUMN "
+                        "attempts INTEGER NOT NULL DEFAULT 0"
+                    )
+                except sqlite3.OperationalError:
+                    # Added by another process in the meantime.
+                    pass
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_queue "
+                "ON jobs (status, priority DESC, created)"
+            )
+            self._db = db
+            self._pid = os.getpid()
+        return self._db
+
+    def submit(self, kind, params, priority=0):
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT INTO jobs "
+                "(id, kind, params, priority, status, stages, created) "
+                "VALUES (?, ?, ?, ?, 'queued', '[]', ?)",
+                (job_id, kind, json.dumps(params), int(priority), now),
+            )
+            db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?",
+                (now - JOB_RESULT_TTL,),
+            )
+        return job_id
+
+    def claim(self):
+        """Mark the next queued job as running for this process and return it."""
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT id, kind, params FROM jobs WHERE status = 'queued' "
+                    "ORDER BY priority DESC, created LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, started = ?, "
+                        "attempts = attempts + 1 WHERE id = ?",
+                        (os.getpid(), time.time(), row["id"]),
+                    )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row["id"], row["kind"], json.loads(row["params"])
+
+    def _stages(self, db, job_id):
+        row = db.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row["stages"]) if row else []
+
+    def _close_stage(self, stages, now):
+        if stages and stages[-1]["finished"] is None:
+            stages[-1]["finished"] = now
+            stages[-1]["seconds"] = round(now - stages[-1]["started"], 3)
+
+    def progress(self, job_id, stage):
+        """Close the current stage of a running job and start ``stage``."""
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            stages = self._stages(db, job_id)
+            self._close_stage(stages, now)
+            stages.append({"name": stage, "started": now, "finished": None})
+            db.execute(
+                "UPDATE jobs SET stage = ?, stages = ? WHERE id = ?",
+                (stage, json.dumps(stages), job_id),
+            )
+
+    def finish(self, job_id, result=None, error=None):
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            stages = self._stages(db, job_id)
+            self._close_stage(stages, now)
+            db.execute(
+                "UPDATE jobs SET status = ?, stage = NULL, stages = ?, result = ?, "
+                "error = ?, finished = ? WHERE id = ?",
+                (
+                    "failed" if error else "done",
+                    json.dumps(stages),
+                    json.dumps(result),
+                    error,
+                    now,
+                    job_id,
+                ),
+            )
+
+    def requeue_orphans(self, workers=None):
+        """Put the running jobs of the dead worker pids ``workers`` (of every
+        worker when None, for a supervisor starting before any of its own)
+        back in the queue, or fail them once they have been tried
+        JOB_MAX_ATTEMPTS times."""
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            rows = db.execute(
+                "SELECT id, worker, attempts FROM jobs WHERE status = 'running'"
+            ).fetchall()
+            orphans = [
+                row for row in rows if workers is None or row["worker"] in workers
+            ]
+            failed = [
+                (f"worker died {row['attempts']} times", now, row["id"])
+                for row in orphans
+                if row["attempts"] >= JOB_MAX_ATTEMPTS
+            ]
+            requeued = [
+                (row["id"],) for row in orphans if row["attempts"] < JOB_MAX_ATTEMPTS
+            ]
+            db.executemany(
+                "UPDATE jobs SET status = 'failed', stage = NULL, error = ?, "
+                "finished = ? WHERE id = ?",
+                failed,
+            )
+            db.executemany(
+                "UPDATE jobs SET status = 'queued', stage = NULL, stages = '[]', "
+                "worker = NULL, started = NULL WHERE id = ?",
+                requeued,
+            )
+        for _, _, job_id in failed:
+            logging.error(f"Job {job_id} failed: its worker died on every attempt")
+        metrics.inc("veilx_jobs_total", len(failed), status="failed")
+        return len(requeued)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["stages"] = json.loads(job["stages"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def active_workspaces(self):
+        """Names of the workspaces of queued and running jobs."""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT params FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchall()
+        docs = (json.loads(row["params"]).get("doc") for row in rows)
+        return {str(doc).partition("/")[0] for doc in docs if doc}
+
+    def queue_stats(self):
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT status, COUNT(*) AS count FROM jobs GROUP BY status"
+            ).fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+
+job_store = JobStore(JOBS_DB_PATH)
+keep_while(job_store.active_workspaces)
+
+
+def run_job(job_id, kind, params):
+    logging.info(f"Job {job_id} ({kind}) started in worker {os.getpid()}")
+    route = f"job:{kind}"
+    token = metrics.set_route(route)
+    started = time.perf_counter()
+    try:
+        result = JOB_HANDLERS[kind](
+            params, lambda stage: job_store.progress(job_id, stage)
+        )
+    except Exception as e:
+        logging.exception(f"Job {job_id} ({kind}) failed")
+        job_store.finish(job_id, error=str(e) or e.__class__.__name__)
+        metrics.inc("veilx_jobs_total", status="failed")
+    else:
+        job_store.finish(job_id, result=result)
+        metrics.inc("veilx_jobs_total", status="done")
+        logging.info(f"Job {job_id} ({kind}) finished")
+    finally:
+        metrics.observe_request(route, time.perf_counter() - started)
+        metrics.reset_route(token)
+        metrics.flush()
+
+
+def worker_loop(max_jobs=JOB_MAX_JOBS):
+    preload(JOB_PRELOAD_MODELS.split(","))
+    done = 0
+    while not max_jobs or done < max_jobs:
+        job = job_store.claim()
+        if job is None:
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+        run_job(*job)
+        done += 1
+    logging.info(f"Job worker {os.getpid()} retiring after {done} jobs")
+
+
+def _worker_main():
+    # The supervisor's handlers only set its own flag.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    worker_loop()
+
+
+def supervise(count=JOB_WORKERS, parent=None):
+    """Run ``count`` job workers and replace those that exit, until SIGTERM or
+    SIGINT, or until the process ``parent`` exits.
+
+    Meant to be the main thread of a process of its own (start_supervisor(),
+    or ``python -m jobs``): it loads the models and then forks the workers
+    with no other thread running, so they share the models' pages and
+    inherit no lock another thread held. As their parent it gets their real
+    exit codes, so only the jobs of a worker that died are requeued.
+    """
+    stopping = []
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stopping.append(True))
+    requeued = job_store.requeue_orphans()
+    metrics.flush()
+    if requeued:
+        logging.info(f"Requeued {requeued} jobs from an earlier run")
+    preload(JOB_PRELOAD_MODELS.split(","))
+    # Not daemonic, so a job can start a process pool of its own.
+    context = multiprocessing.get_context("fork")
+
+    def start():
+        worker = context.Process(target=_worker_main, name="job-worker")
+        worker.start()
+        return worker
+
+    workers = [start() for _ in range(count)]
+    logging.info(f"Started {count} job workers")
+    while not stopping and (parent is None or os.getppid() == parent):
+        time.sleep(1)
+        for i, worker in enumerate(workers):
+            if worker.is_alive():
+                continue
+            worker.join()
+            if worker.exitcode != 0:
+                logging.warning(
+                    f"Job worker {worker.pid} died with exit code {worker.exitcode}"
+                )
+                job_store.requeue_orphans({worker.pid})
+                metrics.flush()
+            if not stopping:
+                workers[i] = start()
+
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join(5)
+    # Jobs cut short by the shutdown run again on the next start.
+    job_store.requeue_orphans({worker.pid for worker in workers})
+    metrics.flush()
+    logging.info(f"Stopped {len(workers)} job workers")
+
+
+def start_supervisor(count=JOB_WORKERS):
+    """Start supervise() in a new process and return it, or None for no workers.
+
+    The process is spawned, not forked, so it inherits nothing of the
+    calling process's threads. Stop it with stop_supervisor().
+    """
+    if count <= 0:
+        return None
+    context = multiprocessing.get_context("spawn")
+    process = context.Process(
+        target=supervise, args=(count, os.getpid()), name="job-supervisor"
+    )
+    process.start()
+    logging.info(f"Started the job supervisor, pid {process.pid}")
+    return process
+
+
+def stop_supervisor(process, timeout=10):
+    if process is None:
+        return
+    process.terminate()
+    process.join(timeout)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    supervise()
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm_cache.sqlite3")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_BYTES = int(
+    os.getenv("LLM_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024))
+)
+LLM_CACHE_DISK_BYTES = int(os.getenv("LLM_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def detection_key(template, variant, model, text):
+    text_hash = hashlib.sha256(normalize_text(text).encode()).hexdigest()
+    return hashlib.sha256(
+        json.dumps([template, variant, model, text_hash]).encode()
+    ).hexdigest()
+
+
+class DetectionCache:
+    """Two-tier cache of detector responses: in-memory LRU in front of SQLite."""
+
+    def __init__(self, path, ttl, memory_bytes, disk_bytes):
+        self.path = path
+        self.ttl = ttl
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self):
+        if self._pid != os.getpid():
+            # SQLite connections must not be shared across fork().
+            self._db = None
+        if self._db is None and self.path:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS detections ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                    "created REAL NOT NULL, accessed REAL NOT NULL)"
+                )
+                db.execute(
+                    "CREATE INDEX IF NOT EXISTS detections_accessed "
+                    "ON detections (accessed)"
+                )
+                db.commit()
+                self._db = db
+                self._pid = os.getpid()
+            except sqlite3.Error as e:
+                logging.error(f"LLM cache disabled, cannot open {self.path}: {e}")
+                self.path = None
+        return self._db
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(value)
+                self._drop(key)
+
+            db = self._connect()
+            row = None
+            if db is not None:
+                try:
+                    row = db.execute(
+                        "SELECT value, created FROM detections WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None and now - row[1] > self.ttl:
+                        db.execute("DELETE FROM detections WHERE key = ?", (key,))
+                        db.commit()
+                        row = None
+                    elif row is not None:
+                        db.execute(
+                            "UPDATE detections SET accessed = ? WHERE key = ?",
+                            (now, key),
+                        )
+                        db.commit()
+                except sqlite3.Error as e:
+                    logging.error(f"LLM cache read failed: {e}")
+                    row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.disk_hits += 1
+            self._remember(key, row[1], row[0])
+            return json.loads(row[0])
+
+    def put(self, key, value):
+        now = time.time()
+        data = json.dumps(value)
+        with self._lock:
+            self._remember(key, now, data)
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO detections "
+                    "(key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, data, len(data), now, now),
+                )
+                self._evict_disk(db, now)
+                db.commit()
+            except sqlite3.Error as e:
+                logging.error(f"LLM cache write failed: {e}")
+
+    def _remember(self, key, created, value):
+        self._drop(key)
+        if len(value) > self.memory_bytes:
+            return
+        self._entries[key] = (created, value)
+        self._bytes += len(value)
+        while self._bytes > self.memory_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def _evict_disk(self, db, now):
+        db.execute("DELETE FROM detections WHERE created < ?", (now - self.ttl,))
+        total = db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM detections"
+        ).fetchone()[0]
+        if total <= self.disk_bytes:
+            return
+        target = total - int(self.disk_bytes * 0.9)
+        removed = 0
+        victims = []
+        for key, size in db.execute(
+            "SELECT key, size FROM detections ORDER BY accessed ASC"
+        ).fetchall():
+            if removed >= target:
+                break
+            victims.append((key,))
+            removed += size
+        db.executemany("DELETE FROM detections WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.memory_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "path": self.path,
+                "ttl": self.ttl,
+            }
+            db = self._connect()
+            if db is not None:
+                count, size = db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM detections"
+                ).fetchone()
+                stats["disk_entries"] = count
+                stats["disk_bytes"] = size
+            return stats
+
+
+detection_cache = DetectionCache(
+    LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MEMORY_BYTES, LLM_CACHE_DISK_BYTES
+)
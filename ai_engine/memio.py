@@ -0,0 +1,90 @@
+"""In-memory request I/O.
+
+Uploads up to MEMORY_IO_MAX_BYTES are processed straight from the request
+body and their results are encoded in memory and sent back from a buffer,
+so a one-shot request never touches temp/. Larger uploads, and uploads
+that a later request refers to by their ``doc`` token, still go through a
+workspace on disk.
+"""
+import io
+import mimetypes
+import os
+
+from flask import send_file
+
+from workspace import safe_filename
+
+
+# 0 turns the in-memory path off.
+MEMORY_IO_MAX_BYTES = int(os.getenv("MEMORY_IO_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+def fits_in_memory(size):
+    return 0 < MEMORY_IO_MAX_BYTES and size <= MEMORY_IO_MAX_BYTES
+
+
+def read_upload(upload):
+    """The bytes of a werkzeug upload, or None when it is over the threshold.
+
+    The upload is rewound when it is too large, so it can still be stored
+    in a workspace.
+    """
+    if MEMORY_IO_MAX_BYTES <= 0:
+        return None
+    data = upload.stream.read(MEMORY_IO_MAX_BYTES + 1)
+    if len(data) > MEMORY_IO_MAX_BYTES:
+        upload.stream.seek(0)
+        return None
+    return data
+
+
+def upload_name(upload):
+    """The upload's filename as a workspace would store it."""
+    return safe_filename(upload.filename)
+
+
+def file_fits_in_memory(path):
+    return fits_in_memory(os.path.getsize(path))
+
+
+# Extensions cv2.imencode and cv2.imwrite have an encoder for.
+IMAGE_EXTENSIONS = frozenset(
+    ".bmp .dib .jpeg .jpg .jpe .jp2 .png .webp .pbm .pgm .ppm .pxm .pnm .sr .ras "
+    ".tiff .tif .exr .hdr .pic".split()
+)
+
+
+class UnsupportedImageFormat(ValueError):
+    pass
+
+
+def image_extension(filename):
+    """The extension of filename, which the redacted image is written in."""
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension not in IMAGE_EXTENSIONS:
+        raise UnsupportedImageFormat(
+            f"Cannot write {extension or 'extensionless'} images"
+        )
+    return extension
+
+
+def encode_image(image, extension):
+    """cv2.imencode to bytes, raising UnsupportedImageFormat when it fails."""
+    import cv2
+
+    if extension not in IMAGE_EXTENSIONS:
+        raise UnsupportedImageFormat(f"Cannot write {extension} images")
+    ok, buffer = cv2.imencode(extension, image)
+    if not ok:
+        raise UnsupportedImageFormat(f"Cannot encode the image as {extension}")
+    return buffer.tobytes()
+
+
+def send_bytes(data, download_name):
+    """send_file for a result encoded in memory."""
+    return send_file(
+        io.BytesIO(data),
+        mimetype=mimetypes.guess_type(download_name)[0] or "application/octet-stream",
+        as_attachment=True,
+        download_name=download_name,
+    )
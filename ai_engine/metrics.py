@@ -0,0 +1,343 @@
+"""Per-stage latency histograms and counters in the Prometheus text format.
+
+Pipeline functions are wrapped in ``stage(name)`` spans; each span records
+its duration under the route being served (set by app.py per request and
+by jobs.py per job) and the stage name. Counters record pages, OCR boxes,
+entities and bytes the same way.
+
+Values live in the process that recorded them. With METRICS_DIR set, every
+process writes its values to <METRICS_DIR>/<pid>-<run>.json after each
+request or job, and /metrics adds up all the files, so the numbers cover
+every worker of a pre-fork server (serve.py sets this up) and the job
+workers. The run part keeps a process that reuses a dead one's pid from
+overwriting its file. Each scrape folds the files of processes that have
+exited into exited.json and deletes them: their counts still happened, but
+the directory does not grow with every worker ever started.
+"""
+import bisect
+import contextvars
+import fcntl
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+EXITED_FILE = "exited.json"
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+)
+
+# name: (type, help)
+METRICS = {
+    "veilx_request_seconds": ("histogram", "Request latency by route."),
+    "veilx_stage_seconds": ("histogram", "Pipeline stage latency by route."),
+    "veilx_pages_total": ("counter", "PDF pages processed."),
+    "veilx_ocr_boxes_total": ("counter", "Text boxes returned by OCR."),
+    "veilx_entities_total": ("counter", "Sensitive entities detected."),
+    "veilx_bytes_total": ("counter", "Request and response body bytes."),
+    "veilx_jobs": ("gauge", "Jobs queued or running."),
+    "veilx_jobs_total": ("counter", "Jobs finished, by status."),
+}
+
+_route = contextvars.ContextVar("metrics_route", default="none")
+
+
+def set_route(route):
+    """Attribute the spans and counts that follow to ``route``; returns a token
+    for reset_route()."""
+    return _route.set(route)
+
+
+def reset_route(token):
+    _route.reset(token)
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def _empty_histogram():
+    return {"buckets": [0] * (len(LATENCY_BUCKETS) + 1), "sum": 0.0, "count": 0}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.run = uuid.uuid4().hex[:12]
+        self.counters = {}
+        self.histograms = {}
+
+    def _check_fork(self):
+        # A forked child starts from its parent's values; they are the
+        # parent's to report, not the child's.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.run = uuid.uuid4().hex[:12]
+            self.counters = {}
+            self.histograms = {}
+
+    def file_name(self):
+        with self._lock:
+            self._check_fork()
+            return f"{self._pid}-{self.run}.json"
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._check_fork()
+            key = _key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        with self._lock:
+            self._check_fork()
+            key = _key(name, labels)
+            histogram = self.histograms.setdefault(key, _empty_histogram())
+            histogram["buckets"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                "counters": [
+                    [name, dict(labels), value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                "histograms": [
+                    [name, dict(labels), dict(value, buckets=list(value["buckets"]))]
+                    for (name, labels), value in self.histograms.items()
+                ],
+            }
+
+
+registry = Registry()
+
+
+def inc(name, value=1, **labels):
+    """Add ``value`` to counter ``name`` for the current route."""
+    if value:
+        registry.inc(name, dict(labels, route=_route.get()), value)
+
+
+def observe_request(route, seconds):
+    registry.observe("veilx_request_seconds", {"route": route}, seconds)
+
+
+class stage:
+    """Time a block or, as a decorator, every call of a function:
+
+    with stage("ocr"): ...      or      @stage("perform_ocr")
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registry.observe(
+            "veilx_stage_seconds",
+            {"route": _route.get(), "stage": self.name},
+            time.perf_counter() - self.started,
+        )
+        return False
+
+    def __call__(self, func):
+        name = self.name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def flush():
+    """Write this process's values to METRICS_DIR, if set."""
+    if not METRICS_DIR:
+        return
+    path = os.path.join(METRICS_DIR, registry.file_name())
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logging.error(f"Cannot write metrics to {path}: {e}")
+
+
+def clear_dir(directory=METRICS_DIR):
+    """Remove the files of an earlier server run."""
+    if not directory or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(".json") or name.endswith(".tmp"):
+            try:
+                os.unlink(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _exited(name):
+    """Whether ``name`` is the file of a process that has exited."""
+    pid = name[: -len(".json")].partition("-")[0]
+    return pid.isdigit() and not _alive(int(pid))
+
+
+def _add(counters, histograms, snapshot):
+    for name, labels, value in snapshot["counters"]:
+        key = _key(name, labels)
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, value in snapshot["histograms"]:
+        key = _key(name, labels)
+        total = histograms.setdefault(key, _empty_histogram())
+        for i, bucket in enumerate(value["buckets"]):
+            total["buckets"][i] += bucket
+        total["sum"] += value["sum"]
+        total["count"] += value["count"]
+
+
+def _read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _fold_exited(names):
+    """Add the files in ``names`` to exited.json and delete them."""
+    exited = os.path.join(METRICS_DIR, EXITED_FILE)
+    with open(os.path.join(METRICS_DIR, ".lock"), "w") as lock:
+        # Two scrapes at once must not both add the same file.
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        counters = {}
+        histograms = {}
+        try:
+            _add(counters, histograms, _read(exited))
+        except FileNotFoundError:
+            pass
+        folded = []
+        for name in names:
+            try:
+                _add(counters, histograms, _read(os.path.join(METRICS_DIR, name)))
+                folded.append(name)
+            except (OSError, ValueError):
+                # Folded by another scrape already.
+                continue
+        if not folded:
+            return
+        snapshot = {
+            "counters": [
+                [name, dict(labels), value]
+                for (name, labels), value in counters.items()
+            ],
+            "histograms": [
+                [name, dict(labels), value]
+                for (name, labels), value in histograms.items()
+            ],
+        }
+        with open(exited + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(exited + ".tmp", exited)
+        for name in folded:
+            os.unlink(os.path.join(METRICS_DIR, name))
+
+
+def _snapshots():
+    own = registry.file_name()
+    snapshots = [registry.snapshot()]
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return snapshots
+    names = [name for name in os.listdir(METRICS_DIR) if name.endswith(".json")]
+    dead = [name for name in names if name != EXITED_FILE and _exited(name)]
+    if dead:
+        try:
+            _fold_exited(dead)
+        except (OSError, ValueError) as e:
+            logging.error(f"Cannot fold metrics of exited processes: {e}")
+        names = [name for name in os.listdir(METRICS_DIR) if name.endswith(".json")]
+    for name in names:
+        if name == own:
+            continue
+        try:
+            snapshots.append(_read(os.path.join(METRICS_DIR, name)))
+        except (OSError, ValueError):
+            # Written between listdir and open, or already replaced.
+            continue
+    return snapshots
+
+
+def merged():
+    counters = {}
+    histograms = {}
+    for snapshot in _snapshots():
+        _add(counters, histograms, snapshot)
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def render(gauges=()):
+    """The Prometheus text exposition of every process's values, plus
+    ``gauges``, (name, labels dict, value) triples computed by the caller."""
+    counters, histograms = merged()
+    gauge_values = {_key(name, labels): value for name, labels, value in gauges}
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            for key in sorted(k for k in histograms if k[0] == name):
+                value = histograms[key]
+                cumulative = 0
+                for bound, bucket in zip(LATENCY_BUCKETS + ("+Inf",), value["buckets"]):
+                    cumulative += bucket
+                    labels = _labels(key[1] + (("le", str(bound)),))
+                    lines.append(f"{name}_bucket{labels} {cumulative}")
+                lines.append(f"{name}_sum{_labels(key[1])} {value['sum']:.6f}")
+                lines.append(f"{name}_count{_labels(key[1])} {value['count']}")
+        else:
+            values = counters if kind == "counter" else gauge_values
+            for key in sorted(k for k in values if k[0] == name):
+                lines.append(f"{name}{_labels(key[1])} {values[key]}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,104 @@
+import logging
+import os
+import resource
+import threading
+import time
+
+
+_models = {}
+_stats = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def rss_bytes():
+    """Current resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is the peak, not the current value, but it is the best
+        # portable approximation when /proc is not available.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _load_yolo(weights):
+    from ultralytics import YOLO
+
+    return YOLO(weights)
+
+
+def _load_paddleocr():
+    from paddleocr import PaddleOCR
+
+    return PaddleOCR(use_angle_cls=False, lang="en")
+
+
+def _load_easyocr():
+    import easyocr
+
+    return easyocr.Reader(["en"])
+
+
+LOADERS = {
+    "yolov8n.pt": lambda: _load_yolo("yolov8n.pt"),
+    "yolov5su.pt": lambda: _load_yolo("yolov5su.pt"),
+    "paddleocr": _load_paddleocr,
+    "easyocr": _load_easyocr,
+}
+
+
+def _lock_for(name):
+    with _registry_lock:
+        if name not in _locks:
+            _locks[name] = threading.Lock()
+        return _locks[name]
+
+
+def get_model(name):
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    if name not in LOADERS:
+        if name.endswith(".pt"):
+            LOADERS[name] = lambda: _load_yolo(name)
+        else:
+            raise ValueError(f"Unknown model: {name}")
+
+    with _lock_for(name):
+        model = _models.get(name)
+        if model is not None:
+            return model
+
+        rss_before = rss_bytes()
+        started = time.perf_counter()
+        model = LOADERS[name]()
+        load_time = time.perf_counter() - started
+        rss_delta = rss_bytes() - rss_before
+
+        _models[name] = model
+        _stats[name] = {
+            "load_seconds": round(load_time, 3),
+            "rss_delta_mb": round(rss_delta / (1024 * 1024), 1),
+            "loaded_at": time.time(),
+            "pid": os.getpid(),
+        }
+        logging.info(
+            f"Loaded model {name} in {load_time:.2f}s (+{rss_delta / (1024 * 1024):.1f} MB RSS)"
+        )
+        return model
+
+
+def preload(names=None):
+    for name in names or os.getenv("PRELOAD_MODELS", "").split(","):
+        name = name.strip()
+        if name:
+            get_model(name)
+
+
+def model_stats():
+    return {
+        "models": dict(_stats),
+        "rss_mb": round(rss_bytes() / (1024 * 1024), 1),
+    }
@@ -0,0 +1,127 @@
+import bisect
+
+import fitz
+
+from entity_locator import AUTOMATON_MIN_PATTERNS, EntityLocator, find_each
+
+
+def _normalize(text):
+    return " ".join(text.split()).lower()
+
+
+class PageWordIndex:
+    """Words and boxes of one page, extracted once and joined into a single
+    lower-cased string so many entities can be matched in one pass."""
+
+    def __init__(self, page):
+        self.page = page
+        self.words = page.get_text("words")
+        self._textpage = None
+        self._hits = {}
+        parts = []
+        self.starts = []
+        offset = 0
+        for word in self.words:
+            text = word[4]
+            lowered = text.lower()
+            # Keep offsets aligned when lower() changes the length.
+            parts.append(lowered if len(lowered) == len(text) else text)
+            self.starts.append(offset)
+            offset += len(text) + 1
+        self.text = " ".join(parts)
+
+    def _glyph_rect(self, i, left, right):
+        """Box of characters left:right of word i, from the glyphs' own boxes.
+
+        Falls back to the whole word when the text layer cannot place them,
+        so a match is never left unredacted.
+        """
+        x0, y0, x1, y1, text = self.words[i][:5]
+        word_rect = fitz.Rect(x0, y0, x1, y1)
+        needle = text[left:right]
+        if needle not in self._hits:
+            if self._textpage is None:
+                self._textpage = self.page.get_textpage()
+            self._hits[needle] = self.page.search_for(
+                needle, textpage=self._textpage
+            )
+        rect = None
+        for hit in self._hits[needle]:
+            overlap = hit & word_rect
+            if not overlap.is_empty:
+                rect = overlap if rect is None else rect | overlap
+        return word_rect if rect is None else rect
+
+    def quads(self, start, end):
+        """Quads covering text[start:end], one per line it spans."""
+        first = bisect.bisect_right(self.starts, start) - 1
+        last = bisect.bisect_right(self.starts, end - 1) - 1
+        quads = []
+        line_key = None
+        rect = None
+        for i in range(first, last + 1):
+            x0, y0, x1, y1, text, block, line, _ = self.words[i]
+            left = max(0, start - self.starts[i])
+            right = min(len(text), end - self.starts[i])
+            if right <= 0:
+                continue
+            if left == 0 and right == len(text):
+                word_rect = fitz.Rect(x0, y0, x1, y1)
+            else:
+                word_rect = self._glyph_rect(i, left, right)
+            if (block, line) == line_key:
+                rect |= word_rect
+            else:
+                if rect is not None:
+                    quads.append(rect.quad)
+                rect = word_rect
+                line_key = (block, line)
+        if rect is not None:
+            quads.append(rect.quad)
+        return quads
+
+
+class EntityMatcher:
+    """Match a fixed set of entities against many pages.
+
+    Built once per document from (text, start, end, type) tuples; each
+    distinct entity text is searched once per page regardless of how many
+    tuples carry it. With ``split_words`` every word of an entity is also
+    searched on its own, as the v1 redactor does.
+    """
+
+    def __init__(self, sensitive_data, split_words=False):
+        self.entries = []
+        self.patterns = []
+        seen = set()
+        for data, start, end, data_type in sensitive_data:
+            candidates = [data] + (data.split() if split_words else [])
+            for candidate in candidates:
+                pattern = _normalize(candidate)
+                if pattern and pattern not in seen:
+                    seen.add(pattern)
+                    self.patterns.append(pattern)
+                    self.entries.append((candidate, data_type))
+        self._locator = None
+        if len(self.patterns) >= AUTOMATON_MIN_PATTERNS:
+            self._locator = EntityLocator(self.patterns)
+
+    def _find(self, text):
+        if self._locator is not None:
+            return self._locator.find_non_overlapping(text)
+        return find_each(text, self.patterns)
+
+    def page_matches(self, page, index=None):
+        """Yield (entity_text, entity_type, quads) for entities found on page."""
+        if not self.patterns:
+            return
+        index = index or PageWordIndex(page)
+        for (data, data_type), occurrences in zip(
+            self.entries, self._find(index.text)
+        ):
+            if not occurrences:
+                continue
+            quads = []
+            for start, end in occurrences:
+                quads.extend(index.quads(start, end))
+            yield data, data_type, quads
@@ -0,0 +1,177 @@
+"""Local rules for the identifiers levels 1 and 2 redact.
+
+Aadhaar (Verhoeff checksum), PAN, IFSC, card (Luhn checksum), phone, email,
+passport and vehicle registration numbers are matched with patterns
+compiled at import. scan_pii() returns the confident matches as the usual
+(text, start, end, type) tuples, and separately the candidates a rule could
+not settle: a checksum that fails, a passport-shaped code without the word
+passport nearby, or a value after a "DL No" / "A/c No" style label that no
+rule recognises. Only those need an LLM.
+"""
+import os
+import re
+
+
+# Levels 1-2 are answered by these rules, with the LLM only consulted about
+# the candidates they cannot settle. 0 sends every level to the LLM.
+RULES_FAST_PATH = os.getenv("RULES_FAST_PATH", "1") == "1"
+
+_VERHOEFF_D = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9),
+    (1, 2, 3, 4, 0, 6, 7, 8, 9, 5),
+    (2, 3, 4, 0, 1, 7, 8, 9, 5, 6),
+    (3, 4, 0, 1, 2, 8, 9, 5, 6, 7),
+    (4, 0, 1, 2, 3, 9, 5, 6, 7, 8),
+    (5, 9, 8, 7, 6, 0, 4, 3, 2, 1),
+    (6, 5, 9, 8, 7, 1, 0, 4, 3, 2),
+    (7, 6, 5, 9, 8, 2, 1, 0, 4, 3),
+    (8, 7, 6, 5, 9, 3, 2, 1, 0, 4),
+    (9, 8, 7, 6, 5, 4, 3, 2, 1, 0),
+)
+_VERHOEFF_P = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9),
+    (1, 5, 7, 6, 2, 8, 3, 0, 9, 4),
+    (5, 8, 0, 3, 7, 9, 6, 1, 4, 2),
+    (8, 9, 1, 6, 0, 4, 3, 5, 2, 7),
+    (9, 4, 5, 3, 1, 2, 6, 8, 7, 0),
+    (4, 2, 8, 6, 5, 7, 3, 9, 0, 1),
+    (2, 7, 9, 3, 8, 0, 6, 4, 1, 5),
+    (7, 0, 4, 6, 9, 1, 3, 2, 5, 8),
+)
+
+VEHICLE_STATE_CODES = frozenset(
+    "AN AP AR AS BR CG CH DD DL DN GA GJ HP HR JH JK KA KL LA LD MH ML MN MP "
+    "MZ NL OD OR PB PY RJ SK TN TR TS UA UK UP WB".split()
+)
+
+AADHAAR_PATTERN = re.compile(r"(?<![\d-])[2-9]\d{3}([ -]?)\d{4}\1\d{4}(?![\d-])")
+PAN_PATTERN = re.compile(r"\b[A-Z]{3}[ABCFGHJLPT][A-Z]\d{4}[A-Z]\b")
+IFSC_PATTERN = re.compile(r"\b[A-Z]{4}0[A-Z0-9]{6}\b")
+# Unbroken, or in the 4-4-4-4 / 4-6-5 groups cards are printed in.
+CARD_PATTERN = re.compile(
+    r"(?<![\d-])(?:\d{13,19}|\d{4}([ -])\d{4,6}\1\d{4,5}(?:\1\d{1,4})?)(?![\d-])"
+)
+PHONE_PATTERN = re.compile(r"(?<![\w+])(?:\+91[ -]?|0)?[6-9]\d{4}[ -]?\d{5}(?!\d)")
+EMAIL_PATTERN = re.compile(
+    r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}\b"
+)
+PASSPORT_PATTERN = re.compile(r"\b[A-PR-WY][1-9]\d ?\d{4}[1-9]\b")
+VEHICLE_PATTERN = re.compile(
+    r"\b(?:([A-Z]{2})[ -]?\d{1,2}[ -]?(?:[A-Z]{1,3}[ -]?)?\d{4}"
+    r"|\d{2} ?BH ?\d{4} ?[A-Z]{1,2})\b"
+)
+PASSPORT_CONTEXT = re.compile(r"passport", re.IGNORECASE)
+# A value after a label the rules have no pattern for, e.g. "DL No: ...".
+LABELLED_ID_PATTERN = re.compile(
+    r"\b(?i:driving\s+licen[cs]e|licen[cs]e|D\.?L\.?|a/c|account|acct|roll|"
+    r"registration|reg|employee|emp|voter|epic)\s*(?i:no\.?|number|id|#)?\s*[:.\-]?"
+    r"\s*([A-Z0-9]+(?:[ /-][A-Z0-9]+){0,3})"
+)
+CONTEXT_CHARS = 40
+
+
+def verhoeff_valid(digits):
+    check = 0
+    for i, digit in enumerate(reversed(digits)):
+        check = _VERHOEFF_D[check][_VERHOEFF_P[i % 8][int(digit)]]
+    return check == 0
+
+
+def luhn_valid(digits):
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if i % 2:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return total % 10 == 0
+
+
+def _digits(text):
+    return re.sub(r"\D", "", text)
+
+
+def _aadhaar(match, text):
+    return verhoeff_valid(_digits(match.group()))
+
+
+def _card(match, text):
+    digits = _digits(match.group())
+    if len(digits) < 13:
+        return None
+    return luhn_valid(digits)
+
+
+def _passport(match, text):
+    before = text[max(0, match.start() - CONTEXT_CHARS) : match.start()]
+    return PASSPORT_CONTEXT.search(before) is not None
+
+
+def _vehicle(match, text):
+    state = match.group(1)
+    # state is None for the BH series, which has no state code.
+    if state is None or state in VEHICLE_STATE_CODES:
+        return True
+    return None
+
+
+# (type, pattern, check) in priority order: a span claimed by an earlier rule
+# is not matched again by a later one. check(match, text) returns True for a
+# confident match, False for a candidate the LLM should look at, and None to
+# drop the match.
+RULES = (
+    ("Email Address", EMAIL_PATTERN, None),
+    ("Card Number", CARD_PATTERN, _card),
+    ("Aadhaar Number", AADHAAR_PATTERN, _aadhaar),
+    ("Phone Number", PHONE_PATTERN, None),
+    ("PAN Number", PAN_PATTERN, None),
+    ("IFSC Code", IFSC_PATTERN, None),
+    ("Passport Number", PASSPORT_PATTERN, _passport),
+    ("Vehicle Registration Number", VEHICLE_PATTERN, _vehicle),
+)
+
+
+def _overlaps(spans, start, end):
+    return any(start < s_end and s_start < end for s_start, s_end in spans)
+
+
+def scan_pii(text):
+    """Return (found, uncertain) lists of (text, start, end, type) tuples."""
+    found = []
+    uncertain = []
+    claimed = []
+    for data_type, pattern, check in RULES:
+        for match in pattern.finditer(text):
+            start, end = match.span()
+            if _overlaps(claimed, start, end):
+                continue
+            confident = True if check is None else check(match, text)
+            if confident is None:
+                continue
+            item = (match.group(), start, end, data_type)
+            (found if confident else uncertain).append(item)
+            claimed.append((start, end))
+
+    for match in LABELLED_ID_PATTERN.finditer(text):
+        value = match.group(1)
+        start, end = match.span(1)
+        if len(value) < 5 or not any(ch.isdigit() for ch in value):
+            continue
+        if not _overlaps(claimed, start, end):
+            uncertain.append((value, start, end, "Potential Identifier"))
+            claimed.append((start, end))
+    return found, uncertain
+
+
+def candidate_context(text, candidates, radius=80):
+    """The text around each candidate, merged and joined, to send to the LLM."""
+    windows = []
+    for _, start, end, _ in sorted(candidates, key=lambda item: item[1]):
+        start, end = max(0, start - radius), min(len(text), end + radius)
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+    return "\n...\n".join(text[start:end] for start, end in windows)
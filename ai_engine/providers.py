@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+import threading
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from detector_backends import get_backend
+
+load_dotenv()
+
+API_KEY = os.getenv("API_KEY")
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+JABIR_URL = os.getenv("JABIR_URL", "https://api.jabirproject.org/generate")
+GROQ_MODEL = "llama-3.1-70b-versatile"
+GEMINI_MODEL = "gemini-pro"
+# Point the SDKs somewhere else, e.g. at benchmarks/stub_llm.py.
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT") or None
+
+PROVIDER_CONNECT_TIMEOUT = float(os.getenv("PROVIDER_CONNECT_TIMEOUT", "5"))
+PROVIDER_READ_TIMEOUT = float(os.getenv("PROVIDER_READ_TIMEOUT", "90"))
+PROVIDER_POOL_SIZE = int(os.getenv("PROVIDER_POOL_SIZE", "16"))
+PROVIDER_MAX_CONCURRENCY = int(os.getenv("PROVIDER_MAX_CONCURRENCY", "8"))
+
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_NONE",
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_NONE",
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_NONE",
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_NONE",
+    },
+]
+
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+
+
+def _client(name, factory):
+    # Connection pools are per process; a forked worker builds its own.
+    global _clients_pid
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _clients_pid = os.getpid()
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
+
+
+def _make_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=PROVIDER_POOL_SIZE, pool_maxsize=PROVIDER_POOL_SIZE
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Content-Type": "application/json", "apiKey": API_KEY})
+    return session
+
+
+def get_session():
+    return _client("session", _make_session)
+
+
+# The SDKs are imported on first use; together they add seconds and tens of
+# MB to the start of a process that may never call them.
+def _make_groq_client():
+    from groq import Groq
+
+    return Groq(
+        api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL, timeout=PROVIDER_READ_TIMEOUT
+    )
+
+
+def _make_gemini_model():
+    import google.generativeai as genai
+
+    if GEMINI_API_ENDPOINT:
+        genai.configure(
+            api_key=GOOGLE_API_KEY,
+            transport="rest",
+            client_options={"api_endpoint": GEMINI_API_ENDPOINT},
+        )
+    else:
+        genai.configure(api_key=GOOGLE_API_KEY)
+    return genai.GenerativeModel(GEMINI_MODEL)
+
+
+def get_groq_client():
+    return _client("groq", _make_groq_client)
+
+
+def get_gemini_model():
+    return _client("gemini", _make_gemini_model)
+
+
+def jabir_generate(prompt, timeout=None):
+    """Return the Jabir completion text for prompt, or None if the call failed."""
+    return get_backend().generate("jabir", prompt, lambda: _jabir_call(prompt, timeout))
+
+
+def _jabir_call(prompt, timeout):
+    data = {"messages": [{"role": "user", "content": prompt}]}
+    try:
+        response = get_session().post(
+            JABIR_URL,
+            json=data,
+            timeout=timeout or (PROVIDER_CONNECT_TIMEOUT, PROVIDER_READ_TIMEOUT),
+        )
+    except Exception as e:
+        logging.error(f"Error in Jabir API call: {e}")
+        return None
+
+    if response.status_code != 200:
+        logging.error(
+            f"Error in Jabir API call: {response.status_code} - {response.text}"
+        )
+        return None
+
+    try:
+        return response.json().get("result", {}).get("content", "")
+    except ValueError as e:
+        logging.error(f"Error in Jabir API call: invalid response body: {e}")
+        return None
+
+
+def groq_generate(prompt):
+    return get_backend().generate("groq", prompt, lambda: _groq_call(prompt))
+
+
+def _groq_call(prompt):
+    try:
+        response = get_groq_client().chat.completions.create(
+            messages=[{"role": "user", "content": prompt}], model=GROQ_MODEL
+        )
+        return response.choices[0].message.content
+    except Exception as e:
+        logging.error(f"Error in GROQ API call: {str(e)}")
+        return None
+
+
+def gemini_generate(prompt):
+    return get_backend().generate("gemini", prompt, lambda: _gemini_call(prompt))
+
+
+def _gemini_call(prompt):
+    try:
+        response = get_gemini_model().generate_content(
+            prompt,
+            safety_settings=SAFETY_SETTINGS,
+            request_options={"timeout": PROVIDER_READ_TIMEOUT},
+        )
+        return response.text
+    except Exception as e:
+        logging.error(f"Error in Gemini API call: {str(e)}")
+        return None
+
+
+def llm_generate(prompt):
+    """Groq first, falling back to Gemini."""
+    response = groq_generate(prompt)
+    if response is not None:
+        print("USING GROQ")
+        return response
+    logging.error("Fallback to Gemini Pro")
+    return gemini_generate(prompt)
+
+
+async def agenerate(prompt, generate=llm_generate):
+    return await asyncio.to_thread(generate, prompt)
+
+
+async def gather_calls(func, items, concurrency=PROVIDER_MAX_CONCURRENCY):
+    """Run func(item) for every item with at most ``concurrency`` in flight.
+
+    Results keep the order of items; a call that raised yields its exception.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(item):
+        async with semaphore:
+            return await asyncio.to_thread(func, item)
+
+    return await asyncio.gather(
+        *(call(item) for item in items), return_exceptions=True
+    )
+
+
+def run_concurrently(func, items, concurrency=PROVIDER_MAX_CONCURRENCY):
+    return asyncio.run(gather_calls(func, items, concurrency))
@@ -1,12 +1,12 @@
 import fitz
 import json
-import requests
 import re
 import logging
-import google.generativeai as genai
 import ast
 from dotenv import load_dotenv
 import os
+from pdf_matcher import EntityMatcher
+from providers import gemini_generate, jabir_generate
 
 load_dotenv()
 
@@ -17,11 +17,12 @@ logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-genai.configure(api_key=GOOGLE_API_KEY)
-
 
 def extract_text_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
+    if isinstance(pdf_path, (bytes, bytearray, memoryview)):
+        doc = fitz.open(stream=pdf_path, filetype="pdf")
+    else:
+        doc = fitz.open(pdf_path)
     text = ""
     for page_num in range(doc.page_count):
         page = doc[page_num]
@@ -49,31 +50,7 @@ def extract_json(response_text):
 
 
 def get_gemini_response(prompt):
-    try:
-        model = genai.GenerativeModel("gemini-pro")
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_NONE",
-            },
-        ]
-        response = model.generate_content(prompt, safety_settings=safety_settings)
-        return response.text
-    except Exception as e:
-        logging.error(f"Error in Gemini API call: {str(e)}")
-        return None
+    return gemini_generate(prompt)
 
 
 def find_sensitive_data(text):
@@ -109,26 +86,14 @@ def find_sensitive_data(text):
         f"Text to analyze:\n{text}"
     )
 
-    data = {"messages": [{"role": "user", "content": prompt}]}
-
-    headers = {"Content-Type": "application/json", "apiKey": API_KEY}
-
-    response = requests.post(
-        "https://api.jabirproject.org/generate", json=data, headers=headers
-    )
-    if response.status_code == 200:
-        entities_json = response.json().get("result", {}).get("content", "")
+    entities = None
+    entities_json = jabir_generate(prompt)
+    if entities_json is not None:
         print(entities_json)
         try:
             entities = json.loads(entities_json)
         except json.JSONDecodeError:
             logging.error("Error: Unable to parse JSON response from Jabir API")
-            entities = None
-    else:
-        logging.error(
-            f"Error in Jabir API call: {response.status_code} - {response.text}"
-        )
-        entities = None
 
     if entities is None:
         logging.info("Falling back to Gemini Pro API")
@@ -194,25 +159,18 @@ def find_sensitive_data(text):
 
 
 def redact_text_in_pdf(pdf_doc, sensitive_data):
+    # Matching every word of each entity as well keeps the v1 behaviour of
+    # redacting partial mentions such as a first name on its own.
+    matcher = EntityMatcher(sensitive_data, split_words=True)
     for page_num in range(pdf_doc.page_count):
         page = pdf_doc[page_num]
-        for data, start, end, data_type in sensitive_data:
-            instances = page.search_for(data, quads=True)
-            for inst in instances:
+        for data, data_type, quads in matcher.page_matches(page):
+            for inst in quads:
                 logging.info(
-                    f"Redacting full text on page {page_num + 1}: {data} ({data_type})"
+                    f"Redacting text on page {page_num + 1}: {data} ({data_type})"
                 )
                 page.add_redact_annot(inst, fill=(1, 1, 1))
 
-            words = data.split()
-            for word in words:
-                word_instances = page.search_for(word, quads=True)
-                for word_inst in word_instances:
-                    logging.info(
-                        f"Redacting word on page {page_num + 1}: {word} ({data_type})"
-                    )
-                    page.add_redact_annot(word_inst, fill=(1, 1, 1))
-
         page.apply_redactions()
 
 
@@ -230,6 +188,10 @@ def redact_images_in_pdf(pdf_doc):
 
 
 def save_redacted_pdf(pdf_doc, output_path):
+    if output_path is None:
+        data = pdf_doc.tobytes(garbage=4, deflate=True, clean=True)
+        pdf_doc.close()
+        return data
     pdf_doc.save(output_path, garbage=4, deflate=True, clean=True)
     pdf_doc.close()
 
@@ -239,8 +201,9 @@ def redact(input_pdf, output_pdf):
     sensitive_data = find_sensitive_data(text)
     redact_text_in_pdf(pdf_doc, sensitive_data)
     redact_images_in_pdf(pdf_doc)
-    save_redacted_pdf(pdf_doc, output_pdf)
-    logging.info(f"Redacted PDF saved as {output_pdf}")
+    data = save_redacted_pdf(pdf_doc, output_pdf)
+    logging.info(f"Redacted PDF saved as {output_pdf or 'bytes'}")
+    return data
 
 
 if __name__ == "__main__":
@@ -1,33 +1,93 @@
 import fitz
 import json
-import requests
 import re
 import logging
-import google.generativeai as genai
 import ast
 from dotenv import load_dotenv
 import hashlib
 import os
 import fitz
 import random
-from groq import Groq
+import bisect
+import gc
+import multiprocessing
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from entity_locator import locate_entities
+from pdf_matcher import EntityMatcher
+from pii_rules import RULES_FAST_PATH, candidate_context, scan_pii
+from llm_cache import detection_cache, detection_key
+from metrics import inc, stage
+from models import rss_bytes
+from providers import (
+    GEMINI_MODEL,
+    GROQ_MODEL,
+    gemini_generate,
+    jabir_generate,
+    llm_generate,
+    run_concurrently,
+)
 
 load_dotenv()
 
-API_KEY = os.getenv("API_KEY")
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Part of every detection cache key; bump when a prompt template changes.
+DETECTOR_CHAIN = f"jabir|groq:{GROQ_MODEL}|{GEMINI_MODEL}"
+LLM_CHAIN = f"groq:{GROQ_MODEL}|{GEMINI_MODEL}"
+PROMPT_VERSION = "1"
+
+LLM_CHUNK_CHARS = int(os.getenv("LLM_CHUNK_CHARS", "12000"))
+LLM_CHUNK_OVERLAP = int(os.getenv("LLM_CHUNK_OVERLAP", "300"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+# Documents with at least this many pages are redacted by a process pool.
+PARALLEL_MIN_PAGES = int(os.getenv("PARALLEL_MIN_PAGES", "64"))
+PARALLEL_WORKERS = int(
+    os.getenv("PARALLEL_WORKERS", str(min(os.cpu_count() or 1, 8)))
+)
+# Not fork: the web and job processes run threads, and a forked child can
+# inherit a lock one of them held. forkserver and spawn re-import __main__
+# as __mp_main__, which app.py's start-up code skips.
+PARALLEL_START_METHOD = os.getenv("PARALLEL_START_METHOD", "forkserver")
+
+# Documents with at least this many pages are redacted window by window.
+STREAM_MIN_PAGES = int(os.getenv("STREAM_MIN_PAGES", "1000"))
+STREAM_MEMORY_BUDGET_MB = int(os.getenv("STREAM_MEMORY_BUDGET_MB", "512"))
+STREAM_WINDOW_PAGES = int(os.getenv("STREAM_WINDOW_PAGES", "50"))
+
+# fitz save options by profile. "fast" writes objects as they are, for
+# throwaway previews; "balanced" drops unused objects and compresses new
+# streams; "archival" also merges duplicates and cleans content streams.
+SAVE_PROFILES = {
+    "fast": {"garbage": 0, "deflate": False},
+    "balanced": {"garbage": 1, "deflate": True},
+    "archival": {"garbage": 4, "deflate": True, "clean": True},
+}
+REDACTED_SAVE_PROFILE = os.getenv("REDACTED_SAVE_PROFILE", "archival")
+ANNOTATED_SAVE_PROFILE = os.getenv("ANNOTATED_SAVE_PROFILE", "fast")
 
 
 logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-genai.configure(api_key=GOOGLE_API_KEY)
+
+def open_pdf(source):
+    """Open a PDF from a path or from its bytes."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
 
 
+@stage("add_txn")
 def add_txn(input_pdf, output_pdf, txn=None):
-    doc = fitz.open(input_pdf)
+    """Stamp every page with the transaction hash.
+
+    With output_pdf None the stamped PDF is returned as bytes.
+    """
+    doc = open_pdf(input_pdf)
 
     if txn:
         transaction_hash = f"Signed using hash: {txn}"
@@ -47,21 +107,88 @@ def add_txn(input_pdf, output_pdf, txn=None):
 
         page.insert_text((x, y), transaction_hash, fontsize=font_size, color=(0, 0, 0))
 
+    if output_pdf is None:
+        data = doc.tobytes()
+        doc.close()
+        return data
     doc.save(output_pdf)
     doc.close()
 
     print(f"Added transaction hash to PDF. Saved as {output_pdf}")
 
 
+@stage("extract_pages_from_pdf")
+def extract_pages_from_pdf(pdf_path):
+    """Return (text, page_offsets, doc).
+
+    page_offsets has page_count + 1 entries; page i covers
+    text[page_offsets[i]:page_offsets[i + 1]].
+    """
+    doc = open_pdf(pdf_path)
+    pages = [page.get_text() for page in doc]
+    inc("veilx_pages_total", len(pages), stage="extract")
+    page_offsets = [0]
+    for page_text in pages:
+        page_offsets.append(page_offsets[-1] + len(page_text))
+    return "".join(pages), page_offsets, doc
+
+
 def extract_text_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page_num in range(doc.page_count):
-        page = doc[page_num]
-        text += page.get_text()
+    text, page_offsets, doc = extract_pages_from_pdf(pdf_path)
     return text, doc
 
 
+def _page_index_path(pdf_path):
+    return f"{pdf_path}.pages.json"
+
+
+def save_page_offsets(pdf_path, page_offsets):
+    """Store the page-offset table next to an upload for the later redact call."""
+    stat = os.stat(pdf_path)
+    with open(_page_index_path(pdf_path), "w") as f:
+        json.dump(
+            {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "offsets": page_offsets,
+            },
+            f,
+        )
+
+
+def load_page_offsets(pdf_path):
+    """The stored page-offset table, or None if missing or stale."""
+    if not isinstance(pdf_path, str):
+        return None
+    try:
+        stat = os.stat(pdf_path)
+        with open(_page_index_path(pdf_path)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("size") != stat.st_size or index.get("mtime_ns") != stat.st_mtime_ns:
+        return None
+    return index.get("offsets")
+
+
+def entity_pages(sensitive_data, page_offsets, page_count):
+    """Pages holding an entity occurrence, or None if any cannot be placed."""
+    if not page_offsets or len(page_offsets) != page_count + 1:
+        return None
+    total = page_offsets[-1]
+    pages = set()
+    for data, start, end, data_type in sensitive_data:
+        try:
+            if not 0 <= start < end <= total:
+                return None
+        except TypeError:
+            return None
+        first = bisect.bisect_right(page_offsets, start) - 1
+        last = bisect.bisect_right(page_offsets, end - 1) - 1
+        pages.update(range(first, last + 1))
+    return pages
+
+
 def extract_json(response_text):
     try:
         json_data = json.loads(response_text)
@@ -82,49 +209,42 @@ def extract_json(response_text):
 
 
 def get_gemini_response(prompt):
-    try:
-        client = Groq(api_key=GROQ_API_KEY)
-        messages = [{"role": "user", "content": prompt}]
-        response = client.chat.completions.create(
-            messages=messages,
-            model="llama-3.1-70b-versatile"
-        )
-        print("USING GROQ")
-        return response.choices[0].message.content
-    except Exception as e:
-        logging.error(f"Error in GROQ API call: {str(e)}\nFallback to Gemini Pro")
-        return get_gemini_response2(prompt)
+    return llm_generate(prompt)
 
 
 def get_gemini_response2(prompt):
-    try:
-        model = genai.GenerativeModel("gemini-pro")
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_NONE",
-            },
-        ]
-        response = model.generate_content(prompt, safety_settings=safety_settings)
-        return response.text
-    except Exception as e:
-        logging.error(f"Error in Gemini API call: {str(e)}")
-        return None
+    return gemini_generate(prompt)
 
 
-def find_sensitive_data(text, level):
+def request_entities(prompt):
+    entities = None
+    entities_json = jabir_generate(prompt)
+    if entities_json is not None:
+        print(entities_json)
+        try:
+            entities = json.loads(entities_json)
+        except json.JSONDecodeError:
+            logging.error("Error: Unable to parse JSON response from Jabir API")
+
+    if entities is None:
+        logging.info("Falling back to Gemini Pro API")
+        # print("prompt: ", prompt)
+        gemini_response = get_gemini_response(prompt)
+        print(gemini_response)
+        if gemini_response:
+            try:
+                entities = extract_json(gemini_response)
+            except Exception:
+                logging.error("Error: Unable to parse JSON response from Gemini API")
+                entities = None
+        else:
+            logging.error("Both Jabir and Gemini API calls failed")
+
+    return entities
+
+
+@stage("detect_entities")
+def detect_entities(text, level):
     # print("Level: ", level, level==1, type(level), int(level)==1)
     if level == 1 or level == 2:
         prompt = (
@@ -223,74 +343,25 @@ def find_sensitive_data(text, level):
             f"Text to analyze:\n{text}"
         )
 
-    data = {"messages": [{"role": "user", "content": prompt}]}
-
-    headers = {"Content-Type": "application/json", "apiKey": API_KEY}
-    try:
-        response = requests.post(
-            "https://api.jabirproject.org/generate", json=data, headers=headers
-        )
-        if response.status_code == 200:
-            entities_json = response.json().get("result", {}).get("content", "")
-            print(entities_json)
-            try:
-                entities = json.loads(entities_json)
-            except json.JSONDecodeError:
-                logging.error("Error: Unable to parse JSON response from Jabir API")
-                entities = None
-        else:
-            logging.error(
-                f"Error in Jabir API call: {response.status_code} - {response.text}"
-            )
-            entities = None
-    except Exception as e:
-        logging.error(f"Error in Jabir API call: {e}")
-        entities = None
-
+    # Levels 1 and 2 share a prompt, so they share cache entries too.
+    if level == 1 or level == 2:
+        variant = "numbers"
+    elif level == 3:
+        variant = "names_numbers"
+    else:
+        variant = "all"
+    key = detection_key(f"sensitive:{PROMPT_VERSION}", variant, DETECTOR_CHAIN, text)
+    entities = detection_cache.get(key)
     if entities is None:
-        logging.info("Falling back to Gemini Pro API")
-        # print("prompt: ", prompt)
-        gemini_response = get_gemini_response(prompt)
-        print(gemini_response)
-        if gemini_response:
-            try:
-                entities = extract_json(gemini_response)
-            except Exception:
-                logging.error("Error: Unable to parse JSON response from Gemini API")
-                entities = []
-        else:
-            logging.error("Both Jabir and Gemini API calls failed")
-            entities = []
+        entities = request_entities(prompt)
+        if entities is not None:
+            detection_cache.put(key, entities)
+    return entities
 
-    sensitive_data = []
-    for entity in entities:
-        item_text = entity["text"]
-        if len(item_text) <= 1:
-            logging.warning(f"Skipping single character: {item_text}")
-            continue
-        if item_text.lower() in [
-            "the",
-            "a",
-            "an",
-            "and",
-            "or",
-            "but",
-            "in",
-            "on",
-            "at",
-            "to",
-            "for",
-        ]:
-            logging.warning(f"Skipping common word: {item_text}")
-            continue
-        start = 0
-        while True:
-            start = text.find(item_text, start)
-            if start == -1:
-                break
-            end = start + len(item_text)
-            sensitive_data.append((item_text, start, end, entity["type"]))
-            start = end
+
+@stage("locate_sensitive_data")
+def locate_sensitive_data(text, entities):
+    sensitive_data = locate_entities(text, entities)
 
     url_pattern = re.compile(
         r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
@@ -313,73 +384,578 @@ def find_sensitive_data(text, level):
     return sensitive_data
 
 
-def redact_text_in_pdf(pdf_doc, sensitive_data, level, mode):
-    fill_colors = {"black": (0, 0, 0), "white": (1, 1, 1), "blur": (0.5, 0.5, 0.5)}
+@stage("find_sensitive_data")
+def find_sensitive_data(text, level):
+    if level in (1, 2) and RULES_FAST_PATH:
+        return find_sensitive_data_rules(text, level)
+    entities = detect_entities(text, level)
+    sensitive_data = locate_sensitive_data(text, entities or [])
+    inc("veilx_entities_total", len(sensitive_data))
+    return sensitive_data
 
-    for page_num in range(pdf_doc.page_count):
-        page = pdf_doc[page_num]
-        for data, start, end, data_type in sensitive_data:
-            instances = page.search_for(data, quads=True)
-            for inst in instances:
-                logging.info(
-                    f"Redacting full text on page {page_num + 1}: {data} ({data_type})"
-                )
-                page.add_redact_annot(inst, fill=fill_colors[mode])
-
-            # words = data.split()
-            # for word in words:
-            #     word_instances = page.search_for(word, quads=True)
-            #     for word_inst in word_instances:
-            #         logging.info(
-            #             f"Redacting word on page {page_num + 1}: {word} ({data_type})"
-            #         )
-            #         page.add_redact_annot(word_inst, fill=fill_colors[mode])
-
-        if level < 2:
-            page.apply_redactions(images=0, graphics=0)
-        else:
-            page.apply_redactions()
 
+def find_sensitive_data_rules(text, level):
+    """Levels 1-2: the local rules, with the LLM asked only about the text
+    around candidates the rules could not settle. The LLM's answer, even an
+    empty one, decides which candidates are redacted; if it could not answer
+    about all of them, every candidate is: if in doubt, include it."""
+    found, uncertain = scan_pii(text)
+    entities = []
+    if uncertain:
+        logging.info(f"Asking the LLM about {len(uncertain)} uncertain candidates")
+        entities, failed = detect_entities_chunked(
+            candidate_context(text, uncertain), level
+        )
+        if failed:
+            logging.warning(
+                f"No LLM answer about some of {len(uncertain)} candidates; "
+                f"redacting them all"
+            )
+            found = found + uncertain
+    else:
+        logging.info(f"Rules found {len(found)} entities; skipping the LLM")
+    sensitive_data = _unique(found + locate_sensitive_data(text, entities))
+    inc("veilx_entities_total", len(sensitive_data))
+    return sensitive_data
 
-def custom_redact_text(pdf_doc, sensitive_data, level, mode):
-    fill_colors = {"black": (0, 0, 0), "white": (1, 1, 1), "blur": (0.5, 0.5, 0.5)}
 
-    for page_num in range(pdf_doc.page_count):
-        page = pdf_doc[page_num]
-        for data, start, end, data_type in sensitive_data:
-            instances = page.search_for(data, quads=True)
-            for inst in instances:
-                logging.info(
-                    f"Redacting full text on page {page_num + 1}: {data} ({data_type})"
-                )
-                page.add_redact_annot(inst, fill=fill_colors[mode])
+def _unique(items):
+    seen = set()
+    unique = []
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            unique.append(item)
+    return unique
+
+
+def _best_cut(text, floor, limit, boundaries):
+    i = bisect.bisect_right(boundaries, limit) - 1
+    if i >= 0 and boundaries[i] > floor:
+        return boundaries[i]
+    for separator in ("\n\n", "\n", " "):
+        cut = text.rfind(separator, floor, limit)
+        if cut != -1:
+            return cut + len(separator)
+    return limit
+
+
+def split_text_into_chunks(
+    text, max_chars=LLM_CHUNK_CHARS, overlap=LLM_CHUNK_OVERLAP, boundaries=()
+):
+    """Split text into (offset, chunk) pairs, preferring page, then paragraph,
+    then line and word boundaries. Consecutive chunks share ``overlap``
+    characters so entities on a cut are still seen whole by one chunk."""
+    if len(text) <= max_chars:
+        return [(0, text)]
+
+    boundaries = sorted(b for b in set(boundaries) if 0 < b < len(text))
+    chunks = []
+    start = 0
+    while True:
+        limit = start + max_chars
+        if limit >= len(text):
+            chunks.append((start, text[start:]))
+            return chunks
+        cut = _best_cut(text, start + max_chars // 2, limit, boundaries)
+        chunks.append((start, text[start:cut]))
+
+        next_start = cut - overlap
+        word_start = max(
+            text.rfind(" ", start, next_start), text.rfind("\n", start, next_start)
+        )
+        if word_start != -1:
+            next_start = word_start + 1
+        start = max(next_start, start + 1)
+
+
+@stage("detect_entities_chunked")
+def detect_entities_chunked(text, level, boundaries=()):
+    """detect_entities over LLM-sized chunks of text.
+
+    Returns (entities, failed): the entities of every chunk that was
+    answered, merged and de-duplicated, and the number of chunks that got
+    no answer.
+    """
+    chunks = split_text_into_chunks(text, boundaries=boundaries)
+    if len(chunks) == 1:
+        entities = detect_entities(text, level)
+        return entities or [], int(entities is None)
+
+    logging.info(
+        f"Detecting entities in {len(chunks)} chunks, {LLM_MAX_CONCURRENCY} at a time"
+    )
+    results = run_concurrently(
+        lambda chunk: detect_entities(chunk, level),
+        [chunk for offset, chunk in chunks],
+        LLM_MAX_CONCURRENCY,
+    )
+    for index, result in enumerate(results):
+        if isinstance(result, Exception):
+            logging.error(f"Entity detection failed for chunk {index}: {result}")
+            results[index] = None
+
+    failed = sum(1 for result in results if result is None)
+    if failed:
+        logging.warning(
+            f"{failed} of {len(chunks)} chunks failed, returning partial results"
+        )
 
-        if level < 2:
-            page.apply_redactions(images=0, graphics=0)
-        else:
-            page.apply_redactions()
+    entities = []
+    seen = set()
+    for result in results:
+        for entity in result or []:
+            try:
+                marker = (entity["text"], entity["type"])
+            except (KeyError, TypeError):
+                continue
+            if marker not in seen:
+                seen.add(marker)
+                entities.append(entity)
+    return entities, failed
+
+
+@stage("find_sensitive_data_chunked")
+def find_sensitive_data_chunked(text, level, boundaries=()):
+    if level in (1, 2) and RULES_FAST_PATH:
+        return find_sensitive_data_rules(text, level)
+    # Entities are located against the whole text, so offsets are global and
+    # an entity found in one chunk is also redacted wherever else it occurs.
+    entities, _ = detect_entities_chunked(text, level, boundaries)
+    sensitive_data = _unique(locate_sensitive_data(text, entities))
+    inc("veilx_entities_total", len(sensitive_data))
+    return sensitive_data
 
 
-def redact_images_in_pdf(pdf_doc, mode):
-    fill_colors = {"black": (0, 0, 0), "white": (1, 1, 1), "blur": (0.5, 0.5, 0.5)}
+FILL_COLORS = {"black": (0, 0, 0), "white": (1, 1, 1), "blur": (0.5, 0.5, 0.5)}
 
-    for page_num in range(pdf_doc.page_count):
-        page = pdf_doc[page_num]
-        image_list = page.get_images(full=True)
-        for img_index, img in enumerate(image_list):
-            xref = img[0]
-            rect = page.get_image_bbox(img)
-            logging.info(f"Redacting image on page {page_num + 1}")
-            page.add_redact_annot(rect, fill=fill_colors[mode])
 
+def add_text_redactions(page, page_num, matcher, mode):
+    count = 0
+    if matcher is None:
+        return count
+    for data, data_type, quads in matcher.page_matches(page):
+        for inst in quads:
+            logging.info(
+                f"Redacting full text on page {page_num + 1}: {data} ({data_type})"
+            )
+            page.add_redact_annot(inst, fill=FILL_COLORS[mode])
+            count += 1
+    return count
+
+
+def add_image_redactions(page, page_num, mode):
+    count = 0
+    for img in page.get_images(full=True):
+        rect = page.get_image_bbox(img)
+        logging.info(f"Redacting image on page {page_num + 1}")
+        page.add_redact_annot(rect, fill=FILL_COLORS[mode])
+        count += 1
+    return count
+
+
+def redact_page(page, page_num, matcher, level, mode, images):
+    """Collect text and image redactions for a page and apply them once."""
+    count = add_text_redactions(page, page_num, matcher, mode)
+    if images:
+        count += add_image_redactions(page, page_num, mode)
+    if not count:
+        return
+    if level < 2:
+        page.apply_redactions(images=0, graphics=0)
+    else:
         page.apply_redactions()
 
 
-def save_redacted_pdf(pdf_doc, output_path):
-    pdf_doc.save(output_path, garbage=4, deflate=True, clean=True)
+def redact_pages(pdf_doc, matcher, pages, level, mode, images, first_page=0):
+    """Redact every page of pdf_doc, which starts at page first_page of the
+    original document; text is only matched on pages listed in ``pages``
+    (all pages when None)."""
+    for page_num in range(pdf_doc.page_count):
+        number = first_page + page_num
+        text = pages is None or number in pages
+        if text or images:
+            page_matcher = matcher if text else None
+            redact_page(pdf_doc[page_num], number, page_matcher, level, mode, images)
+
+
+@stage("redact_pdf_pages")
+def redact_pdf_pages(pdf_doc, sensitive_data, level, mode, images, page_offsets=None):
+    matcher = EntityMatcher(sensitive_data)
+    pages = entity_pages(sensitive_data, page_offsets, pdf_doc.page_count)
+    redact_pages(pdf_doc, matcher, pages, level, mode, images)
+
+
+def save_options(profile):
+    if profile not in SAVE_PROFILES:
+        raise ValueError(f"Unknown save profile: {profile}")
+    return dict(SAVE_PROFILES[profile])
+
+
+@stage("save_redacted_pdf")
+def save_redacted_pdf(pdf_doc, output_path, profile=None):
+    options = save_options(profile or REDACTED_SAVE_PROFILE)
+    # Redacted text and images live on in the replaced, now unreferenced,
+    # objects until garbage collection drops them.
+    options["garbage"] = max(options["garbage"], 1)
+    if output_path is None:
+        data = pdf_doc.tobytes(**options)
+        pdf_doc.close()
+        return data
+    pdf_doc.save(output_path, **options)
     pdf_doc.close()
 
 
+def page_slices(page_count, workers):
+    """Split range(page_count) into at most ``workers`` contiguous slices."""
+    size, extra = divmod(page_count, workers)
+    slices = []
+    start = 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            slices.append((start, end))
+        start = end
+    return slices
+
+
+def redact_page_slice(
+    input_pdf, part_pdf, start, end, sensitive_data, level, mode, images, pages
+):
+    """Pool worker: redact pages [start, end) of input_pdf into part_pdf."""
+    doc = fitz.open(input_pdf)
+    doc.select(list(range(start, end)))
+    matcher = EntityMatcher(sensitive_data)
+    redact_pages(doc, matcher, pages, level, mode, images, first_page=start)
+    # The merged document is garbage-collected and deflated once at the end.
+    doc.save(part_pdf, garbage=1)
+    doc.close()
+    return part_pdf
+
+
+# Catalog entries insert_pdf does not carry into a merged document.
+UNMERGEABLE_CATALOG_KEYS = (
+    "Dests",
+    "Names/Dests",
+    "Names/EmbeddedFiles",
+    "OCProperties",
+    "ViewerPreferences",
+)
+
+
+def merge_loses_structure(doc):
+    """Whether doc has parts insert_pdf does not copy into a merged document
+    and redact_pdf_parallel does not copy back: form fields, named
+    destinations, embedded files, optional content, viewer preferences and
+    links to other pages, which may land in another part. The outline, page
+    labels and page mode are copied."""
+    if doc.is_form_pdf:
+        return True
+    catalog = doc.pdf_catalog()
+    if any(
+        doc.xref_get_key(catalog, key)[0] != "null"
+        for key in UNMERGEABLE_CATALOG_KEYS
+    ):
+        return True
+    for page in doc:
+        for link in page.get_links():
+            if link["kind"] in (fitz.LINK_GOTO, fitz.LINK_NAMED):
+                return True
+    return False
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def page_pool():
+    """This process's pool for redact_page_slice, started on first use."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            context = multiprocessing.get_context(PARALLEL_START_METHOD)
+            if PARALLEL_START_METHOD == "forkserver":
+                # Import fitz and the engine once in the server, not per worker.
+                context.set_forkserver_preload(["__main__", "redactv2"])
+            _pool = ProcessPoolExecutor(
+                max_workers=max(1, PARALLEL_WORKERS), mp_context=context
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@stage("redact_pdf_parallel")
+def redact_pdf_parallel(
+    input_pdf,
+    sensitive_data,
+    output_pdf,
+    level,
+    mode,
+    images,
+    workers,
+    page_offsets=None,
+    save_profile=None,
+):
+    with fitz.open(input_pdf) as doc:
+        page_count = doc.page_count
+        metadata = {
+            key: value
+            for key, value in doc.metadata.items()
+            if key not in ("format", "encryption")
+        }
+        toc = doc.get_toc(simple=False)
+        page_labels = doc.get_page_labels()
+        page_mode = doc.xref_get_key(doc.pdf_catalog(), "PageMode")
+    pages = entity_pages(sensitive_data, page_offsets, page_count)
+    slices = page_slices(page_count, workers)
+    logging.info(f"Redacting {page_count} pages with {len(slices)} processes")
+
+    work_dir = os.path.dirname(os.path.abspath(output_pdf))
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        parts = [os.path.join(tmp, f"part{i:04d}.pdf") for i in range(len(slices))]
+        pool = page_pool()
+        futures = [
+            pool.submit(
+                redact_page_slice,
+                input_pdf,
+                part,
+                start,
+                end,
+                sensitive_data,
+                level,
+                mode,
+                images,
+                pages,
+            )
+            for part, (start, end) in zip(parts, slices)
+        ]
+        try:
+            for future in futures:
+                future.result()
+        except BrokenProcessPool:
+            # A worker died; the next document gets a fresh pool.
+            _discard_pool(pool)
+            raise
+
+        merged = fitz.open()
+        for part in parts:
+            with fitz.open(part) as src:
+                merged.insert_pdf(src)
+        merged.set_metadata(metadata)
+        merged.set_toc(toc)
+        if page_labels:
+            merged.set_page_labels(page_labels)
+        if page_mode[0] == "name":
+            merged.xref_set_key(merged.pdf_catalog(), "PageMode", page_mode[1])
+        save_redacted_pdf(merged, output_pdf, save_profile)
+
+
+@stage("redact_pdf_streaming")
+def redact_pdf_streaming(
+    input_pdf,
+    sensitive_data,
+    output_pdf,
+    level,
+    mode,
+    images,
+    page_offsets=None,
+    memory_budget_mb=STREAM_MEMORY_BUDGET_MB,
+    window_pages=STREAM_WINDOW_PAGES,
+):
+    """Redact input_pdf a window of pages at a time.
+
+    Each window is written to output_pdf as an incremental update, so only
+    one window is in memory at any time. After every window the caches are
+    released and the current RSS is compared with the RSS when the job
+    started: past half of the budget the window is halved, under a quarter
+    it grows back towards window_pages. A window that takes the growth past
+    the whole budget is dropped and redone at half the size; a MemoryError
+    is raised if even a single page does not fit. There is no final
+    garbage-collecting rewrite, because that would load every page.
+    Returns the job's memory report.
+    """
+    started = time.perf_counter()
+    baseline = rss_bytes()
+    peak = baseline
+    budget = memory_budget_mb * 1024 * 1024
+    max_window = window_pages
+    matcher = EntityMatcher(sensitive_data)
+    with fitz.open(input_pdf) as doc:
+        page_count = doc.page_count
+    pages = entity_pages(sensitive_data, page_offsets, page_count)
+
+    def release():
+        fitz.TOOLS.store_shrink(100)
+        gc.collect()
+        return rss_bytes() - baseline
+
+    windows = 0
+    retries = 0
+    start = 0
+    work_dir = os.path.dirname(os.path.abspath(output_pdf))
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        part_pdf = os.path.join(tmp, "window.pdf")
+        while start < page_count:
+            end = min(start + window_pages, page_count)
+            window = fitz.open(input_pdf)
+            window.select(list(range(start, end)))
+            redact_pages(window, matcher, pages, level, mode, images, first_page=start)
+            current = rss_bytes()
+            peak = max(peak, current)
+            if current - baseline > budget:
+                window.close()
+                release()
+                if window_pages == 1:
+                    raise MemoryError(
+                        f"Page {start + 1} of {input_pdf} needs more than the "
+                        f"{memory_budget_mb} MB streaming budget"
+                    )
+                window_pages = max(1, window_pages // 2)
+                retries += 1
+                logging.info(
+                    f"Streaming redaction window over budget, retrying with "
+                    f"{window_pages} pages"
+                )
+                continue
+            window.save(part_pdf, garbage=1, deflate=True)
+            window.close()
+
+            if start == 0:
+                os.replace(part_pdf, output_pdf)
+            else:
+                out = fitz.open(output_pdf)
+                with fitz.open(part_pdf) as part:
+                    out.insert_pdf(part)
+                out.saveIncr()
+                out.close()
+
+            growth = release()
+            peak = max(peak, baseline + growth)
+            windows += 1
+            start = end
+            if growth > budget // 2 and window_pages > 1:
+                window_pages = max(1, window_pages // 2)
+                logging.info(f"Streaming redaction window reduced to {window_pages}")
+            elif growth < budget // 4 and window_pages < max_window:
+                window_pages = min(max_window, window_pages * 2)
+
+    report = {
+        "pages": page_count,
+        "windows": windows,
+        "retried_windows": retries,
+        "window_pages": window_pages,
+        "budget_mb": memory_budget_mb,
+        "baseline_rss_mb": round(baseline / 1024 / 1024, 1),
+        "peak_rss_mb": round(peak / 1024 / 1024, 1),
+        "peak_growth_mb": round((peak - baseline) / 1024 / 1024, 1),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logging.info(f"Streaming redaction of {input_pdf}: {report}")
+    return report
+
+
+def redact_document(
+    input_pdf,
+    sensitive_data,
+    output_pdf,
+    level,
+    mode,
+    images,
+    workers=None,
+    save_profile=None,
+):
+    """Redact input_pdf, a path or the PDF's bytes, into output_pdf.
+
+    Very long documents are streamed under a memory budget, long ones are
+    split across processes unless they have form fields or named
+    destinations, which merging would drop, and the rest are redacted in
+    place. Streamed
+    output is written window by window, so save_profile does not apply to
+    it. With output_pdf None the redacted PDF is returned as bytes;
+    otherwise the memory report of a streamed job, or None, is returned.
+    """
+    pdf_doc = open_pdf(input_pdf)
+    page_offsets = load_page_offsets(input_pdf)
+    page_count = pdf_doc.page_count
+    workers = min(PARALLEL_WORKERS if workers is None else workers, page_count)
+    stream = page_count >= STREAM_MIN_PAGES
+    parallel = (
+        workers > 1
+        and page_count >= PARALLEL_MIN_PAGES
+        and not merge_loses_structure(pdf_doc)
+    )
+    if stream or parallel:
+        pdf_doc.close()
+        if not isinstance(input_pdf, str) or output_pdf is None:
+            # The pool and the windows work on files; spill to disk.
+            return _redact_document_on_disk(
+                input_pdf,
+                sensitive_data,
+                output_pdf,
+                level,
+                mode,
+                images,
+                workers,
+                save_profile,
+            )
+        inc("veilx_pages_total", page_count, stage="redact")
+        if stream:
+            return redact_pdf_streaming(
+                input_pdf, sensitive_data, output_pdf, level, mode, images, page_offsets
+            )
+        redact_pdf_parallel(
+            input_pdf,
+            sensitive_data,
+            output_pdf,
+            level,
+            mode,
+            images,
+            workers,
+            page_offsets,
+            save_profile,
+        )
+        return
+    inc("veilx_pages_total", page_count, stage="redact")
+    redact_pdf_pages(pdf_doc, sensitive_data, level, mode, images, page_offsets)
+    return save_redacted_pdf(pdf_doc, output_pdf, save_profile)
+
+
+def _redact_document_on_disk(
+    input_pdf, sensitive_data, output_pdf, level, mode, images, workers, save_profile
+):
+    with tempfile.TemporaryDirectory() as tmp:
+        if not isinstance(input_pdf, str):
+            path = os.path.join(tmp, "input.pdf")
+            with open(path, "wb") as f:
+                f.write(input_pdf)
+            input_pdf = path
+        path = output_pdf or os.path.join(tmp, "redacted.pdf")
+        report = redact_document(
+            input_pdf,
+            sensitive_data,
+            path,
+            level,
+            mode,
+            images,
+            workers,
+            save_profile,
+        )
+        if output_pdf is not None:
+            return report
+        with open(path, "rb") as f:
+            return f.read()
+
+
+@stage("get_custom_sensitive_data")
 def get_custom_sensitive_data(text, user_prompt):
     prompt = (
         "You are an advanced, highly adaptable text analysis tool. "
@@ -407,51 +983,32 @@ def get_custom_sensitive_data(text, user_prompt):
         f"Text to analyze:\n{text}"
     )
     # print("Prompt: ", prompt)
-    try:
-        gemini_response = get_gemini_response(prompt)
-        if gemini_response:
-            print(gemini_response)
-            try:
-                entities = extract_json(gemini_response)
-            except Exception:
-                logging.error("Error: Unable to parse JSON response from Gemini API")
+    key = detection_key(f"custom:{PROMPT_VERSION}", user_prompt, LLM_CHAIN, text)
+    entities = detection_cache.get(key)
+    if entities is None:
+        try:
+            gemini_response = get_gemini_response(prompt)
+            if gemini_response:
+                print(gemini_response)
+                try:
+                    entities = extract_json(gemini_response)
+                except Exception:
+                    logging.error(
+                        "Error: Unable to parse JSON response from Gemini API"
+                    )
+                    return []
+            else:
+                logging.error("Error: No response from Gemini API")
                 return []
-        else:
-            logging.error("Error: No response from Gemini API")
+        except Exception as e:
+            logging.error(f"Error in Gemini API call: {e}")
             return []
-    except Exception as e:
-        logging.error(f"Error in Gemini API call: {e}")
-        return []
-
-    sensitive_data = []
-    for entity in entities:
-        item_text = entity["text"]
-        if len(item_text) <= 1:
-            logging.warning(f"Skipping single character: {item_text}")
-            continue
-        if item_text.lower() in [
-            "the",
-            "a",
-            "an",
-            "and",
-            "or",
-            "but",
-            "in",
-            "on",
-            "at",
-            "to",
-            "for",
-        ]:
-            logging.warning(f"Skipping common word: {item_text}")
-            continue
-        start = 0
-        while True:
-            start = text.find(item_text, start)
-            if start == -1:
-                break
-            end = start + len(item_text)
-            sensitive_data.append((item_text, start, end, entity["type"]))
-            start = end
+        if entities is None:
+            return []
+        detection_cache.put(key, entities)
+
+    sensitive_data = locate_entities(text, entities)
+    inc("veilx_entities_total", len(sensitive_data))
 
     for data in sensitive_data:
         logging.debug(f"Identified sensitive data: {data}")
@@ -460,36 +1017,54 @@ def get_custom_sensitive_data(text, user_prompt):
 
 
 def get_sensitive(input_pdf, level):
-    text, pdf_doc = extract_text_from_pdf(input_pdf)
-    sensitive_data = find_sensitive_data(text, level)
+    text, page_offsets, pdf_doc = extract_pages_from_pdf(input_pdf)
+    pdf_doc.close()
+    save_page_offsets(input_pdf, page_offsets)
+    sensitive_data = find_sensitive_data_chunked(text, level, page_offsets[1:])
     return sensitive_data
 
 
 def get_sensitive_custom(input_pdf, prompt):
-    text, pdf_doc = extract_text_from_pdf(input_pdf)
+    text, page_offsets, pdf_doc = extract_pages_from_pdf(input_pdf)
+    pdf_doc.close()
+    save_page_offsets(input_pdf, page_offsets)
     sensitive_data = get_custom_sensitive_data(text, prompt)
     return sensitive_data
 
 
-def custom_redactv2(input_pdf, sensitive_data, output_pdf, image, mode):
-    text, pdf_doc = extract_text_from_pdf(input_pdf)
+def custom_redactv2(
+    input_pdf, sensitive_data, output_pdf, image, mode, save_profile=None
+):
     level = 4 if image else 1
-    custom_redact_text(pdf_doc, sensitive_data, level, mode)
-    if image:
-        redact_images_in_pdf(pdf_doc, mode)
-    save_redacted_pdf(pdf_doc, output_pdf)
-    logging.info(f"Redacted PDF saved as {output_pdf}")
-
-
-def redactv2(input_pdf, sensitive_data, output_pdf, level, mode):
-    text, pdf_doc = extract_text_from_pdf(input_pdf)
-    redact_text_in_pdf(pdf_doc, sensitive_data, level, mode)
-    if level > 1:
-        redact_images_in_pdf(pdf_doc, mode)
-    save_redacted_pdf(pdf_doc, output_pdf)
-    logging.info(f"Redacted PDF saved as {output_pdf}")
+    data = redact_document(
+        input_pdf,
+        sensitive_data,
+        output_pdf,
+        level,
+        mode,
+        images=image,
+        save_profile=save_profile,
+    )
+    logging.info(f"Redacted PDF saved as {output_pdf or 'bytes'}")
+    return data if output_pdf is None else None
+
+
+def redactv2(input_pdf, sensitive_data, output_pdf, level, mode, save_profile=None):
+    """Redact a PDF path or bytes; returns the bytes when output_pdf is None."""
+    data = redact_document(
+        input_pdf,
+        sensitive_data,
+        output_pdf,
+        level,
+        mode,
+        images=level > 1,
+        save_profile=save_profile,
+    )
+    logging.info(f"Redacted PDF saved as {output_pdf or 'bytes'}")
+    return data if output_pdf is None else None
 
 
+@stage("get_cat")
 def get_cat(input_pdf):
     text, pdf_doc = extract_text_from_pdf(input_pdf)
     prompt = (
@@ -513,10 +1088,18 @@ def get_cat(input_pdf):
         f"Text to analyze:\n{text}"
     )
 
+    key = detection_key(f"category:{PROMPT_VERSION}", "", LLM_CHAIN, text)
+    cached = detection_cache.get(key)
+    if cached is not None:
+        return cached["category"]
+
     response = get_gemini_response(prompt)
     try:
         response_json = extract_json(response)
-        category = response_json[0]["category"]
+        if isinstance(response_json, list):
+            response_json = response_json[0]
+        category = response_json["category"]
+        detection_cache.put(key, {"category": category})
     except Exception:
         logging.error("Error: Unable to parse JSON response from Gemini API")
         category = "Other Document"
@@ -524,17 +1107,17 @@ def get_cat(input_pdf):
     return category
 
 
-def annotate_sensitive_data_in_pdf(pdf_doc, sensitive_data):
+@stage("annotate_sensitive_data_in_pdf")
+def annotate_sensitive_data_in_pdf(pdf_doc, sensitive_data, page_offsets=None):
+    matcher = EntityMatcher(sensitive_data)
+    pages = entity_pages(sensitive_data, page_offsets, pdf_doc.page_count)
     for page_num in range(pdf_doc.page_count):
+        if pages is not None and page_num not in pages:
+            continue
         page = pdf_doc[page_num]
-        page_text = page.get_text()
 
-        for entity in sensitive_data:
-            entity_text = entity[0]
-            entity_type = entity[3]
-
-            instances = page.search_for(entity_text)
-            for inst in instances:
+        for entity_text, entity_type, quads in matcher.page_matches(page):
+            for inst in quads:
                 logging.info(
                     f"Annotating '{entity_text}' as {entity_type} on page {page_num + 1}"
                 )
@@ -547,16 +1130,25 @@ def annotate_sensitive_data_in_pdf(pdf_doc, sensitive_data):
                 )
 
 
-def save_annotated_pdf(pdf_doc, output_path):
-    pdf_doc.save(output_path, garbage=4, deflate=True, clean=True)
+@stage("save_annotated_pdf")
+def save_annotated_pdf(pdf_doc, output_path, profile=None):
+    options = save_options(profile or ANNOTATED_SAVE_PROFILE)
+    if output_path is None:
+        data = pdf_doc.tobytes(**options)
+        pdf_doc.close()
+        return data
+    pdf_doc.save(output_path, **options)
     pdf_doc.close()
 
 
-def annotate_pdf(input_pdf, sensitive_data, output_pdf):
-    text, pdf_doc = extract_text_from_pdf(input_pdf)
-    annotate_sensitive_data_in_pdf(pdf_doc, sensitive_data)
-    save_annotated_pdf(pdf_doc, output_pdf)
-    logging.info(f"Annotated PDF saved as {output_pdf}")
+def annotate_pdf(input_pdf, sensitive_data, output_pdf, save_profile=None):
+    pdf_doc = open_pdf(input_pdf)
+    page_offsets = load_page_offsets(input_pdf)
+    inc("veilx_pages_total", pdf_doc.page_count, stage="annotate")
+    annotate_sensitive_data_in_pdf(pdf_doc, sensitive_data, page_offsets)
+    data = save_annotated_pdf(pdf_doc, output_pdf, save_profile)
+    logging.info(f"Annotated PDF saved as {output_pdf or 'bytes'}")
+    return data
 
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+"""Production server: pre-fork gunicorn with the models loaded once.
+
+The parent imports the redaction engines and loads SERVER_PRELOAD_MODELS
+before gunicorn forks its workers, so the HTTP workers share those pages
+copy-on-write instead of each loading its own PaddleOCR, YOLO and Torch.
+gc.freeze() keeps the cyclic collector from writing to the shared objects.
+The job workers run under a supervisor process spawned when gunicorn
+starts (jobs.supervise), which loads JOB_PRELOAD_MODELS once for them.
+HTTP workers are recycled after SERVER_MAX_REQUESTS requests (plus
+jitter), job workers after JOB_MAX_JOBS.
+Every process writes its metrics to SERVER_METRICS_DIR, emptied at start,
+for /metrics to add up.
+
+Run from ai_engine/:  python serve.py --workers 4 --bind 0.0.0.0:5000
+"""
+import argparse
+import gc
+import importlib
+import logging
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from models import preload, rss_bytes
+
+
+SERVER_BIND = os.getenv("SERVER_BIND", "0.0.0.0:5000")
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", "1"))
+SERVER_TIMEOUT = int(os.getenv("SERVER_TIMEOUT", "300"))
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", "500"))
+SERVER_MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", "50"))
+SERVER_PRELOAD_MODELS = os.getenv("SERVER_PRELOAD_MODELS", "yolov8n.pt,paddleocr")
+SERVER_METRICS_DIR = os.getenv("SERVER_METRICS_DIR", "cache/metrics")
+SERVER_PRELOAD_MODULES = os.getenv(
+    "SERVER_PRELOAD_MODULES", "redactv2,img_redactv4,batch"
+)
+
+
+def load_app(modules=SERVER_PRELOAD_MODULES, models=SERVER_PRELOAD_MODELS):
+    """Import the engines, load the models and return the Flask app."""
+    for name in modules.split(","):
+        if name.strip():
+            importlib.import_module(name.strip())
+    preload(models.split(","))
+    gc.collect()
+    gc.freeze()
+
+    from app import app
+
+    gc.freeze()
+    logging.info(
+        f"Preloaded {modules} and {models}: {rss_bytes() / (1024 * 1024):.0f} MB RSS "
+        "to share with the workers"
+    )
+    return app
+
+
+class PreforkServer(BaseApplication):
+    def __init__(self, options, modules, models):
+        self.options = options
+        self.modules = modules
+        self.models = models
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return load_app(self.modules, self.models)
+
+
+_supervisor = None
+
+
+def start_job_workers(server):
+    """on_starting hook: run the job workers under their own supervisor
+    process rather than in the master, which forks the HTTP workers."""
+    from jobs import start_supervisor
+
+    global _supervisor
+    _supervisor = start_supervisor()
+
+
+def stop_job_workers(server):
+    """on_exit hook."""
+    from jobs import stop_supervisor
+
+    stop_supervisor(_supervisor)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bind", default=SERVER_BIND)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS)
+    parser.add_argument("--timeout", type=int, default=SERVER_TIMEOUT)
+    parser.add_argument("--max-requests", type=int, default=SERVER_MAX_REQUESTS)
+    parser.add_argument(
+        "--max-requests-jitter", type=int, default=SERVER_MAX_REQUESTS_JITTER
+    )
+    parser.add_argument("--preload-modules", default=SERVER_PRELOAD_MODULES)
+    parser.add_argument("--preload-models", default=SERVER_PRELOAD_MODELS)
+    parser.add_argument("--metrics-dir", default=SERVER_METRICS_DIR)
+    args = parser.parse_args()
+
+    # metrics reads METRICS_DIR when it is first imported, here.
+    os.environ["METRICS_DIR"] = args.metrics_dir
+    import metrics
+
+    metrics.clear_dir()
+
+    options = {
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        "timeout": args.timeout,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests_jitter,
+        # load() runs once in the master, before any worker is forked.
+        "preload_app": True,
+        "on_starting": start_job_workers,
+        "on_exit": stop_job_workers,
+    }
+    PreforkServer(options, args.preload_modules, args.preload_models).run()
+
+
+if __name__ == "__main__":
+    main()
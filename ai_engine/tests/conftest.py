@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The modules are imported from ai_engine/, as the app and benchmarks do.
+AI_ENGINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AI_ENGINE)
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "slow: takes minutes; deselect with -m 'not slow'"
+    )
@@ -0,0 +1,22 @@
+import pytest
+
+from artifact_cache import _describe
+
+
+def test_describe_tells_containers_apart():
+    assert _describe([(0, 0, 10, 10)]) != _describe([(0, 0, 10, 20)])
+    assert _describe({"mode": "black"}) != _describe({"mode": "blur"})
+    assert _describe({"a": 1, "b": 2}) == _describe({"b": 2, "a": 1})
+
+
+def test_describe_keys_models_by_weights():
+    class Model:
+        def __init__(self, ckpt_path):
+            self.ckpt_path = ckpt_path
+
+    assert _describe(Model("yolov8n.pt")) != _describe(Model("yolov8s.pt"))
+
+
+def test_describe_rejects_values_it_cannot_key():
+    with pytest.raises(TypeError):
+        _describe(object())
@@ -0,0 +1,58 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("fitz")
+datastructures = pytest.importorskip("werkzeug.datastructures")
+
+import batch  # noqa: E402
+
+
+def _zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buf.getvalue()
+
+
+def _upload(filename, data):
+    return datastructures.FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def _store(upload):
+    return (upload.filename, upload.stream.read())
+
+
+def test_corrupt_zip_is_an_error_entry():
+    data = _zip({"a.pdf": b"%PDF-1.7 a"})
+    workspaces, errors = batch.store_uploads(
+        [_upload("bad.zip", data[:20]), _upload("b.pdf", b"%PDF-1.7 b")], _store
+    )
+
+    assert workspaces == [("b.pdf", b"%PDF-1.7 b")]
+    assert [error["file"] for error in errors] == ["bad.zip"]
+    json.dumps(errors)
+
+
+def test_corrupt_member_does_not_stop_the_archive():
+    data = bytearray(_zip({"a.pdf": b"a" * 4096, "b.pdf": b"%PDF-1.7 b"}))
+    # Flip a byte of a.pdf's compressed data, so reading it fails its CRC
+    # or inflate while b.pdf can still be read.
+    offset = 30 + len("a.pdf") + 1
+    data[offset] ^= 0xFF
+    workspaces, errors = batch.store_uploads([_upload("docs.zip", bytes(data))], _store)
+
+    assert workspaces == [("b.pdf", b"%PDF-1.7 b")]
+    assert [error["file"] for error in errors] == ["docs.zip/a.pdf"]
+
+
+def test_document_limit_still_rejects_the_request(monkeypatch):
+    monkeypatch.setattr(batch, "BATCH_MAX_DOCUMENTS", 1)
+    data = _zip({"a.pdf": b"a", "b.pdf": b"b"})
+
+    with pytest.raises(ValueError):
+        batch.store_uploads([_upload("docs.zip", data)], _store)
@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip("fitz")
+
+import redactv2  # noqa: E402
+
+# Candidates the rules cannot settle: both checksums fail.
+TEXT = "id 2341 2341 2345, card 4111 1111 1111 1112, PAN ABCPE1234F"
+CANDIDATES = {"2341 2341 2345", "4111 1111 1111 1112"}
+
+
+def _texts(sensitive_data):
+    return {text for text, _, _, _ in sensitive_data}
+
+
+def test_empty_llm_answer_redacts_no_candidates(monkeypatch):
+    monkeypatch.setattr(redactv2, "detect_entities", lambda text, level: [])
+    texts = _texts(redactv2.find_sensitive_data_rules(TEXT, 1))
+    assert "ABCPE1234F" in texts
+    assert not texts & CANDIDATES
+
+
+def test_failed_llm_call_redacts_every_candidate(monkeypatch):
+    monkeypatch.setattr(redactv2, "detect_entities", lambda text, level: None)
+    texts = _texts(redactv2.find_sensitive_data_rules(TEXT, 1))
+    assert CANDIDATES <= texts
+
+
+def test_llm_answer_picks_candidates(monkeypatch):
+    monkeypatch.setattr(
+        redactv2,
+        "detect_entities",
+        lambda text, level: [{"type": "Card Number", "text": "4111 1111 1111 1112"}],
+    )
+    texts = _texts(redactv2.find_sensitive_data_rules(TEXT, 1))
+    assert "4111 1111 1111 1112" in texts
+    assert "2341 2341 2345" not in texts
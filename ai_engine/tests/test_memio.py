@@ -0,0 +1,25 @@
+import pytest
+
+pytest.importorskip("flask")
+
+from memio import UnsupportedImageFormat, encode_image, image_extension  # noqa: E402
+
+
+def test_image_extension_comes_from_the_upload():
+    assert image_extension("scan.JPG") == ".jpg"
+    assert image_extension("photo.webp") == ".webp"
+
+
+@pytest.mark.parametrize("filename", ["notes.txt", "scan", "", None])
+def test_image_extension_rejects_what_cv2_cannot_write(filename):
+    with pytest.raises(UnsupportedImageFormat):
+        image_extension(filename)
+
+
+def test_encode_image_checks_the_encoder():
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    assert encode_image(image, ".png").startswith(b"\x89PNG")
+    with pytest.raises(UnsupportedImageFormat):
+        encode_image(image, ".gif")
@@ -0,0 +1,53 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+import redactv2  # noqa: E402
+from benchmarks.bench_pdf_matcher import make_document  # noqa: E402
+
+PAGES = 80
+
+
+def _write_document(path, features):
+    doc, sensitive_data = make_document(PAGES, 20)
+    doc.set_toc([[1, "Start", 1], [1, "Middle", 40], [2, "Late", 70]])
+    doc.set_page_labels([{"startpage": 0, "prefix": "A-", "style": "D"}])
+    if "embedded_file" in features:
+        doc.embfile_add("notes.txt", b"notes")
+    if "internal_link" in features:
+        doc[0].insert_link(
+            {"kind": fitz.LINK_GOTO, "from": fitz.Rect(36, 36, 100, 50), "page": 70}
+        )
+    doc.save(path)
+    doc.close()
+    return sensitive_data
+
+
+def _structure(path):
+    with fitz.open(path) as doc:
+        return {
+            "pages": doc.page_count,
+            "toc": doc.get_toc(),
+            "page_labels": doc.get_page_labels(),
+            "embedded_files": doc.embfile_names(),
+            "links": [
+                (link["kind"], link.get("page")) for link in doc[0].get_links()
+            ],
+        }
+
+
+@pytest.mark.parametrize("features", [(), ("embedded_file",), ("internal_link",)])
+def test_parallel_output_keeps_the_in_place_structure(tmp_path, features):
+    input_pdf = str(tmp_path / "input.pdf")
+    sensitive_data = _write_document(input_pdf, features)
+    with fitz.open(input_pdf) as doc:
+        assert redactv2.merge_loses_structure(doc) == bool(features)
+
+    outputs = {}
+    for workers in (1, 2):
+        output_pdf = str(tmp_path / f"output{workers}.pdf")
+        redactv2.redact_document(
+            input_pdf, sensitive_data, output_pdf, 1, "black", False, workers
+        )
+        outputs[workers] = _structure(output_pdf)
+    assert outputs[2] == outputs[1]
@@ -0,0 +1,74 @@
+from pii_rules import candidate_context, luhn_valid, scan_pii, verhoeff_valid
+
+
+def test_verhoeff_valid():
+    # 236 has Verhoeff check digit 3.
+    assert verhoeff_valid("2363")
+    assert verhoeff_valid("234123412346")
+    assert not verhoeff_valid("2364")
+    assert not verhoeff_valid("234123412345")
+
+
+def test_verhoeff_catches_adjacent_transposition():
+    assert not verhoeff_valid("234123412364")
+
+
+def test_luhn_valid():
+    assert luhn_valid("4111111111111111")
+    assert luhn_valid("79927398713")
+    assert not luhn_valid("4111111111111112")
+    assert not luhn_valid("79927398710")
+
+
+def _types(items):
+    return {(text, data_type) for text, _, _, data_type in items}
+
+
+def test_scan_pii_confident_matches():
+    text = (
+        "Aadhaar 2341 2341 2346, card 4111 1111 1111 1111, mail a.b@example.com, "
+        "phone +91 98765 43210, PAN ABCPE1234F, passport K1234567, "
+        "IFSC HDFC0001234, vehicle MH 12 AB 1234."
+    )
+    found, uncertain = scan_pii(text)
+    assert _types(found) == {
+        ("2341 2341 2346", "Aadhaar Number"),
+        ("4111 1111 1111 1111", "Card Number"),
+        ("a.b@example.com", "Email Address"),
+        ("+91 98765 43210", "Phone Number"),
+        ("ABCPE1234F", "PAN Number"),
+        ("K1234567", "Passport Number"),
+        ("HDFC0001234", "IFSC Code"),
+        ("MH 12 AB 1234", "Vehicle Registration Number"),
+    }
+    assert uncertain == []
+    for value, start, end, _ in found:
+        assert text[start:end] == value
+
+
+def test_scan_pii_unsettled_candidates_are_uncertain():
+    text = (
+        "id 2341 2341 2345, card 4111 1111 1111 1112, code K1234567, "
+        "DL No: 12ABC345"
+    )
+    found, uncertain = scan_pii(text)
+    assert found == []
+    assert _types(uncertain) == {
+        ("2341 2341 2345", "Aadhaar Number"),
+        ("4111 1111 1111 1112", "Card Number"),
+        ("K1234567", "Passport Number"),
+        ("12ABC345", "Potential Identifier"),
+    }
+
+
+def test_scan_pii_ignores_plain_text():
+    assert scan_pii("The meeting is on Monday at 10 in room 4.") == ([], [])
+
+
+def test_candidate_context_merges_nearby_candidates():
+    text = "x " * 100 + "K1234567 and K7654321" + " y" * 100
+    _, uncertain = scan_pii(text)
+    context = candidate_context(text, uncertain, radius=10)
+    assert "\n...\n" not in context
+    assert "K1234567" in context and "K7654321" in context
+    assert len(context) < len(text)
@@ -0,0 +1,37 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+AI_ENGINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.slow
+def test_streaming_redaction_stays_within_budget(tmp_path):
+    pytest.importorskip("fitz")
+    report_file = tmp_path / "report.json"
+    # A fresh process, so the peak RSS is the job's own.
+    child = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.bench_streaming_redact",
+            "--pages",
+            "2000",
+            "--budget-mb",
+            "256",
+            "--json",
+            str(report_file),
+        ],
+        cwd=AI_ENGINE,
+        capture_output=True,
+        text=True,
+    )
+    assert child.returncode == 0, child.stdout + child.stderr
+    report = json.loads(report_file.read_text())
+    assert report["within_budget"]
+    assert report["ru_maxrss_growth_mb"] <= 256
+    # The window shrinks under pressure but must not stay at one page.
+    assert report["window_pages"] > 1
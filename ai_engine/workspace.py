@@ -0,0 +1,238 @@
+"""Per-job working directories under temp/.
+
+Every upload gets its own directory named ``<upload hash>-<job id>``, so two
+users sending ``scan.pdf`` at the same time never share a file. The ``doc``
+token handed to clients is ``<job dir>/<filename>`` and is echoed back by the
+redact routes. Files are written atomically, a workspace is deleted when the
+last request holding it finishes after it was marked done, and anything left
+behind is garbage-collected once it has been idle for WORKSPACE_TTL seconds.
+
+Holds are marker files in the workspace's .holds directory, one per
+acquire and named after the holding process, so a collection in one worker
+sees the workspaces every other process (HTTP or job worker) is using;
+markers of processes that have exited do not count. Workspaces of queued
+and running jobs are kept too, through the check jobs.py registers with
+keep_while().
+"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+from werkzeug.utils import secure_filename
+
+
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT", "temp")
+WORKSPACE_TTL = int(os.getenv("WORKSPACE_TTL", "3600"))
+WORKSPACE_GC_INTERVAL = int(os.getenv("WORKSPACE_GC_INTERVAL", "300"))
+
+_JOB_DIR = re.compile(r"^[0-9a-f]{16}-[0-9a-f]{12}$")
+_CHUNK_BYTES = 1024 * 1024
+
+_HOLDS = ".holds"
+_DONE = ".done"
+
+_keep_checks = []
+_last_gc = 0.0
+
+
+class WorkspaceNotFound(LookupError):
+    pass
+
+
+def _temp_name(path):
+    directory, name = os.path.split(path)
+    # Keep the extension last; cv2.imwrite picks the encoder from it.
+    return os.path.join(directory, f".{uuid.uuid4().hex}.{name}")
+
+
+@contextmanager
+def atomic_path(path):
+    """Yield a temporary path next to ``path`` and move it into place on success."""
+    tmp = _temp_name(path)
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+class Workspace:
+    def __init__(self, name, filename):
+        self.name = name
+        self.filename = filename
+        self.path = os.path.join(WORKSPACE_ROOT, name)
+        self._holds = []
+
+    @property
+    def doc(self):
+        """Token the client echoes back to address this upload."""
+        return f"{self.name}/{self.filename}"
+
+    @property
+    def input_path(self):
+        return self.file("")
+
+    def file(self, prefix):
+        """Path of ``<prefix><filename>`` inside the workspace."""
+        return os.path.join(self.path, f"{prefix}{self.filename}")
+
+    def touch(self):
+        try:
+            os.utime(self.path)
+        except OSError:
+            pass
+
+    def acquire(self):
+        holds = os.path.join(self.path, _HOLDS)
+        os.makedirs(holds, exist_ok=True)
+        hold = os.path.join(holds, f"{os.getpid()}-{uuid.uuid4().hex}")
+        open(hold, "w").close()
+        self._holds.append(hold)
+        self.touch()
+        return self
+
+    def release(self, done=False):
+        """Drop a hold; a workspace marked done is removed with its last one."""
+        if self._holds:
+            try:
+                os.unlink(self._holds.pop())
+            except OSError:
+                pass
+        try:
+            if done:
+                open(os.path.join(self.path, _DONE), "w").close()
+            remove = not _held(self.path) and os.path.exists(
+                os.path.join(self.path, _DONE)
+            )
+        except OSError:
+            # Already removed by the last holder in another process.
+            return
+        if remove:
+            shutil.rmtree(self.path, ignore_errors=True)
+        else:
+            self.touch()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _held(path):
+    """Whether a live process holds the workspace at ``path``."""
+    try:
+        holds = os.listdir(os.path.join(path, _HOLDS))
+    except FileNotFoundError:
+        return False
+    for hold in holds:
+        pid = hold.partition("-")[0]
+        if pid.isdigit() and _alive(int(pid)):
+            return True
+    return False
+
+
+def safe_filename(name):
+    """secure_filename, keeping the extension of names it would strip to
+    nothing, so "фото.jpg" becomes "upload.jpg" rather than "jpg"."""
+    stem, ext = os.path.splitext(name or "")
+    ext = secure_filename(ext)
+    stem = secure_filename(stem) or "upload"
+    return f"{stem}.{ext}" if ext else stem
+
+
+def keep_while(check):
+    """Never collect the workspaces named in ``check()``, an iterable of names."""
+    _keep_checks.append(check)
+
+
+def create_workspace(upload):
+    """Store a werkzeug upload in a new workspace and return it, acquired."""
+    collect_garbage_if_due()
+    filename = safe_filename(upload.filename)
+    os.makedirs(WORKSPACE_ROOT, exist_ok=True)
+    tmp = _temp_name(os.path.join(WORKSPACE_ROOT, filename))
+    digest = hashlib.sha256()
+    try:
+        with open(tmp, "wb") as f:
+            while True:
+                chunk = upload.stream.read(_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+        name = f"{digest.hexdigest()[:16]}-{uuid.uuid4().hex[:12]}"
+        workspace = Workspace(name, filename)
+        os.makedirs(workspace.path)
+        workspace.acquire()
+        os.replace(tmp, workspace.input_path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return workspace
+
+
+def open_workspace(doc):
+    """Look up the workspace for a client ``doc`` token and acquire it."""
+    name, _, filename = str(doc).partition("/")
+    if not _JOB_DIR.match(name) or not filename:
+        raise WorkspaceNotFound(doc)
+    if secure_filename(filename) != filename:
+        raise WorkspaceNotFound(doc)
+    workspace = Workspace(name, filename)
+    if not os.path.isdir(workspace.path):
+        raise WorkspaceNotFound(doc)
+    return workspace.acquire()
+
+
+def collect_garbage(ttl=WORKSPACE_TTL):
+    """Remove entries of WORKSPACE_ROOT that no live process holds, no job
+    needs and that have been idle for more than ttl."""
+    global _last_gc
+    _last_gc = time.time()
+    if not os.path.isdir(WORKSPACE_ROOT):
+        return 0
+    keep = set()
+    for check in _keep_checks:
+        try:
+            keep.update(check())
+        except Exception as e:
+            # Collecting without knowing what to keep could delete job inputs.
+            logging.error(f"Skipping workspace collection: {e}")
+            return 0
+    removed = 0
+    cutoff = time.time() - ttl
+    for entry in os.scandir(WORKSPACE_ROOT):
+        if entry.name in keep:
+            continue
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                continue
+            if entry.is_dir(follow_symlinks=False) and _held(entry.path):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+            removed += 1
+        except OSError as e:
+            logging.warning(f"Failed to delete {entry.path}: {e}")
+    if removed:
+        logging.info(f"Removed {removed} expired workspaces")
+    return removed
+
+
+def collect_garbage_if_due():
+    if time.time() - _last_gc >= WORKSPACE_GC_INTERVAL:
+        collect_garbage()
+